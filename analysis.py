@@ -0,0 +1,115 @@
+import history
+from deadline import Deadline
+from extractive import ExtractiveFilter
+from fetch_case_data_and_summarize import TRUNCATED_ANSWER, query_ai_model
+from pipeline import summarize_cases, format_case_summaries
+from resources import (get_ikapi, get_answer_cache, get_corpus, get_database, get_dedup_index,
+                       get_stage_pools, get_usage_ledger)
+from segments import DEFAULT_SECTIONS
+
+# Number of top search hits whose query excerpts are sent to the LLM
+EXCERPT_DOCS = 8
+
+# Seconds one Analyze may take end to end, and each stage's share of what is left when it starts;
+# the LLM gets whatever remains after summarization
+QUERY_BUDGET = 60
+SEARCH_SHARE = 0.2
+SUMMARIZE_SHARE = 0.65
+
+# A query this similar to one answered before is served without searching again
+QUERY_ONLY_SIMILARITY = 0.95
+
+
+# Background Analyze job: runs outside the Streamlit script, so reruns do not interrupt it
+def analysis_job(job, username, query, use_excerpts=False, budget=QUERY_BUDGET):
+    ikapi = get_ikapi()
+    deadline = Deadline(budget)
+    cache = get_answer_cache()
+
+    # The same question asked again: the earlier answer is served without paying for the search
+    # Only an answer made the same way (excerpts or summaries) is served
+    same_mode = lambda result: result.get('excerpts') == use_excerpts  # noqa: E731
+    cached = cache.get(query, threshold=QUERY_ONLY_SIMILARITY, accept=same_mode)
+    if cached:
+        result, similarity, matched_query = cached
+        job.note(f"Served from cache: answered earlier for '{matched_query}' "
+                 f"(similarity {similarity:.2f}).")
+        history.save_query(get_database(), username, query, result['docids'], result['cases'], result['answer'],
+                           use_excerpts)
+        return result['cases'], result['answer']
+
+    usage = get_usage_ledger().for_query(username, query)
+    exhausted = usage.ledger.exhausted(username, ('ik', 'groq') if use_excerpts else ('ik', 'hf', 'groq'))
+    if exhausted:
+        job.note(f"Your daily usage budget for {', '.join(exhausted)} is used up; try again tomorrow.")
+        return None
+
+    job.report(0.05, "Fetching related cases...")
+    # Excerpts need no summarization, so more documents fit in the same time
+    doc_ids = ikapi.fetch_all_docs(query, limit=EXCERPT_DOCS if use_excerpts else 2,
+                                   deadline=deadline.stage(SEARCH_SHARE), usage=usage)
+    if not doc_ids:
+        job.note("No related documents found for your query.")
+        return None
+
+    cached = cache.get(query, doc_ids, accept=same_mode)
+    if cached:
+        result, similarity, matched_query = cached
+        job.note(f"Served from cache: answered earlier for '{matched_query}' "
+                 f"from the same documents (similarity {similarity:.2f}).")
+        cases, insights = result['cases'], result['answer']
+    elif use_excerpts:
+        job.report(0.2, f"Found {len(doc_ids)} related documents. Fetching query excerpts...")
+        cases = ikapi.fetch_excerpts(doc_ids, query, deadline=deadline.stage(SUMMARIZE_SHARE), usage=usage)
+        for case in cases:
+            if 'error' in case:
+                job.note(case['error'])
+            elif 'skipped' in case:
+                job.note(f"Skipped document {case['docid']}: {case['skipped']}.")
+    else:
+        job.report(0.2, f"Found {len(doc_ids)} related documents. Processing summaries...")
+        cases = summarize_documents(doc_ids, job, deadline=deadline.stage(SUMMARIZE_SHARE), usage=usage)
+
+    if not cached:
+        job.report(0.8, "Generating insights from summaries...")
+        insights = query_ai_model(query, format_case_summaries(cases), deadline=deadline, usage=usage)
+        # Answers missing cases or cut short are shown, but not reused for other users
+        complete = not any('skipped' in case or case.get('partial') for case in cases) \
+            and not insights.endswith(TRUNCATED_ANSWER)
+        if not insights.startswith("Error") and complete:
+            cache.put(query, doc_ids, {'cases': cases, 'answer': insights, 'docids': doc_ids,
+                                       'excerpts': use_excerpts})
+
+    history.save_query(get_database(), username, query, doc_ids, cases, insights, use_excerpts)
+    return cases, insights
+
+
+def summarize_documents(doc_ids, job=None, on_warning=None, deadline=None, usage=None):
+    """
+    Summarizes `doc_ids`, reporting progress to `job` if given; without a
+    job, fetch errors go to `on_warning` (e.g. st.warning). Documents not
+    done by `deadline` come back marked `skipped`. Calls are recorded
+    against `usage` (a usage.QueryUsage), if given.
+    """
+    done = []
+
+    def report(case):
+        done.append(case)
+        if job:
+            if 'error' in case:
+                job.note(case['error'])
+            elif 'skipped' in case:
+                job.note(f"Skipped document {case['docid']}: {case['skipped']}.")
+            elif 'duplicate_of' in case:
+                job.note(f"Skipped '{case['title']}': near-duplicate of document {case['duplicate_of']}.")
+            job.report(0.2 + 0.6 * len(done) / len(doc_ids),
+                       f"Summarized {len(done)} of {len(doc_ids)} documents...")
+        elif 'error' in case and on_warning:
+            on_warning(case['error'])
+
+    cases = summarize_cases(get_ikapi(), doc_ids, on_case=report,
+                            prefilter=ExtractiveFilter(ratio=0.25), dedup=get_dedup_index(),
+                            sections=DEFAULT_SECTIONS, corpus=get_corpus(), pools=get_stage_pools(),
+                            cancel=job.cancel_event if job else None, deadline=deadline,
+                            usage=usage)
+    return cases
@@ -0,0 +1,175 @@
+import json
+import logging
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from db import expire_cached_results, get_recent_cached_results, put_cached_result
+
+logger = logging.getLogger('ikapi')
+
+STOPWORDS = {'a', 'an', 'the', 'of', 'in', 'on', 'for', 'to', 'and', 'or', 'with',
+             'about', 'related', 'regarding', 'case', 'cases', 'judgment', 'judgments'}
+
+
+# Words that flip what a legal query asks for; queries differing in these never share an answer
+OUTCOME_WORDS = {'not', 'no', 'without', 'non', 'never', 'granted', 'grant', 'rejected', 'reject',
+                 'refused', 'denied', 'allowed', 'dismissed', 'quashed', 'upheld', 'set', 'aside',
+                 'acquitted', 'acquittal', 'convicted', 'conviction', 'cancelled', 'cancellation',
+                 'valid', 'invalid', 'void', 'maintainable', 'before', 'after', 'against'}
+
+
+def normalize_query(query):
+    words = re.findall(r"\w+", query.lower())
+    return " ".join(w for w in words if w not in STOPWORDS) or " ".join(words)
+
+
+def query_signature(query):
+    """
+    The numbers (sections, rules, orders, years) and outcome words of a
+    query. These decide which legal question is asked, but barely move the
+    embedding: "bail under section 437" and "... 439" are 0.88 similar.
+    """
+    words = re.findall(r"\w+", query.lower())
+    return frozenset(w for w in words if w.isdigit() or w in OUTCOME_WORDS)
+
+
+def embed_query(query, dim=512):
+    """
+    Hashed bag of words and character trigrams, L2-normalized.
+
+    Cheap and dependency-free, and robust to small wording changes
+    ("road accident cases" vs "road accident compensation cases").
+    """
+    text = normalize_query(query)
+    vec = np.zeros(dim)
+    features = text.split() + [text[i:i + 3] for i in range(len(text) - 2)]
+    for f in features:
+        vec[zlib.crc32(f.encode('utf8')) % dim] += 1.0
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class CacheEntry:
+    __slots__ = ('query', 'signature', 'docids', 'value', 'created')
+
+    def __init__(self, query, docids, value, created=None):
+        self.query = query
+        self.signature = query_signature(query)
+        self.docids = frozenset(docids)
+        self.value = value
+        self.created = created or time.time()
+
+
+class AnswerCache:
+    """
+    Semantic cache of LLM answers keyed on a normalized query embedding plus
+    the set of docids the answer was generated from.
+
+    A lookup hits when a stored query is at least `threshold` cosine-similar,
+    has exactly the same numbers and outcome words (see query_signature)
+    and, if `docids` is given, was answered from the same documents. A
+    lookup without docids (before searching) should pass a stricter
+    `threshold`, since nothing confirms the documents still match. Entries
+    expire after `ttl` seconds; beyond `maxsize` the least recently used go.
+
+    With a `db` (db.Database), entries are also written to its
+    cached_results table and the unexpired ones are loaded back on start,
+    so answers survive restarts and are shared between app processes
+    started later.
+    """
+    def __init__(self, threshold=0.92, ttl=24 * 3600, maxsize=1000, embed=embed_query, db=None):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.embed = embed
+        self.db = db
+        self.entries = OrderedDict()
+        self.vectors = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if db is not None:
+            self._load()
+
+    @staticmethod
+    def _db_key(key):
+        query, docids = key
+        return json.dumps([query, sorted(docids)])
+
+    def _load(self):
+        cutoff = time.time() - self.ttl
+        try:
+            expire_cached_results(self.db, cutoff)
+            rows = get_recent_cached_results(self.db, cutoff, self.maxsize)
+        except Exception as e:
+            logger.error(f"Failed to load cached answers: {e}")
+            return
+        # Oldest first, so the newest end up most recently used
+        for _, value, created in reversed(rows):
+            stored = json.loads(value)
+            key = (normalize_query(stored['query']), frozenset(stored['docids']))
+            self.entries[key] = CacheEntry(stored['query'], stored['docids'], stored['value'], created)
+            self.vectors[key] = self.embed(stored['query'])
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for key in [k for k, e in self.entries.items() if e.created < cutoff]:
+            del self.entries[key]
+            del self.vectors[key]
+
+    def get(self, query, docids=None, threshold=None, accept=None):
+        """
+        Returns (value, similarity, matched query) for the best match or None.
+        `threshold` overrides the cache's own for this lookup. `accept`, if
+        given, is called with each candidate value, most similar first; a
+        candidate it rejects is passed over for the next one.
+        """
+        vec = self.embed(query)
+        signature = query_signature(query)
+        threshold = self.threshold if threshold is None else threshold
+        with self.lock:
+            self._expire()
+            keys = [k for k in self.entries if self.entries[k].signature == signature]
+            if docids is not None:
+                docids = frozenset(docids)
+                keys = [k for k in keys if self.entries[k].docids == docids]
+            if keys:
+                sims = np.stack([self.vectors[k] for k in keys]) @ vec
+                for i in np.argsort(-sims):
+                    if sims[i] < threshold:
+                        break
+                    entry = self.entries[keys[i]]
+                    if accept is None or accept(entry.value):
+                        self.entries.move_to_end(keys[i])
+                        self.hits += 1
+                        return entry.value, float(sims[i]), entry.query
+            self.misses += 1
+            return None
+
+    def put(self, query, docids, value):
+        key = (normalize_query(query), frozenset(docids))
+        entry = CacheEntry(query, docids, value)
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self.vectors[key] = self.embed(query)
+            while len(self.entries) > self.maxsize:
+                old, _ = self.entries.popitem(last=False)
+                del self.vectors[old]
+        if self.db is not None:
+            try:
+                put_cached_result(self.db, self._db_key(key),
+                                  json.dumps({'query': query, 'docids': list(docids), 'value': value}),
+                                  entry.created)
+            except Exception as e:
+                # The answer is still cached in memory
+                logger.error(f"Failed to store cached answer: {e}")
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,136 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+from corpus import SOURCE, get_summary_path
+from segments import DEFAULT_SECTIONS, SECTIONS, load_sections, select_sections
+from summarization_workflow import SUMMARIZER_BACKENDS, SUMMARIZER_MODEL
+
+logger = logging.getLogger('ikapi')
+
+# Words per summarizer call; distilbart reads at most 1024 tokens
+CHUNK_WORDS = 700
+
+_summarizer = None
+_sections = None
+
+
+def is_done(path):
+    summary_path = get_summary_path(path)
+    return os.path.exists(summary_path) and os.path.getmtime(summary_path) >= os.path.getmtime(path)
+
+
+def find_documents(datadirs, force=False):
+    """Paths of stored judgments under `datadirs` that have no up-to-date summary."""
+    paths = []
+    for datadir in datadirs:
+        for dirpath, _, filenames in os.walk(datadir):
+            for filename in filenames:
+                if SOURCE.match(filename):
+                    path = os.path.join(dirpath, filename)
+                    if force or not is_done(path):
+                        paths.append(path)
+    return sorted(paths)
+
+
+def _init_worker(backend, sections, threads):
+    """Runs once per worker process: the model is loaded here and reused for every document."""
+    global _summarizer, _sections
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from summarization_workflow import Summarizer
+    _summarizer = Summarizer(backend=backend)
+    _sections = sections
+
+
+def summarize_file(path):
+    """
+    Summarizes one stored judgment and writes its sidecar.
+
+    Returns:
+        tuple: (path, words summarized, seconds, error message or None)
+    """
+    start = time.perf_counter()
+    try:
+        title, html, offsets = load_sections(path)
+        text = select_sections(html, _sections or SECTIONS, offsets)
+        words = text.split()
+        summaries = [_summarizer.summarize(" ".join(words[i:i + CHUNK_WORDS]))
+                     for i in range(0, len(words), CHUNK_WORDS)]
+        if "Error in summarization." in summaries:
+            return path, len(words), time.perf_counter() - start, "summarizer error"
+
+        with open(get_summary_path(path), 'w', encoding='utf8') as f:
+            json.dump({'title': title, 'summary': " ".join(summaries),
+                       'model': SUMMARIZER_MODEL, 'backend': _summarizer.backend,
+                       'sections': list(_sections or ()), 'created_at': time.time()},
+                      f, ensure_ascii=False)
+        return path, len(words), time.perf_counter() - start, None
+    except (OSError, ValueError) as e:
+        return path, 0, time.perf_counter() - start, str(e)
+
+
+def summarize_corpus(paths, backend='pytorch', workers=None, sections=DEFAULT_SECTIONS,
+                     report_every=10):
+    """
+    Summarizes `paths` on a pool of worker processes, one model per worker.
+
+    Returns:
+        dict: Counts of done and failed documents, words and docs/sec.
+    """
+    workers = workers or os.cpu_count()
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    ctx = multiprocessing.get_context('spawn')
+    stats = {'done': 0, 'failed': 0, 'words': 0}
+
+    start = time.perf_counter()
+    with ctx.Pool(workers, initializer=_init_worker, initargs=(backend, sections, threads)) as pool:
+        for n, (path, nwords, seconds, error) in enumerate(
+                pool.imap_unordered(summarize_file, paths), start=1):
+            if error:
+                stats['failed'] += 1
+                logger.warning(f"Failed to summarize {path}: {error}")
+            else:
+                stats['done'] += 1
+                stats['words'] += nwords
+            if n % report_every == 0 or n == len(paths):
+                elapsed = time.perf_counter() - start
+                logger.info(f"{n}/{len(paths)} documents, {n / elapsed:.2f} docs/s, "
+                            f"{stats['failed']} failed")
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['docs_per_s'] = len(paths) / stats['seconds'] if paths else 0.0
+    return stats
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(description='Summarize stored judgments offline into .summary.json sidecars')
+    parser.add_argument('-d', '--datadirs', nargs='+', default=['results', 'Data'],
+                        help='storage directories to walk')
+    parser.add_argument('-b', '--backend', default='pytorch', choices=SUMMARIZER_BACKENDS,
+                        help='summarizer backend')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help='worker processes, each with its own model')
+    parser.add_argument('-s', '--sections', nargs='*', default=list(DEFAULT_SECTIONS),
+                        help='judgment sections to summarize; none for the whole text')
+    parser.add_argument('-n', '--limit', type=int, help='summarize at most this many documents')
+    parser.add_argument('-f', '--force', action='store_true', help='redo documents already summarized')
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_arg_parser().parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    paths = find_documents(args.datadirs, args.force)[:args.limit]
+    logger.info(f"{len(paths)} documents to summarize with {args.workers} workers")
+    if paths:
+        stats = summarize_corpus(paths, args.backend, args.workers, tuple(args.sections))
+        logger.info(f"Summarized {stats['done']} documents ({stats['failed']} failed) in "
+                    f"{stats['seconds']:.1f}s: {stats['docs_per_s']:.2f} docs/s")
@@ -0,0 +1,60 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+MODULES = ['config', 'pipeline', 'resources', 'fetch_case_data_and_summarize',
+           'summarization_workflow', 'ikapi', 'ikapi_new']
+HEAVY = ['streamlit', 'transformers', 'torch', 'groq', 'requests', 'numpy', 'pyarrow']
+
+PROBE = '''
+import sys, time, json
+t = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def time_import(module, repeat):
+    """Imports `module` in `repeat` fresh interpreters and returns the timings."""
+    timings = []
+    heavy = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY)],
+                             capture_output=True, text=True)
+        wall = time.perf_counter() - t
+        if out.returncode != 0:
+            return {'module': module, 'error': out.stderr.strip().splitlines()[-1]}
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        timings.append((result['seconds'], wall))
+        heavy = result['heavy']
+
+    return {
+        'module': module,
+        'import_ms': statistics.median(t[0] for t in timings) * 1000,
+        'process_ms': statistics.median(t[1] for t in timings) * 1000,
+        'heavy': heavy,
+    }
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(description='Measure cold-start import time of the app modules')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='fresh interpreters per module')
+    parser.add_argument('modules', nargs='*', default=MODULES, help='modules to import')
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_arg_parser().parse_args()
+
+    print(f"{'module':32} {'import ms':>10} {'process ms':>11}  heavy deps loaded")
+    for module in args.modules:
+        r = time_import(module, args.repeat)
+        if 'error' in r:
+            print(f"{module:32} failed: {r['error']}")
+            continue
+        print(f"{module:32} {r['import_ms']:10.1f} {r['process_ms']:11.1f}  {', '.join(r['heavy']) or '-'}")
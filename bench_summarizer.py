@@ -0,0 +1,158 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import re
+import resource
+import statistics
+import time
+from collections import Counter
+from queue import Empty
+
+from summarization_workflow import SUMMARIZER_BACKENDS, SUMMARY_ERROR
+
+# How long one backend may go without reporting before it is given up on
+BACKEND_TIMEOUT = 3600
+
+
+def load_fixtures(paths, limit, max_words=700):
+    """Reads stored judgments (results/*_summary_input.json or Data/**/*.json) as plain text."""
+    texts = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            obj = json.load(f)
+        html = obj.get('text') or obj.get('doc') or ''
+        text = re.sub(r"\s+", " ", re.sub(r"<[^>]+>", " ", html)).strip()
+        if text:
+            texts.append(" ".join(text.split()[:max_words]))
+        if len(texts) >= limit:
+            break
+    return texts
+
+
+def _ngrams(tokens, n):
+    return Counter(tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+
+
+def _lcs(a, b):
+    prev = [0] * (len(b) + 1)
+    for x in a:
+        cur = [0]
+        for j, y in enumerate(b):
+            cur.append(prev[j] + 1 if x == y else max(prev[j + 1], cur[j]))
+        prev = cur
+    return prev[-1]
+
+
+def _f1(overlap, candidate, reference):
+    if not overlap:
+        return 0.0
+    p, r = overlap / candidate, overlap / reference
+    return 2 * p * r / (p + r)
+
+
+def rouge(candidate, reference):
+    """ROUGE-1, ROUGE-2 and ROUGE-L F1 between two summaries."""
+    c = re.findall(r"\w+", candidate.lower())
+    r = re.findall(r"\w+", reference.lower())
+    scores = {}
+    for n in (1, 2):
+        cn, rn = _ngrams(c, n), _ngrams(r, n)
+        scores[f'rouge{n}'] = _f1(sum((cn & rn).values()), sum(cn.values()), sum(rn.values()))
+    scores['rougeL'] = _f1(_lcs(c, r), len(c), len(r))
+    return scores
+
+
+def run_backend(backend, texts, queue):
+    """Child process: loads one backend, summarizes every fixture and reports timings."""
+    from summarization_workflow import Summarizer
+
+    t = time.perf_counter()
+    summarizer = Summarizer(backend=backend)
+    load_seconds = time.perf_counter() - t
+    summarizer.summarize(texts[0])
+
+    summaries, latencies = [], []
+    start = time.perf_counter()
+    for text in texts:
+        t = time.perf_counter()
+        summaries.append(summarizer.summarize(text))
+        latencies.append(time.perf_counter() - t)
+    total = time.perf_counter() - start
+
+    queue.put({
+        'backend': backend,
+        'summaries': summaries,
+        'load_s': load_seconds,
+        'docs_per_s': len(texts) / total,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'max_ms': max(latencies) * 1000,
+        'maxrss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+
+def benchmark(backend, texts):
+    # Each backend runs in a fresh process so memory numbers are per worker
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=run_backend, args=(backend, texts, queue))
+    proc.start()
+    deadline = time.monotonic() + BACKEND_TIMEOUT
+    try:
+        # Poll so a child that crashed (e.g. killed for memory) is noticed instead of waited on forever
+        while True:
+            try:
+                return queue.get(timeout=5)
+            except Empty:
+                if not proc.is_alive():
+                    raise RuntimeError(f"Backend {backend} exited with code {proc.exitcode} without results")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Backend {backend} gave no results within {BACKEND_TIMEOUT}s")
+    finally:
+        if proc.is_alive():
+            proc.terminate()
+        proc.join()
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(description='Compare Summarizer backends for accuracy and CPU throughput')
+    parser.add_argument('-b', '--backends', nargs='+', default=list(SUMMARIZER_BACKENDS),
+                        choices=SUMMARIZER_BACKENDS, help='backends to benchmark')
+    parser.add_argument('-n', '--limit', type=int, default=10, help='number of fixture judgments')
+    parser.add_argument('-f', '--fixtures', nargs='+',
+                        default=sorted(glob.glob('results/*_summary_input.json')) +
+                                sorted(glob.glob(os.path.join('Data', '*', '*', '*.json'))),
+                        help='judgment JSON files')
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_arg_parser().parse_args()
+    texts = load_fixtures(args.fixtures, args.limit)
+    print(f"{len(texts)} fixture judgments")
+
+    backends = ['pytorch'] + [b for b in args.backends if b != 'pytorch']
+    results = []
+    for backend in backends:
+        try:
+            results.append(benchmark(backend, texts))
+        except RuntimeError as e:
+            print(e)
+    if not results or results[0]['backend'] != 'pytorch':
+        raise SystemExit("The pytorch reference backend failed; nothing to compare against")
+    reference = results[0]
+
+    print(f"{'backend':8} {'load s':>7} {'docs/s':>7} {'speedup':>8} {'p50 ms':>8} {'max ms':>8} "
+          f"{'rss MB':>7} {'R-1':>5} {'R-2':>5} {'R-L':>5}")
+    for r in results:
+        # Failed summaries are left out rather than scored as (near) zero overlap
+        scores = [rouge(c, ref) for c, ref in zip(r['summaries'], reference['summaries'])
+                  if SUMMARY_ERROR not in (c, ref)]
+        failed = len(r['summaries']) - len(scores)
+        mean = {k: statistics.mean(s[k] for s in scores) if scores else 0.0
+                for k in ('rouge1', 'rouge2', 'rougeL')}
+        print(f"{r['backend']:8} {r['load_s']:7.1f} {r['docs_per_s']:7.2f} "
+              f"{r['docs_per_s'] / reference['docs_per_s']:7.2f}x {r['p50_ms']:8.0f} {r['max_ms']:8.0f} "
+              f"{r['maxrss_mb']:7.0f} {mean['rouge1']:5.3f} {mean['rouge2']:5.3f} {mean['rougeL']:5.3f}"
+              + (f"  ({failed} failed summaries not scored)" if failed else ""))
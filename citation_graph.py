@@ -0,0 +1,208 @@
+import argparse
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ikclient import IKClient, IKError
+from usage import account_usage
+
+logger = logging.getLogger('ikapi')
+
+
+def _csr(src_rows, dst_rows, n):
+    """CSR adjacency (indptr, indices) with sorted, de-duplicated neighbours."""
+    # One int64 key per edge: sorting the keys orders by source, then target
+    keys = _sorted_unique(src_rows.astype(np.int64) * n + dst_rows)
+    src_rows, dst_rows = keys // n, keys % n
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src_rows, minlength=n), out=indptr[1:])
+    return indptr, dst_rows.astype(np.int32)
+
+
+def _sorted_unique(a):
+    a = np.sort(a)
+    if not len(a):
+        return a
+    return a[np.concatenate(([True], a[1:] != a[:-1]))]
+
+
+def _as_edge_array(edges):
+    if not isinstance(edges, np.ndarray):
+        edges = list(edges)
+    return np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+
+
+class CitationGraph:
+    """
+    Citation edges between judgments in compressed sparse row form.
+
+    `ids` is the sorted array of docids; a docid's row is found by binary
+    search, so the whole graph is five NumPy arrays and loads with a single
+    np.load. Both directions are stored, so "cited by X" and "citing X" are
+    each one slice.
+    """
+    def __init__(self, ids, cites_indptr, cites_indices, citedby_indptr, citedby_indices):
+        self.ids = ids
+        self.cites_indptr = cites_indptr
+        self.cites_indices = cites_indices
+        self.citedby_indptr = citedby_indptr
+        self.citedby_indices = citedby_indices
+
+    @classmethod
+    def from_edges(cls, edges):
+        """Builds the graph from (citing docid, cited docid) pairs."""
+        edges = _as_edge_array(edges)
+        ids, rows = np.unique(edges.ravel(), return_inverse=True)
+        src, dst = rows[0::2], rows[1::2]
+        cites = _csr(src, dst, len(ids))
+        citedby = _csr(dst, src, len(ids))
+        return cls(ids, *cites, *citedby)
+
+    def edges(self):
+        src = np.repeat(np.arange(len(self.ids)), np.diff(self.cites_indptr))
+        return np.stack([self.ids[src], self.ids[self.cites_indices]], axis=1)
+
+    def merge(self, edges):
+        """Returns a new graph with the extra (citing, cited) pairs added."""
+        return CitationGraph.from_edges(np.concatenate([self.edges(), _as_edge_array(edges)]))
+
+    def save(self, path):
+        np.savez(path, ids=self.ids, cites_indptr=self.cites_indptr,
+                 cites_indices=self.cites_indices, citedby_indptr=self.citedby_indptr,
+                 citedby_indices=self.citedby_indices)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['ids'], data['cites_indptr'], data['cites_indices'],
+                       data['citedby_indptr'], data['citedby_indices'])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row(self, docid):
+        i = int(np.searchsorted(self.ids, docid))
+        if i < len(self.ids) and self.ids[i] == docid:
+            return i
+        return None
+
+    def _neighbour_rows(self, rows, indptr, indices):
+        if len(rows) == 1:
+            r = rows[0]
+            return indices[indptr[r]:indptr[r + 1]]
+        return np.concatenate([indices[indptr[r]:indptr[r + 1]] for r in rows]) \
+            if len(rows) else np.empty(0, dtype=np.int32)
+
+    def cites(self, docid):
+        """Docids of the cases that `docid` cites."""
+        row = self.row(docid)
+        if row is None:
+            return np.empty(0, dtype=np.int64)
+        return self.ids[self.cites_indices[self.cites_indptr[row]:self.cites_indptr[row + 1]]]
+
+    def cited_by(self, docid):
+        """Docids of the cases citing `docid`."""
+        row = self.row(docid)
+        if row is None:
+            return np.empty(0, dtype=np.int64)
+        return self.ids[self.citedby_indices[self.citedby_indptr[row]:self.citedby_indptr[row + 1]]]
+
+    def neighbourhood(self, docid, k=1, direction='both'):
+        """
+        Docids within `k` hops of `docid`, excluding itself.
+
+        Args:
+            direction (str): 'cites', 'citedby' or 'both'.
+        """
+        row = self.row(docid)
+        if row is None:
+            return np.empty(0, dtype=np.int64)
+        seen = np.array([row])
+        frontier = seen
+        for _ in range(k):
+            nxt = []
+            if direction in ('cites', 'both'):
+                nxt.append(self._neighbour_rows(frontier, self.cites_indptr, self.cites_indices))
+            if direction in ('citedby', 'both'):
+                nxt.append(self._neighbour_rows(frontier, self.citedby_indptr, self.citedby_indices))
+            frontier = np.setdiff1d(np.concatenate(nxt), seen)
+            if not len(frontier):
+                break
+            seen = np.union1d(seen, frontier)
+        return self.ids[np.setdiff1d(seen, [row])]
+
+
+def crawl_citations(client, seeds, depth=1, max_docs=1000, max_workers=8,
+                    maxcites=50, maxcitedby=50, usage=None):
+    """
+    Crawls /docmeta/ breadth-first from `seeds`, each docid fetched once.
+    Every request is recorded against `usage` (a usage.QueryUsage), if given.
+
+    Returns:
+        list[tuple]: (citing docid, cited docid) edges.
+    """
+    edges = []
+    seen = set()
+    frontier = [int(d) for d in seeds]
+
+    def fetch(docid):
+        try:
+            return docid, client.fetch_docmeta(docid, maxcites, maxcitedby,
+                                               observe=usage.ik_call if usage else None)
+        except IKError as e:
+            logger.warning(f"Docmeta {docid} failed: {e}")
+            return docid, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for level in range(depth + 1):
+            frontier = [d for d in dict.fromkeys(frontier) if d not in seen][:max_docs - len(seen)]
+            if not frontier:
+                break
+            seen.update(frontier)
+            logger.info(f"Citation crawl level {level}: {len(frontier)} documents")
+
+            nxt = []
+            for docid, meta in executor.map(fetch, frontier):
+                if meta is None:
+                    continue
+                edges.extend((docid, int(cited)) for cited in meta.cites)
+                edges.extend((int(citing), docid) for citing in meta.citedby)
+                nxt.extend(int(d) for d in meta.cites + meta.citedby)
+            frontier = nxt
+
+    return edges
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(description='Build the local citation graph from /docmeta/')
+    parser.add_argument('-s', '--sharedtoken', dest='token', required=True, help='api.ik shared token')
+    parser.add_argument('-g', '--graph', required=True, help='graph file (.npz); merged into if it exists')
+    parser.add_argument('-q', '--query', help='seed with the docids of this search')
+    parser.add_argument('-d', '--docid', type=int, nargs='*', default=[], help='seed docids')
+    parser.add_argument('-k', '--depth', type=int, default=1, help='crawl depth')
+    parser.add_argument('-n', '--maxdocs', type=int, default=1000, help='max documents to crawl')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='concurrent requests')
+    parser.add_argument('-a', '--account', help='record IK calls in the usage ledger under this user name')
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_arg_parser().parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    client = IKClient(args.token)
+    usage = account_usage(args.account, f"citation crawl {args.query or args.docid}")
+    seeds = list(args.docid)
+    if args.query:
+        seeds.extend(client.search(args.query, observe=usage.ik_call if usage else None).docids)
+
+    edges = crawl_citations(client, seeds, args.depth, args.maxdocs, args.workers, usage=usage)
+    if os.path.exists(args.graph):
+        graph = CitationGraph.load(args.graph).merge(edges)
+    else:
+        graph = CitationGraph.from_edges(edges)
+    graph.save(args.graph)
+    logger.info(f"Saved citation graph with {len(graph)} documents and "
+                f"{len(graph.cites_indices)} edges to {args.graph}")
@@ -0,0 +1,44 @@
+import functools
+import os
+
+# name -> (st.secrets section, key, environment variable, default)
+SETTINGS = {
+    'INDIANKANOON_API_TOKEN': ('indiankanoon', 'INDIANKANOON_API_TOKEN', 'INDIANKANOON_API_TOKEN', None),
+    'INDIANKANOON_API_URL': ('indiankanoon', 'INDIANKANOON_API_URL', 'INDIANKANOON_API_URL',
+                             'https://api.indiankanoon.org'),
+    'HUGGINGFACE_API_TOKEN': ('huggingface', 'HUGGINGFACE_API_TOKEN', 'HUGGINGFACE_API_TOKEN', None),
+    'API_URL': ('openai', 'API_URL', 'API_URL', None),
+    'OPENAI_API_KEY': ('openai', 'OPENAI_API_KEY', 'OPENAI_API_KEY', None),
+    'OPENAI_ENDPOINT': ('openai', 'OPENAI_ENDPOINT', 'OPENAI_ENDPOINT', None),
+    # No default: a missing key fails with a clear KeyError instead of using a shared one
+    'GROQ_API_KEY': ('GROQ', 'GROQ_API', 'GROQ_API_KEY', None),
+    # Empty means the Groq SDK default endpoint
+    'GROQ_BASE_URL': ('GROQ', 'GROQ_BASE_URL', 'GROQ_BASE_URL', ''),
+    'SUMMARIZER_BACKEND': ('summarizer', 'backend', 'SUMMARIZER_BACKEND', 'pytorch'),
+    # Per user per day; 0 means unlimited
+    'USAGE_BUDGET_IK_CALLS': ('usage', 'ik_calls', 'USAGE_BUDGET_IK_CALLS', '1000'),
+    'USAGE_BUDGET_HF_CALLS': ('usage', 'hf_calls', 'USAGE_BUDGET_HF_CALLS', '2000'),
+    'USAGE_BUDGET_LLM_TOKENS': ('usage', 'llm_tokens', 'USAGE_BUDGET_LLM_TOKENS', '500000'),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get(name):
+    """
+    Reads a setting the first time it is needed.
+
+    Environment variables win, so CLIs and worker processes never import
+    Streamlit; otherwise the value comes from `st.secrets`.
+    """
+    section, key, env, default = SETTINGS[name]
+    value = os.environ.get(env)
+    if value is not None:
+        return value
+    try:
+        import streamlit as st
+        return st.secrets[section][key]
+    except Exception:
+        if default is not None:
+            return default
+        raise KeyError(f"Setting {name} is not configured: set ${env} or "
+                       f"[{section}] {key} in .streamlit/secrets.toml")
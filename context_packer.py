@@ -0,0 +1,119 @@
+import functools
+import logging
+import math
+import re
+from collections import Counter
+
+logger = logging.getLogger('ikapi')
+
+# Per-message overhead of the chat template (role header and end-of-turn tokens)
+MESSAGE_OVERHEAD = 8
+SAFETY_MARGIN = 32
+
+_WORD = re.compile(r"\w+")
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(name='cl100k_base'):
+    """
+    Loads a tokenizer once per process and returns a text -> token count function.
+
+    `name` is a tiktoken encoding (cl100k_base tracks the Llama 3 BPE closely)
+    or a Hugging Face tokenizer id such as `meta-llama/Meta-Llama-3-8B` (ids
+    contain a '/'). If it cannot be loaded, tokens are estimated
+    conservatively from characters.
+    """
+    try:
+        if '/' in name:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(name)
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+        import tiktoken
+        encoding = tiktoken.get_encoding(name)
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:
+        logger.warning(f"Tokenizer {name!r} unavailable ({e}), estimating token counts")
+        return lambda text: math.ceil(len(text) / 3)
+
+
+@functools.lru_cache(maxsize=4096)
+def count_tokens(text, tokenizer='cl100k_base'):
+    return get_tokenizer(tokenizer)(text)
+
+
+def rank_by_relevance(question, summaries, k1=1.5, b=0.75):
+    """Orders summaries by BM25 score against the question, best first."""
+    docs = [Counter(_WORD.findall(s.lower())) for s in summaries]
+    if not docs:
+        return []
+    avglen = sum(sum(d.values()) for d in docs) / len(docs) or 1
+    terms = set(_WORD.findall(question.lower()))
+
+    scores = []
+    for d in docs:
+        length = sum(d.values())
+        score = 0.0
+        for term in terms:
+            tf = d.get(term, 0)
+            if not tf:
+                continue
+            df = sum(1 for other in docs if term in other)
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avglen))
+        scores.append(score)
+    order = sorted(range(len(summaries)), key=lambda i: -scores[i])
+    return [summaries[i] for i in order]
+
+
+def truncate_to_tokens(text, budget, tokenizer='cl100k_base'):
+    """Cuts `text` at a word boundary so that it fits in `budget` tokens."""
+    words = text.split()
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid]), tokenizer) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo])
+
+
+def pack_context(question, summaries, system_prompt, prompt_prefix='',
+                 context_window=8192, max_answer_tokens=1000,
+                 tokenizer='cl100k_base', separator="\n\n"):
+    """
+    Packs as many relevant case summaries as fit in the model's context window.
+
+    Summaries are ranked by relevance to the question and added greedily;
+    one that does not fit is skipped in favour of smaller ones further down.
+    If not even the best summary fits, it is truncated.
+
+    Args:
+        question (str): The user's query.
+        summaries (list[str]): Candidate case summaries.
+        system_prompt (str): System message sent with the request.
+        prompt_prefix (str): Text placed before the summaries in the user message.
+        context_window (int): Model context size in tokens.
+        max_answer_tokens (int): Tokens kept free for the completion.
+
+    Returns:
+        tuple: (packed summaries text, number of summaries included)
+    """
+    budget = (context_window - max_answer_tokens - SAFETY_MARGIN - 2 * MESSAGE_OVERHEAD
+              - count_tokens(system_prompt, tokenizer) - count_tokens(prompt_prefix, tokenizer))
+    sep_tokens = count_tokens(separator, tokenizer)
+
+    packed = []
+    for summary in rank_by_relevance(question, summaries):
+        cost = count_tokens(summary, tokenizer) + (sep_tokens if packed else 0)
+        if cost <= budget:
+            packed.append(summary)
+            budget -= cost
+
+    if not packed and summaries and budget > 0:
+        best = rank_by_relevance(question, summaries)[0]
+        packed.append(truncate_to_tokens(best, budget, tokenizer))
+
+    if len(packed) < len(summaries):
+        logger.info(f"Context packer kept {len(packed)} of {len(summaries)} case summaries")
+    return separator.join(packed), len(packed)
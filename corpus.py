@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import re
+import threading
+
+from segments import load_sections
+
+logger = logging.getLogger('ikapi')
+
+# Judgments saved by ikapi.py (<docid>.json) and ikapi_new.py (<docid>_summary_input.json)
+SOURCE = re.compile(r'^(\d+)(_summary_input)?\.json$')
+
+
+def get_summary_path(path):
+    """The sidecar next to a stored judgment: 123.json -> 123.summary.json."""
+    m = SOURCE.match(os.path.basename(path))
+    return os.path.join(os.path.dirname(path), f'{m.group(1)}.summary.json')
+
+
+def load_summary(path):
+    """The stored summary for a judgment file, or None if it was never summarized."""
+    summary_path = get_summary_path(path)
+    if not os.path.exists(summary_path):
+        return None
+    with open(summary_path, encoding='utf8') as f:
+        return json.load(f)
+
+
+class StoredCorpus:
+    """
+    Judgments already on disk under `datadirs`, looked up by docid, so
+    callers can read them and their cached section offsets instead of
+    fetching them from IK again.
+
+    The directories are walked once, on first use. A full crawl copy
+    (<docid>.json) is preferred over a summary input file.
+    """
+    def __init__(self, datadirs=('results', 'Data')):
+        self.datadirs = datadirs
+        self._paths = None
+        self.lock = threading.Lock()
+
+    def _scan(self):
+        paths = {}
+        for datadir in self.datadirs:
+            for dirpath, _, filenames in os.walk(datadir):
+                for filename in filenames:
+                    m = SOURCE.match(filename)
+                    if m and (not m.group(2) or int(m.group(1)) not in paths):
+                        paths[int(m.group(1))] = os.path.join(dirpath, filename)
+        logger.info(f"Found {len(paths)} stored judgments under {', '.join(self.datadirs)}")
+        return paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    @property
+    def paths(self):
+        with self.lock:
+            if self._paths is None:
+                self._paths = self._scan()
+            return self._paths
+
+    def path(self, docid):
+        return self.paths.get(int(docid))
+
+    def summary(self, docid):
+        """
+        The summary batch_summarize.py wrote for a stored judgment, or None
+        if there is none or the judgment changed since it was written.
+
+        Returns:
+            dict: The sidecar, with `title` and `summary`.
+        """
+        path = self.path(docid)
+        if not path:
+            return None
+        try:
+            if os.path.getmtime(get_summary_path(path)) < os.path.getmtime(path):
+                return None
+            stored = load_summary(path)
+        except (OSError, ValueError):
+            return None
+        return stored if stored and stored.get('summary') else None
+
+    def load(self, docid):
+        """
+        The stored judgment with its section offsets (see
+        segments.load_sections), or None if it is not stored or unreadable.
+
+        Returns:
+            tuple: (title, html, sections)
+        """
+        path = self.path(docid)
+        if not path:
+            return None
+        try:
+            return load_sections(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to read stored judgment {path}: {e}")
+            return None
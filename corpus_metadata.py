@@ -0,0 +1,195 @@
+import argparse
+import json
+import logging
+import os
+import re
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+logger = logging.getLogger('ikapi')
+
+SCHEMA = pa.schema([
+    ('docid', pa.int64()),
+    ('court', pa.string()),
+    ('year', pa.int16()),
+    ('date', pa.date32()),
+    ('title', pa.string()),
+    ('words', pa.int32()),
+    ('numcites', pa.int32()),
+    ('numcitedby', pa.int32()),
+    ('path', pa.string()),
+])
+PARTITION_COLS = ['court', 'year']
+
+# Judgment JSON is saved as <docid>.json; search results and fragments use other names
+DOC_JSON = re.compile(r'^(\d+)\.json$')
+TAG = re.compile(r'<[^>]+>')
+
+MANIFEST = '_manifest.json'
+DOCIDS = '_docids.npy'
+
+
+def read_doc_metadata(jsonpath, datadir):
+    """One metadata row from a saved /doc/ response, or None if it is not a judgment."""
+    with open(jsonpath, encoding='utf8') as f:
+        d = json.load(f)
+    if 'errmsg' in d or 'tid' not in d:
+        return None
+
+    date = np.datetime64(d.get('publishdate') or 'NaT', 'D')
+    return {
+        'docid': int(d['tid']),
+        'court': d.get('docsource') or 'unknown',
+        'year': int(str(date)[:4]) if not np.isnat(date) else 0,
+        'date': date.item(),
+        'title': d.get('title'),
+        'words': len(TAG.sub(' ', d.get('doc') or '').split()),
+        'numcites': d.get('numcites') or 0,
+        'numcitedby': d.get('numcitedby') or 0,
+        'path': os.path.relpath(jsonpath, datadir),
+    }
+
+
+def scan_corpus(datadir, since=0.0):
+    """Yields paths of judgment JSON files under `datadir` modified after `since`."""
+    for dirpath, _, filenames in os.walk(datadir):
+        for filename in filenames:
+            if not DOC_JSON.match(filename):
+                continue
+            path = os.path.join(dirpath, filename)
+            if os.path.getmtime(path) > since:
+                yield path
+
+
+class MetadataStore:
+    """
+    Document metadata as a Parquet dataset partitioned by court and year.
+
+    `update` only parses JSON files newer than the previous run and appends
+    new docids as fresh Parquet files, so refreshing a crawled tree is cheap.
+    A judgment saved under several query directories is stored once. Reads
+    push column selection and filters down to Parquet, so court or year
+    filters only open the matching partitions.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def _load_manifest(self):
+        manifest = {'scanned_at': 0.0}
+        docids = np.empty(0, dtype=np.int64)
+        if os.path.exists(os.path.join(self.path, MANIFEST)):
+            with open(os.path.join(self.path, MANIFEST)) as f:
+                manifest = json.load(f)
+            docids = np.load(os.path.join(self.path, DOCIDS))
+        return manifest, docids
+
+    def _save_manifest(self, manifest, docids):
+        np.save(os.path.join(self.path, DOCIDS), docids)
+        with open(os.path.join(self.path, MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+
+    def _write(self, rows, known, batch_tag):
+        table = pa.Table.from_pylist(rows, schema=SCHEMA)
+        docids = table.column('docid').to_numpy()
+        # Keep the first row of each docid that is not already stored
+        _, first = np.unique(docids, return_index=True)
+        keep = first[~np.isin(docids[first], known)]
+        if not len(keep):
+            return known
+        pq.write_to_dataset(table.take(np.sort(keep)), self.path, partition_cols=PARTITION_COLS,
+                            basename_template=f'part-{batch_tag}-{{i}}.parquet',
+                            existing_data_behavior='overwrite_or_ignore')
+        return np.union1d(known, docids[keep])
+
+    def update(self, datadir, batch_size=50000):
+        """
+        Adds documents saved under `datadir` since the last update.
+
+        Returns:
+            int: Number of new documents added.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        manifest, known = self._load_manifest()
+        started = time.time()
+        before = len(known)
+
+        rows = []
+        batch = 0
+        for path in scan_corpus(datadir, manifest['scanned_at']):
+            try:
+                row = read_doc_metadata(path, datadir)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping {path}: {e}")
+                continue
+            if row:
+                rows.append(row)
+            if len(rows) >= batch_size:
+                known = self._write(rows, known, f'{int(started)}-{batch}')
+                rows, batch = [], batch + 1
+        if rows:
+            known = self._write(rows, known, f'{int(started)}-{batch}')
+
+        self._save_manifest({'scanned_at': started}, known)
+        logger.info(f"Metadata store {self.path}: {len(known) - before} new, {len(known)} documents")
+        return len(known) - before
+
+    def read(self, columns=None, filters=None):
+        """
+        Reads the dataset as an Arrow table.
+
+        Args:
+            columns (list): Columns to load; others are never read from disk.
+            filters (list): Predicates in pyarrow DNF form, e.g.
+                [('court', '=', 'Supreme Court of India'), ('year', '>=', 2000)].
+        """
+        if not os.path.exists(self.path):
+            return SCHEMA.empty_table().select(columns or SCHEMA.names)
+        return pq.read_table(self.path, columns=columns, filters=filters,
+                             partitioning='hive', schema=SCHEMA)
+
+    def counts(self, by=('court', 'year'), filters=None):
+        """Document counts and mean citations grouped by the given columns."""
+        table = self.read(columns=list(by) + ['docid', 'numcitedby'], filters=filters)
+        return table.group_by(list(by)).aggregate(
+            [('docid', 'count'), ('numcitedby', 'mean')]).sort_by([(c, 'ascending') for c in by])
+
+
+def parse_filters(exprs):
+    """'year>=2000' style arguments to pyarrow DNF filters."""
+    filters = []
+    for expr in exprs:
+        m = re.match(r'^(\w+)\s*(==|=|!=|>=|<=|>|<)\s*(.+)$', expr)
+        if not m:
+            raise ValueError(f"Bad filter: {expr}")
+        column, op, value = m.groups()
+        value = pc.cast(pa.scalar(value), SCHEMA.field(column).type).as_py()
+        filters.append((column, '=' if op == '==' else op, value))
+    return filters or None
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(description='Columnar metadata export of the crawled corpus')
+    parser.add_argument('-o', '--dataset', required=True, help='Parquet dataset directory')
+    parser.add_argument('-d', '--datadir', help='crawl directory to export or update from')
+    parser.add_argument('-g', '--groupby', default='court,year', help='columns to count by')
+    parser.add_argument('-f', '--filter', nargs='*', default=[], help="filters such as year>=2000")
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_arg_parser().parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    store = MetadataStore(args.dataset)
+    if args.datadir:
+        store.update(args.datadir)
+
+    start = time.time()
+    table = store.counts(args.groupby.split(','), parse_filters(args.filter))
+    for row in table.to_pylist():
+        print(row)
+    logger.info(f"Queried {table.num_rows} groups in {time.time() - start:.3f}s")
@@ -0,0 +1,205 @@
+import contextlib
+import logging
+import queue
+import sqlite3
+
+logger = logging.getLogger('ikapi')
+
+# Schema migrations, applied in order; PRAGMA user_version records how many ran.
+# Released migrations are never edited: a change is always a new migration at the end.
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        username TEXT PRIMARY KEY,
+        password TEXT NOT NULL,
+        approved BOOLEAN NOT NULL,
+        is_admin BOOLEAN NOT NULL
+    );
+    INSERT OR IGNORE INTO users (username, password, approved, is_admin)
+        VALUES ('admin', 'admin123', 1, 1);
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS query_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL REFERENCES users(username),
+        query TEXT NOT NULL,
+        docids TEXT NOT NULL,
+        summaries TEXT,
+        answer TEXT,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS query_history_user ON query_history (username, created_at);
+    CREATE TABLE IF NOT EXISTS cached_results (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    """,
+    """
+    ALTER TABLE query_history ADD COLUMN searched_at REAL;
+    ALTER TABLE query_history ADD COLUMN answered_at REAL;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS api_usage (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT,
+        query TEXT,
+        service TEXT NOT NULL,
+        endpoint TEXT NOT NULL,
+        key TEXT NOT NULL,
+        request_bytes INTEGER NOT NULL,
+        response_bytes INTEGER NOT NULL,
+        tokens INTEGER NOT NULL,
+        seconds REAL NOT NULL,
+        ok BOOLEAN NOT NULL,
+        shared BOOLEAN NOT NULL,
+        repeat BOOLEAN NOT NULL,
+        day TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS api_usage_user_day ON api_usage (username, day);
+    CREATE INDEX IF NOT EXISTS api_usage_day ON api_usage (day);
+    CREATE INDEX IF NOT EXISTS api_usage_key ON api_usage (key, created_at);
+    """,
+    """
+    DROP TABLE IF EXISTS cached_results;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS cached_results (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS cached_results_created ON cached_results (created_at);
+    """,
+    """
+    ALTER TABLE query_history ADD COLUMN excerpts BOOLEAN NOT NULL DEFAULT 0;
+    """,
+]
+
+# SQL is kept as constants so every pooled connection reuses its compiled statements
+SQL_GET_USER = "SELECT * FROM users WHERE username = ?"
+SQL_ADD_USER = "INSERT INTO users (username, password, approved, is_admin) VALUES (?, ?, ?, ?)"
+SQL_PENDING_USERS = "SELECT username FROM users WHERE approved = 0 AND is_admin = 0"
+SQL_APPROVE_USER = "UPDATE users SET approved = 1 WHERE username = ?"
+SQL_GET_CACHED = "SELECT value, created_at FROM cached_results WHERE key = ?"
+SQL_PUT_CACHED = "INSERT OR REPLACE INTO cached_results (key, value, created_at) VALUES (?, ?, ?)"
+SQL_RECENT_CACHED = """SELECT key, value, created_at FROM cached_results WHERE created_at >= ?
+    ORDER BY created_at DESC LIMIT ?"""
+SQL_EXPIRE_CACHED = "DELETE FROM cached_results WHERE created_at < ?"
+
+
+class Database:
+    """
+    SQLite access through a per-process pool of connections.
+
+    Connections are opened once in WAL mode, so readers never wait on the
+    writer, and keep their prepared statement cache across calls. Schema
+    migrations run once, when the pool is created.
+    """
+    def __init__(self, path="users.db", pool_size=5, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self.pool = queue.LifoQueue()
+        for _ in range(pool_size):
+            self.pool.put(self._connect())
+        self.migrate()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=256, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self.pool.get()
+        try:
+            yield conn
+        finally:
+            self.pool.put(conn)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """A write transaction; takes the write lock up front to avoid upgrade deadlocks."""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def migrate(self):
+        """
+        Runs the migrations newer than the database, each in its own transaction.
+
+        executescript parses the SQL itself, so scripts may contain literal
+        semicolons. If another process is migrating the same file at the same
+        time, a script it already applied may fail here; that is fine as long
+        as the database has reached that version.
+        """
+        with self.connection() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for n, script in enumerate(MIGRATIONS[version:], start=version + 1):
+                logger.info(f"Applying database migration {n}")
+                try:
+                    conn.executescript(f"BEGIN IMMEDIATE;\n{script}\nPRAGMA user_version = {n};\nCOMMIT;")
+                except sqlite3.Error:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    if conn.execute("PRAGMA user_version").fetchone()[0] < n:
+                        raise
+
+    def fetchone(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def fetchall(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def execute(self, sql, params=()):
+        with self.transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def close(self):
+        while not self.pool.empty():
+            self.pool.get().close()
+
+
+def add_user(db, username, password, approved=False, is_admin=False):
+    db.execute(SQL_ADD_USER, (username, password, approved, is_admin))
+
+
+def get_user(db, username):
+    return db.fetchone(SQL_GET_USER, (username,))
+
+
+def get_pending_users(db):
+    return db.fetchall(SQL_PENDING_USERS)
+
+
+def approve_user(db, username):
+    db.execute(SQL_APPROVE_USER, (username,))
+
+
+def get_cached_result(db, key):
+    """Returns (value, created_at) or None."""
+    return db.fetchone(SQL_GET_CACHED, (key,))
+
+
+def put_cached_result(db, key, value, created_at):
+    db.execute(SQL_PUT_CACHED, (key, value, created_at))
+
+
+def get_recent_cached_results(db, since, limit):
+    """(key, value, created_at) of results cached since `since`, newest first."""
+    return db.fetchall(SQL_RECENT_CACHED, (since, limit))
+
+
+def expire_cached_results(db, before):
+    return db.execute(SQL_EXPIRE_CACHED, (before,))
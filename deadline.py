@@ -0,0 +1,49 @@
+import time
+
+# Shortest timeout handed to a network call, so a nearly spent budget still gets a try
+MIN_TIMEOUT = 0.1
+
+
+class Deadline:
+    """
+    A point in time by which a piece of work must be finished.
+
+    Deadlines are passed down explicitly. Each stage takes a share of what
+    is left with `stage`, and each network call gets `timeout()`, so no call
+    can outlive the budget of the request that made it.
+    """
+    def __init__(self, seconds):
+        self.start = time.monotonic()
+        self.end = self.start + seconds
+
+    @classmethod
+    def at(cls, end):
+        deadline = cls(0)
+        deadline.end = end
+        return deadline
+
+    def remaining(self):
+        return max(0.0, self.end - time.monotonic())
+
+    @property
+    def expired(self):
+        return time.monotonic() >= self.end
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def timeout(self, cap=None):
+        """Seconds a call may take: what is left, at most `cap`."""
+        remaining = self.remaining()
+        if cap is not None:
+            remaining = min(remaining, cap)
+        return max(MIN_TIMEOUT, remaining)
+
+    def stage(self, share):
+        """A deadline for one stage, `share` (0-1) of the time remaining, never past this one."""
+        return Deadline.at(min(self.end, time.monotonic() + share * self.remaining()))
+
+
+def timeout_of(deadline, cap=None):
+    """`deadline.timeout(cap)`, or `cap` when there is no deadline."""
+    return deadline.timeout(cap) if deadline is not None else cap
@@ -0,0 +1,249 @@
+import atexit
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger('ikapi')
+
+TAG = re.compile(r'<[^>]+>')
+WORD = re.compile(r'\w+')
+
+# Multiply-shift hashing needs odd 64-bit multipliers; the top 32 bits are used
+_MASK = np.uint64(0xFFFFFFFF)
+_SHIFT = np.uint64(32)
+
+
+def shingle_hashes(text, k=5):
+    """
+    Unique 64-bit hashes of the k-word shingles of `text`.
+
+    HTML tags, case and punctuation are ignored, so the reported and
+    unreported copies of a judgment shingle the same way.
+    """
+    words = WORD.findall(TAG.sub(' ', text).lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    h = np.fromiter((zlib.crc32(w.encode('utf8')) for w in words), dtype=np.uint64, count=len(words))
+    if len(h) < k:
+        return np.unique(h)
+    # Polynomial rolling combination of k consecutive word hashes, in uint64 arithmetic
+    windows = np.lib.stride_tricks.sliding_window_view(h, k)
+    powers = np.uint64(1000003) ** np.arange(k, dtype=np.uint64)
+    return np.unique(windows @ powers)
+
+
+class MinHasher:
+    """Computes MinHash signatures whose agreement estimates Jaccard similarity."""
+    def __init__(self, num_perm=128, k=5, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.k = k
+        self.a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+
+    def signature(self, text, chunk=8192):
+        """MinHash signature of `text` as a uint32 array of length num_perm."""
+        hashes = shingle_hashes(text, self.k)
+        sig = np.full(self.num_perm, 0xFFFFFFFF, dtype=np.uint64)
+        # (num_perm x chunk) matrices keep memory bounded for very long judgments
+        for start in range(0, len(hashes), chunk):
+            x = hashes[start:start + chunk]
+            permuted = ((np.multiply.outer(self.a, x) + self.b[:, None]) >> _SHIFT) & _MASK
+            np.minimum(sig, permuted.min(axis=1), out=sig)
+        return sig.astype(np.uint32)
+
+
+def _bands_for(threshold, num_perm):
+    """Band count whose LSH S-curve crosses 50% closest to `threshold`."""
+    best = None
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands)
+    return best[1]
+
+
+class LSHIndex:
+    """
+    Banded LSH index of MinHash signatures, persisted as a single .npz.
+
+    `add` returns the docid a new document duplicates, if any; duplicates are
+    remembered so a later run can skip them without fetching them again.
+    Candidates from the bands are confirmed on the estimated Jaccard
+    similarity, so false positives from bucket collisions are dropped.
+
+    With `max_docs`, the index keeps at most that many documents: those
+    least recently added or matched age out first, together with the
+    duplicates recorded against them.
+    """
+    def __init__(self, threshold=0.8, num_perm=128, hasher=None, max_docs=None):
+        self.threshold = threshold
+        self.max_docs = max_docs
+        self.hasher = hasher or MinHasher(num_perm)
+        self.bands = _bands_for(threshold, self.hasher.num_perm)
+        self.rows = self.hasher.num_perm // self.bands
+        self.signatures = {}
+        self.duplicates = {}
+        # original -> its duplicates, so ageing out an original does not scan `duplicates`
+        self.copies = {}
+        self.buckets = [{} for _ in range(self.bands)]
+        self.path = None
+        self.lock = threading.Lock()
+        self.changes = 0
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def _keys(self, sig):
+        return [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _insert(self, docid, sig):
+        self.signatures[docid] = sig
+        for bucket, key in zip(self.buckets, self._keys(sig)):
+            bucket.setdefault(key, []).append(docid)
+
+    def _evict(self):
+        """Drops the oldest documents beyond `max_docs`; called with the lock held."""
+        while self.max_docs and len(self.signatures) > self.max_docs:
+            docid = next(iter(self.signatures))
+            sig = self.signatures.pop(docid)
+            for bucket, key in zip(self.buckets, self._keys(sig)):
+                docids = bucket[key]
+                docids.remove(docid)
+                if not docids:
+                    del bucket[key]
+            for dup in self.copies.pop(docid, ()):
+                del self.duplicates[dup]
+
+    def query(self, sig):
+        """Returns (docid, similarity) of the closest indexed near-duplicate, or None."""
+        candidates = set()
+        for bucket, key in zip(self.buckets, self._keys(sig)):
+            candidates.update(bucket.get(key, ()))
+        best = None
+        for docid in candidates:
+            sim = float(np.mean(self.signatures[docid] == sig))
+            if sim >= self.threshold and (best is None or sim > best[1]):
+                best = (docid, sim)
+        return best
+
+    def duplicate_of(self, docid):
+        return self.duplicates.get(docid)
+
+    def add(self, docid, text):
+        """
+        Indexes a document unless it near-duplicates one already indexed.
+
+        Returns:
+            The docid of the original this document duplicates, or None.
+        """
+        sig = self.hasher.signature(text)
+        if (sig == 0xFFFFFFFF).all():
+            # No text to compare; never call empty documents duplicates of each other
+            return None
+        with self.lock:
+            if docid in self.duplicates:
+                return self.duplicates[docid]
+            if docid in self.signatures:
+                return None
+            match = self.query(sig)
+            self.changes += 1
+            if match:
+                self.duplicates[docid] = match[0]
+                self.copies.setdefault(match[0], []).append(docid)
+                # A matched original is still in use, so it moves to the back of the age-out order
+                self.signatures[match[0]] = self.signatures.pop(match[0])
+                logger.info(f"Document {docid} is a near-duplicate of {match[0]} ({match[1]:.2f})")
+                return match[0]
+            self._insert(docid, sig)
+            self._evict()
+            return None
+
+    def save(self, path=None):
+        """Saves to `path`, by default the file the index was opened from."""
+        path = path or self.path
+        with self.lock:
+            self.changes = 0
+            docids = np.fromiter(self.signatures, dtype=np.int64, count=len(self.signatures))
+            sigs = np.stack(list(self.signatures.values())) if self.signatures \
+                else np.empty((0, self.hasher.num_perm), dtype=np.uint32)
+            dups = np.array(list(self.duplicates.items()), dtype=np.int64).reshape(-1, 2)
+        # Written aside and renamed, so a concurrent reader never sees a partial file
+        tmppath = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmppath, 'wb') as f:
+            np.savez(f, docids=docids, signatures=sigs, duplicates=dups, threshold=self.threshold)
+        os.replace(tmppath, path)
+
+    def save_if_changed(self):
+        if self.changes and self.path:
+            self.save()
+
+    def autosave(self, interval=300):
+        """
+        Saves the index every `interval` seconds if it changed, and at exit,
+        on a daemon thread, so no request waits for the file to be written.
+        """
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.save_if_changed()
+                except OSError as e:
+                    logger.error(f"Failed to save dedup index {self.path}: {e}")
+
+        threading.Thread(target=run, name='dedup-autosave', daemon=True).start()
+        atexit.register(self.save_if_changed)
+
+    @classmethod
+    def load(cls, path, hasher=None, max_docs=None):
+        with np.load(path) as data:
+            index = cls(float(data['threshold']), data['signatures'].shape[1], hasher, max_docs)
+            # Saved oldest first, so the age-out order survives a reload
+            for docid, sig in zip(data['docids'].tolist(), data['signatures']):
+                index._insert(docid, sig)
+            index.duplicates = dict(data['duplicates'].tolist())
+            for dup, original in index.duplicates.items():
+                index.copies.setdefault(original, []).append(dup)
+            index._evict()
+        return index
+
+    @classmethod
+    def open(cls, path, threshold=0.8, max_docs=None):
+        """Loads the index at `path`, or starts an empty one if there is none yet."""
+        if path and os.path.exists(path):
+            index = cls.load(path, max_docs=max_docs)
+        else:
+            index = cls(threshold, max_docs=max_docs)
+        index.path = path
+        return index
+
+
+class DuplicateFilter:
+    """
+    Collapses near-duplicates within one result set, e.g. one search.
+
+    The shared index maps each document to its original; a document is
+    only dropped if that original (or another copy of it) was already seen
+    in this result set, so a copy is never dropped in favour of a case the
+    user is not shown.
+    """
+    def __init__(self, index):
+        self.index = index
+        self.seen = {}
+        self.lock = threading.Lock()
+
+    def check(self, docid, text):
+        """Returns the docid of an earlier copy in this result set, or None."""
+        original = self.index.add(docid, text)
+        key = docid if original is None else original
+        with self.lock:
+            first = self.seen.setdefault(key, docid)
+        return first if first != docid else None
@@ -0,0 +1,100 @@
+import re
+
+import numpy as np
+
+_SENTENCE_END = re.compile(r'(?<=[.?!;:])\s+(?=[A-Z0-9("\'])')
+_WORD = re.compile(r"[a-z]{3,}")
+
+
+def split_sentences(text):
+    """Splits cleaned judgment text into sentences."""
+    return [s for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+def score_sentences(sentences, min_words=6):
+    """
+    Scores sentences by TF-IDF similarity to the document centroid.
+
+    Works on (sentence, term, count) triples instead of a dense matrix, so long
+    judgments with large vocabularies stay cheap. Very short sentences and
+    lines with little prose (party lists, citation tables) score zero.
+
+    Returns:
+        numpy.ndarray: One score per sentence.
+    """
+    vocab = {}
+    sent_idx, term_idx, counts, lengths = [], [], [], []
+    for i, sentence in enumerate(sentences):
+        words = _WORD.findall(sentence.lower())
+        lengths.append(len(sentence.split()))
+        if len(words) < min_words:
+            continue
+        uniq, cnt = np.unique([vocab.setdefault(w, len(vocab)) for w in words], return_counts=True)
+        sent_idx.append(np.full(len(uniq), i))
+        term_idx.append(uniq)
+        counts.append(cnt)
+
+    n = len(sentences)
+    if not sent_idx:
+        return np.zeros(n)
+    sent_idx = np.concatenate(sent_idx)
+    term_idx = np.concatenate(term_idx)
+    counts = np.concatenate(counts).astype(float)
+
+    df = np.bincount(term_idx, minlength=len(vocab))
+    idf = np.log((1 + n) / (1 + df)) + 1
+    weights = (1 + np.log(counts)) * idf[term_idx]
+    norms = np.sqrt(np.bincount(sent_idx, weights * weights, minlength=n))
+    weights /= norms[sent_idx]
+
+    centroid = np.bincount(term_idx, weights, minlength=len(vocab))
+    centroid /= np.linalg.norm(centroid)
+    scores = np.bincount(sent_idx, weights * centroid[term_idx], minlength=n)
+
+    # Prose density: share of tokens that are real words
+    lengths = np.maximum(np.array(lengths), 1)
+    density = np.minimum(np.bincount(sent_idx, counts, minlength=n) / lengths, 1.0)
+    return scores * density
+
+
+def select_salient(text, ratio=0.25, max_words=None, min_words=200):
+    """
+    Keeps the most salient sentences of `text` within a word budget.
+
+    Args:
+        text (str): Cleaned judgment text.
+        ratio (float): Fraction of the document's words to keep.
+        max_words (int): Upper bound on the budget, if any.
+        min_words (int): Documents this short are returned unchanged.
+
+    Returns:
+        str: The selected sentences in their original order.
+    """
+    total = len(text.split())
+    budget = int(total * ratio)
+    if max_words:
+        budget = min(budget, max_words)
+    if total <= min_words or budget >= total:
+        return text
+    budget = max(budget, min_words)
+
+    sentences = split_sentences(text)
+    scores = score_sentences(sentences)
+    lengths = np.array([len(s.split()) for s in sentences])
+
+    order = np.argsort(-scores, kind='stable')
+    keep = order[np.cumsum(lengths[order]) <= budget]
+    if not len(keep):
+        keep = order[:1]
+    return " ".join(sentences[i] for i in np.sort(keep))
+
+
+class ExtractiveFilter:
+    """Per-call-site pre-filter configuration, usable as `prefilter=` callable."""
+    def __init__(self, ratio=0.25, max_words=None, min_words=200):
+        self.ratio = ratio
+        self.max_words = max_words
+        self.min_words = min_words
+
+    def __call__(self, text):
+        return select_salient(text, self.ratio, self.max_words, self.min_words)
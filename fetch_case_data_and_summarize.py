@@ -1,28 +1,28 @@
+import itertools
 import logging
 import json
-import http.client
-import urllib.parse
-import requests
 import re
 import time
 import os
+from concurrent.futures import TimeoutError as FuturesTimeout
 
+from pipeline import summarize_cases, format_case_summaries
+from extractive import ExtractiveFilter
 
+import config
+from ikclient import IKClient, IKError, SingleFlight, Transport
 
 
-import streamlit as st
-
-INDIANKANOON_API_TOKEN = st.secrets["indiankanoon"]["INDIANKANOON_API_TOKEN"]
-HUGGINGFACE_API_TOKEN = st.secrets["huggingface"]["HUGGINGFACE_API_TOKEN"]
-API_URL = st.secrets["openai"]["API_URL"]
-OPENAI_API_KEY = st.secrets["openai"]["OPENAI_API_KEY"]
-OPENAI_ENDPOINT = st.secrets["openai"]["OPENAI_ENDPOINT"]
-#GROQ_API_KEY =  st.secrets["GROQ"]["GROQ_API"]
-GROQ_API_KEY =  "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"
-OPENAI_HEADERS = {
-    "Content-Type": "application/json",
-    "api-key": OPENAI_API_KEY,
-}
+def __getattr__(name):
+    """Settings are read from the environment or st.secrets on first access."""
+    if name in config.SETTINGS:
+        return config.get(name)
+    if name == 'OPENAI_HEADERS':
+        return {
+            "Content-Type": "application/json",
+            "api-key": config.get('OPENAI_API_KEY'),
+        }
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 '''def query_ai_model(question, related_case_summaries):
@@ -60,74 +60,141 @@ OPENAI_HEADERS = {
     return answer'''
 
 
-from groq import Groq
-
-def query_ai_model(question, related_case_summaries):
-    # Instantiate Groq client
-    client = Groq(api_key = GROQ_API_KEY)
+from resources import get_groq_client
+from deadline import timeout_of
+from context_packer import count_tokens, pack_context
+from usage import call_key
+
+LLM_MODEL = "llama3-8b-8192"
+LLM_CONTEXT_WINDOW = 8192
+LLM_MAX_TOKENS = 1000
+
+TRUNCATED_ANSWER = "\n\n[Answer cut off at the time limit.]"
+
+# Upper bound on one HF call, and on how often a loading (503) model is retried
+HF_TIMEOUT = 60
+HF_LOADING_RETRIES = 3
+
+SYSTEM_PROMPT = (
+    "You are a legal AI assistant specializing in analyzing legal case summaries. "
+    "Your task is to provide concise, actionable insights based solely on the information provided. "
+    "Focus on extracting key points, interpreting relevant legal principles, and addressing the user's query directly. "
+    "Avoid boilerplate language, unnecessary context, or speculation; prioritize clarity and precision."
+)
+
+def query_ai_model(question, related_case_summaries, context_window=LLM_CONTEXT_WINDOW,
+                   max_tokens=LLM_MAX_TOKENS, deadline=None, usage=None):
+    """
+    Asks the LLM to answer the query from the related case summaries.
+
+    With a `deadline`, the request times out when it expires and an answer
+    still streaming at that point is cut off and labelled as such. With a
+    `usage` (usage.QueryUsage), the call is refused once the user's daily
+    token budget is spent and is recorded otherwise.
+
+    `related_case_summaries` is a list of per-case summaries or the combined
+    text from format_case_summaries, split back into cases at each "Title:".
+    The most relevant cases are packed into the context window, leaving
+    room for `max_tokens` of answer.
+    """
+    # Shared Groq client, created once per process
+    client = get_groq_client()
+
+    if isinstance(related_case_summaries, str):
+        # A summary may itself contain blank lines, so only split where the next case starts
+        related_case_summaries = [s for s in re.split(r"\n\n(?=Title: )", related_case_summaries) if s.strip()]
+    prefix = f"Query: {question}\n\nRelated case summaries:\n\n"
+    context, _ = pack_context(question, related_case_summaries, SYSTEM_PROMPT, prefix,
+                              context_window=context_window, max_answer_tokens=max_tokens)
 
     # Define the messages payload
     messages = [
         {
             "role": "system",
-            "content": (
-                "You are a legal AI assistant specializing in analyzing legal case summaries. "
-                "Your task is to provide concise, actionable insights based solely on the information provided. "
-                "Focus on extracting key points, interpreting relevant legal principles, and addressing the user's query directly. "
-                "Avoid boilerplate language, unnecessary context, or speculation; prioritize clarity and precision."
-            ),
+            "content": SYSTEM_PROMPT,
         },
         {
             "role": "user",
-            "content": (
-                f"Query: {question}\n\n"
-                "Related case summaries:\n\n"
-                + related_case_summaries  # Ensure the summaries are not too long
-            ),
+            "content": prefix + context,
         },
     ]
 
 
+    if deadline is not None and deadline.expired:
+        return "Error while querying AI: no time left before the deadline"
+    if usage and not usage.allowed('groq'):
+        return "Error while querying AI: your daily AI token budget is used up"
+
+    start = time.perf_counter()
+    answer, ok, tokens = "", False, None
     try:
         # Create the completion request
         completion = client.chat.completions.create(
-            model="llama3-8b-8192",
+            model=LLM_MODEL,
             messages=messages,
             temperature=0.7,
-            max_tokens=1000,
+            max_tokens=max_tokens,
             top_p=0.95,
             stream=True,  # Enables streaming for incremental responses
             stop=None,
+            timeout=timeout_of(deadline),
         )
 
         # Collect and build the response from chunks
         answer = ""
         for chunk in completion:
-            delta = chunk.choices[0].delta.content or ""
+            # The last chunk carries the tokens Groq billed for the call
+            x_groq = getattr(chunk, 'x_groq', None)
+            if x_groq is not None and getattr(x_groq, 'usage', None) is not None:
+                tokens = x_groq.usage.total_tokens
+            delta = (chunk.choices[0].delta.content or "") if chunk.choices else ""
             answer += delta
+            if deadline is not None and deadline.expired:
+                completion.close()
+                ok = True
+                return answer.strip() + TRUNCATED_ANSWER
 
         # Return the final response
+        ok = True
         return answer.strip()
 
     except Exception as e:
         # Handle exceptions and return error message
         return f"Error while querying AI: {str(e)}"
 
+    finally:
+        if usage:
+            prompt = SYSTEM_PROMPT + prefix + context
+            if tokens is None:
+                # Cut off, failed or not reported: estimated with the context packer's tokenizer
+                tokens = count_tokens(prompt) + count_tokens(answer)
+            usage.record('groq', LLM_MODEL, call_key('groq', LLM_MODEL, prompt, max_tokens),
+                         request_bytes=len(json.dumps(messages)), response_bytes=len(answer.encode('utf8')),
+                         tokens=tokens,
+                         seconds=time.perf_counter() - start, ok=ok)
+
 
 class IKApi:
     def __init__(self, maxpages=1):
         self.logger = logging.getLogger('ikapi')
-        self.headers = {
-            'Authorization': f'Token {INDIANKANOON_API_TOKEN}',
-            'Accept': 'application/json',
-            'User-Agent': 'Mozilla/5.0'
-        }
-        self.basehost = 'api.indiankanoon.org'
+        # Pooled, keep-alive IK client shared by every thread of this instance
+        self.client = IKClient(config.get("INDIANKANOON_API_TOKEN"),
+                               transport=Transport.from_url(config.get("INDIANKANOON_API_URL")))
         self.maxpages = min(maxpages, 100)
-        self.huggingface_api_url = API_URL
+        self.huggingface_api_url = config.get('API_URL')
         self.hf_headers = {
-            "Authorization": f"Bearer {HUGGINGFACE_API_TOKEN}"
+            "Authorization": f"Bearer {config.get('HUGGINGFACE_API_TOKEN')}"
         }
+        # Pooled HF session, created on first use
+        self._session = None
+        self.singleflight = SingleFlight()
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
 
     def clean_text(self, text):
         text = re.sub(r"<[^>]+>", " ", text)  #  HTML
@@ -143,14 +210,41 @@ class IKApi:
         for i in range(0, len(words), max_tokens):
             yield " ".join(words[i:i + max_tokens])
 
-    def summarize(self, text, max_length=150, min_length=50):
+    def summarize(self, text, max_length=150, min_length=50, deadline=None, usage=None):
         """
         Uses Hugging Face Inference API to summarize text.
-        Ensures text length stays within model limits.
+        Ensures text length stays within model limits. Sessions summarizing
+        the same text at the same time share one API call. No call outlives
+        `deadline`, if given; calls are recorded against `usage`, if given.
         """
         cleaned_text = self.clean_text(text)
         truncated_text = cleaned_text[:1024]  
 
+        if usage and not usage.allowed('hf'):
+            return "Error: your daily summarization budget is used up"
+
+        key = ('summarize', truncated_text, max_length, min_length)
+        start = time.perf_counter()
+        sent = []
+
+        def request():
+            sent.append(True)
+            return self._request_summary(truncated_text, max_length, min_length, deadline, usage)
+
+        try:
+            summary = self.singleflight.do(key, request, wait=timeout_of(deadline))
+        except FuturesTimeout:
+            summary = "Error: summary not ready before the deadline"
+        if usage and not sent:
+            # Served by another session's call in flight; its POSTs were recorded there
+            usage.record('hf', 'summarize', call_key(*key), request_bytes=len(truncated_text.encode('utf8')),
+                         response_bytes=len(summary.encode('utf8')), seconds=time.perf_counter() - start,
+                         ok=not summary.startswith("Error"), shared=True)
+        return summary
+
+    def _request_summary(self, truncated_text, max_length, min_length, deadline=None, usage=None):
+        """POSTs to the HF API, retrying while the model loads; every POST is recorded against `usage`."""
+        key = ('summarize', truncated_text, max_length, min_length)
         payload = {
             "inputs": truncated_text,
             "parameters": {
@@ -161,14 +255,29 @@ class IKApi:
         }
 
         try:
-            response = requests.post(self.huggingface_api_url, headers=self.hf_headers, json=payload)
-
-            # Retry if model is loading
-            if response.status_code == 503:
+            for attempt in range(HF_LOADING_RETRIES + 1):
+                start = time.perf_counter()
+                response = None
+                try:
+                    response = self.session.post(self.huggingface_api_url, headers=self.hf_headers, json=payload,
+                                                 timeout=timeout_of(deadline, HF_TIMEOUT))
+                finally:
+                    if usage:
+                        # Retries get their own key, so they are not counted as cacheable repeats
+                        usage.record('hf', 'summarize', call_key(*key, attempt) if attempt else call_key(*key),
+                                     request_bytes=len(truncated_text.encode('utf8')),
+                                     response_bytes=len(response.content) if response is not None else 0,
+                                     seconds=time.perf_counter() - start,
+                                     ok=response is not None and response.status_code == 200)
+                if response.status_code != 503 or attempt == HF_LOADING_RETRIES:
+                    break
+
+                # Retry if model is loading, unless it would not be ready in time
                 estimated_time = response.json().get("estimated_time", 10)
+                if deadline is not None and estimated_time >= deadline.remaining():
+                    return "Error: summarization model still loading at the deadline"
                 self.logger.info(f"Model is loading. Retrying in {estimated_time} seconds...")
                 time.sleep(estimated_time)
-                return self.summarize(text, max_length, min_length)
 
             if response.status_code != 200:
                 self.logger.error(f"Hugging Face API error {response.status_code}: {response.text}")
@@ -184,100 +293,95 @@ class IKApi:
             return f"Error: {str(e)}"
 
 
-    def fetch_doc(self, docid):
-
-        """Fetch document by ID."""
-        url = f'/doc/{docid}/'
-        connection = http.client.HTTPSConnection(self.basehost)
-        connection.request("POST", url, headers=self.headers)
-        response = connection.getresponse()
-        if response.status != 200:
-            self.logger.warning(f"Failed to fetch document {docid}. HTTP {response.status}: {response.reason}")
+    def fetch_doc(self, docid, deadline=None, usage=None):
+        """Fetch document by ID; returns a Document or None on failure."""
+        if usage and not usage.allowed('ik'):
+            self.logger.warning(f"Not fetching document {docid}: daily IK budget of {usage.username} used up")
             return None
-        return json.loads(response.read())
-    def fetch_all_docs(self, query):
+        try:
+            return self.client.fetch_doc(docid, timeout=timeout_of(deadline),
+                                         observe=usage.ik_call if usage else None)
+        except IKError as e:
+            self.logger.warning(f"Failed to fetch document {docid}: {e}")
+            return None
+
+    def fetch_excerpts(self, doc_ids, query, deadline=None, usage=None):
+        """
+        Fetches the query-matching excerpts of all documents concurrently.
+        Excerpts are short enough to go to the LLM without summarization.
+
+        Returns:
+            list[dict]: Case dicts like summarize_cases: `docid`, `title` and
+            `summary` (the excerpts), `docid` and `skipped` if the deadline
+            cut the fetch short, or `docid` and `error`.
         """
-        Fetches all document IDs related to a query from Indian Kanoon.
+        cases = []
+        if usage and not usage.allowed('ik'):
+            return [{'docid': docid, 'error': "Your daily IK budget is used up"} for docid in doc_ids]
+        fragments = self.client.fetch_doc_fragments(doc_ids, query, timeout=timeout_of(deadline),
+                                                    observe=usage.ik_call if usage else None)
+        for docid, fragment in fragments.items():
+            if isinstance(fragment, IKError) and deadline and deadline.expired:
+                cases.append({'docid': docid, 'skipped': "Not fetched before the time limit"})
+                continue
+            if isinstance(fragment, IKError) or not fragment.headlines:
+                cases.append({'docid': docid, 'error': f"No excerpts for document ID: {docid}"})
+                continue
+            excerpts = " ... ".join(self.clean_text(h) for h in fragment.headlines)
+            cases.append({'docid': docid, 'title': self.clean_text(fragment.title) or "No Title",
+                          'summary': excerpts})
+        return cases
+
+    def iter_docids(self, query, deadline=None, usage=None):
+        """Lazily yields docids for a query, fetching at most `maxpages` pages on demand."""
+        if usage and not usage.allowed('ik'):
+            self.logger.warning(f"Not searching '{query}': daily IK budget of {usage.username} used up")
+            return
+        try:
+            for hit in self.client.iter_search(query, self.maxpages, timeout=timeout_of(deadline),
+                                               observe=usage.ik_call if usage else None):
+                if hit.tid:
+                    yield hit.tid
+        except IKError as e:
+            self.logger.error(f"Search for '{query}' failed: {e}")
+
+    def fetch_all_docs(self, query, limit=None, deadline=None, usage=None):
+        """
+        Fetches document IDs related to a query from Indian Kanoon.
         Args:
             query (str): The search query.
+            limit (int): Stop as soon as this many IDs are found, so no
+                unneeded result pages are requested.
+            deadline (Deadline): Bounds every page request.
+            usage (usage.QueryUsage): Records every page request.
         Returns:
             list: A list of document IDs (docid) matching the query.
         """
-        doc_ids = []
-        pagenum = 0
-
-        while pagenum < self.maxpages:
-            encoded_query = urllib.parse.quote_plus(query)
-            url = f'/search/?formInput={encoded_query}&pagenum={pagenum}&maxpages=1'
-            results = self.call_api(url)
-
-            if not results:
-                self.logger.warning(f"No results for query '{query}' on page {pagenum}")
-                break
-
-            try:
-                obj = json.loads(results)
-            except json.JSONDecodeError:
-                self.logger.error(f"Failed to parse results for query '{query}' on page {pagenum}")
-                break
-
-            if 'docs' not in obj or not obj['docs']:
-                break
-
-            for doc in obj['docs']:
-                docid = doc.get('tid')
-                if docid:
-                    doc_ids.append(docid)
+        return list(itertools.islice(self.iter_docids(query, deadline, usage), limit))
 
-            pagenum += 1
-
-        return doc_ids
-    
     def call_api(self, url):
-        connection = http.client.HTTPSConnection(self.basehost)
-        connection.request('POST', url, headers=self.headers)
-        response = connection.getresponse()
-        results = response.read()
-        return results
+        return self.client.call_api(url)
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     ikapi = IKApi(maxpages=5)
 
     query = "road accident cases"
-    doc_ids = ikapi.fetch_all_docs(query)
+    doc_ids = ikapi.fetch_all_docs(query, limit=2)
 
     if not doc_ids:
         print(f"No documents found for query: {query}")
     else:
         print(f"Found {len(doc_ids)} documents for query: {query}")
     
-    all_summaries = []
-
-    # Iterate through all document IDs
-    for docid in doc_ids[:2]:
-        case_details = ikapi.fetch_doc(docid)
-
-        if not case_details:
-            print(f"Failed to fetch details for document ID: {docid}")
-            continue
-
-        title = case_details.get("title", "No Title")
-        main_text = case_details.get("doc", "")
-        cleaned_text = ikapi.clean_text(main_text)
-
-        # Process chunks if text exceeds the limit
-        chunks = list(ikapi.split_text_into_chunks(cleaned_text))
-        summaries = []
-        for chunk in chunks:
-            summary = ikapi.summarize(chunk)
-            if summary:
-                summaries.append(summary)
-
-        final_summary = " ".join(summaries)
-        all_summaries.append(f"Title: {title}\nSummary: {final_summary}")
+    # Fetch, clean and summarize the documents in overlapping stages
+    cases = summarize_cases(ikapi, doc_ids[:2], prefilter=ExtractiveFilter(ratio=0.25))
+    for case in cases:
+        if 'error' in case:
+            print(case['error'])
 
     # Combine all summaries into a single text
-    combined_summary = "\n\n".join(all_summaries)
+    combined_summary = format_case_summaries(cases)
     
     print("Combined Summary of All Documents:")
     print(combined_summary)
@@ -0,0 +1,102 @@
+import json
+import re
+import time
+
+# Search results older than this are re-run on refresh; case summaries never go stale
+SEARCH_MAX_AGE = 7 * 24 * 3600
+
+# Error text that chunk summaries of older records may contain instead of a summary
+FAILED_SUMMARY = re.compile(r'(^| )Error( in summarization\.|:)')
+
+SQL_ADD_QUERY = """INSERT INTO query_history
+    (username, query, docids, summaries, answer, created_at, searched_at, answered_at, excerpts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+SQL_UPDATE_QUERY = """UPDATE query_history
+    SET docids = ?, summaries = ?, answer = ?, searched_at = ?, answered_at = ?
+    WHERE id = ? AND username = ?"""
+SQL_LIST_QUERIES = """SELECT id, query, created_at FROM query_history
+    WHERE username = ? ORDER BY created_at DESC LIMIT ?"""
+SQL_GET_QUERY = """SELECT id, query, docids, summaries, answer, created_at, searched_at, answered_at, excerpts
+    FROM query_history WHERE id = ? AND username = ?"""
+
+
+def save_query(db, username, query, docids, cases, answer, excerpts=False):
+    """
+    Stores one Analyze run: the docids used, per-case summaries (query
+    excerpts if `excerpts`) and the LLM answer.
+    """
+    now = time.time()
+    with db.transaction() as conn:
+        cursor = conn.execute(SQL_ADD_QUERY, (username, query, json.dumps(docids),
+                                              json.dumps(cases), answer, now, now, now, excerpts))
+        return cursor.lastrowid
+
+
+def list_queries(db, username, limit=20):
+    """Returns (id, query, created_at) rows for the user, newest first."""
+    return db.fetchall(SQL_LIST_QUERIES, (username, limit))
+
+
+def load_query(db, username, query_id):
+    """Returns a stored run as a dict, or None if it does not belong to the user."""
+    row = db.fetchone(SQL_GET_QUERY, (query_id, username))
+    if not row:
+        return None
+    return {
+        'id': row[0], 'query': row[1], 'docids': json.loads(row[2]),
+        'cases': json.loads(row[3] or '[]'), 'answer': row[4], 'created_at': row[5],
+        'searched_at': row[6] or row[5], 'answered_at': row[7] or row[5], 'excerpts': bool(row[8]),
+    }
+
+
+def is_stale(case):
+    """True if a stored case has no complete summary: failed, skipped, partial or with failed chunks."""
+    return ('error' in case or 'skipped' in case or case.get('partial')
+            or bool(FAILED_SUMMARY.search(case.get('summary') or '')))
+
+
+def refresh_query(db, username, record, search, summarize, answer, max_age=SEARCH_MAX_AGE):
+    """
+    Re-runs only the stale stages of a stored run and saves the result.
+
+    Args:
+        record (dict): As returned by load_query.
+        search (callable): (query, limit) -> docids; only called if the search is
+            older than max_age, with the number of docids the record has.
+        summarize (callable): docids -> list of case dicts, for docids without a good summary;
+            made the same way as the record's (see its `excerpts`).
+        answer (callable): (query, cases) -> answer text.
+
+    Returns:
+        tuple: (updated record, list of stage names that were re-run)
+    """
+    now = time.time()
+    rerun = []
+    record = dict(record)
+    docids = record['docids']
+    cases = {case['docid']: case for case in record['cases']}
+
+    if now - record['searched_at'] > max_age:
+        docids = search(record['query'], len(docids))
+        record['searched_at'] = now
+        rerun.append('search')
+
+    missing = [docid for docid in docids if docid not in cases or is_stale(cases[docid])]
+    if missing:
+        for case in summarize(missing):
+            cases[case['docid']] = case
+        rerun.append('summarize')
+
+    changed = docids != record['docids'] or bool(missing)
+    record['docids'] = docids
+    record['cases'] = [cases[docid] for docid in docids if docid in cases]
+    if changed or not record['answer'] or record['answer'].startswith("Error"):
+        record['answer'] = answer(record['query'], record['cases'])
+        record['answered_at'] = now
+        rerun.append('answer')
+
+    if rerun:
+        db.execute(SQL_UPDATE_QUERY, (json.dumps(record['docids']), json.dumps(record['cases']),
+                                      record['answer'], record['searched_at'], record['answered_at'],
+                                      record['id'], username))
+    return record, rerun
@@ -4,91 +4,91 @@ import os
 import re
 import codecs
 import json
-import http.client
-import urllib.request, urllib.parse, urllib.error
 import base64
 import glob
 import csv
 import datetime
+import time
+from array import array
+
+from ikclient import IKClient, IKError
+from segments import save_sections, segment
+
+# A failed search page is retried this often, waiting 2, 4, 8... seconds in between
+SEARCH_RETRIES = 3
+RETRY_DELAY = 2
 
 def print_usage(progname):
     print ('''python %s -t token -o offset -n limit -d datadir''' % progname)
 
 class IKApi:
-    def __init__(self, args, storage):
+    """
+    Crawler over the shared IK client; keeps responses as raw JSON bytes for storage.
+    Every IK call is recorded against `usage` (a usage.QueryUsage), if given.
+    """
+    def __init__(self, args, storage, usage=None):
         self.logger     = logging.getLogger('ikapi')
 
-        self.headers    = {'Authorization': 'Token %s' % args.token, \
-                           'Accept': 'application/json'}
-
-        self.basehost   = 'api.indiankanoon.org'
         self.storage    = storage
-        self.maxcites   = args.maxcites
-        self.maxcitedby = args.maxcitedby
-        self.orig       = args.orig
-        self.maxpages   = args.maxpages
-        self.pathbysrc  = args.pathbysrc
+        self.client     = IKClient(args.token, maxcites = getattr(args, 'maxcites', 0), \
+                                   maxcitedby = getattr(args, 'maxcitedby', 0))
+        self.maxcites   = self.client.maxcites
+        self.maxcitedby = self.client.maxcitedby
+        self.orig       = getattr(args, 'orig', False)
+        self.maxpages   = getattr(args, 'maxpages', 1) or 1
+        self.pathbysrc  = getattr(args, 'pathbysrc', False)
+        dedup_index     = getattr(args, 'dedup_index', None)
+        self.dedup      = None
+        if dedup_index:
+            # numpy is only loaded for crawls that use the index
+            from dedup import LSHIndex
+            self.dedup  = LSHIndex.open(dedup_index)
+        self.observe    = usage.ik_call if usage else None
 
         if self.maxpages > 100:
             self.maxpages = 100
 
     def call_api(self, url):
-        connection = http.client.HTTPSConnection(self.basehost)
-        connection.request('POST', url, headers = self.headers)
-        response = connection.getresponse()
-        results = response.read()
-        return results 
-    
-    def fetch_doc(self, docid):
-        url = '/doc/%d/' % docid
+        return self.client.call_api(url, observe=self.observe)
 
-        args = []
-        #if self.maxcites > 0:
-            #args.append('maxcites=%d' % self.maxcites)
-
-        #if self.maxcitedby > 0:
-            #args.append('maxcitedby=%d' % self.maxcitedby)
-
-        if args:
-            url = url + '?' + '&'.join(args)
-
-        return self.call_api(url)
+    def fetch_doc(self, docid):
+        return self.call_api(self.client.doc_url(docid))
 
     def fetch_docmeta(self, docid):
-        url = '/docmeta/%d/' % docid
-
-        args = []
-        if self.maxcites != 0:
-            args.append('maxcites=%d' % self.maxcites)
-
-        if self.maxcitedby != 0:
-            args.append('maxcitedby=%d' % self.maxcitedby)
-
-        if args:
-            url = url + '?' + '&'.join(args)
-
-        return self.call_api(url)
+        return self.call_api(self.client.docmeta_url(docid))
 
     def fetch_orig_doc(self, docid):
-        url = '/origdoc/%d/' % docid
-        return self.call_api(url)
+        return self.call_api(self.client.origdoc_url(docid))
 
     def fetch_doc_fragment(self, docid, q):
-        q   = urllib.parse.quote_plus(q.encode('utf8'))
-        url = '/docfragment/%d/?formInput=%s' % (docid,  q)
-        return self.call_api(url)
+        return self.call_api(self.client.docfragment_url(docid, q))
 
     def search(self, q, pagenum, maxpages):
-        q = urllib.parse.quote_plus(q.encode('utf8'))
-        url = '/search/?formInput=%s&pagenum=%d&maxpages=%d' % (q, pagenum, maxpages)
-        return self.call_api(url)
-
+        return self.call_api(self.client.search_url(q, pagenum, maxpages))
+
+    def search_page(self, q, pagenum):
+        """
+        One page of search results as a dict, retried on transient errors.
+        Returns None if it keeps failing, so a crawl stops cleanly and
+        keeps what it has saved so far.
+        """
+        for attempt in range(SEARCH_RETRIES):
+            if attempt:
+                time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+            try:
+                return json.loads(self.search(q, pagenum, self.maxpages))
+            except (IKError, ValueError) as e:
+                self.logger.warning('Search %s page %d failed (attempt %d): %s', q, pagenum, attempt + 1, e)
+        self.logger.error('Giving up on search %s at page %d', q, pagenum)
+        return None
 
     def save_doc_fragment(self, docid, q):
         success = False
 
-        jsonstr = self.fetch_doc_fragment(docid, q)
-        if not jsonstr:
+        try:
+            jsonstr = self.fetch_doc_fragment(docid, q)
+        except IKError as e:
+            self.logger.warning('Docfragment %s failed: %s', docid, e)
             return False
 
         jsonpath = self.storage.get_json_path('%d q: %s' % (docid, q))
@@ -100,14 +100,25 @@ class IKApi:
         orig_needed = self.orig
         jsonpath, origpath = self.storage.get_json_orig_path(docpath, docid)
 
+        if self.dedup and self.dedup.duplicate_of(docid) is not None:
+            self.logger.info('Skipping %s, near-duplicate of %s', docid, self.dedup.duplicate_of(docid))
+            return success
+
         if not self.storage.exists(jsonpath):
-            jsonstr = self.fetch_doc(docid)
-            d = json.loads(jsonstr)
+            try:
+                jsonstr = self.fetch_doc(docid)
+                d = json.loads(jsonstr)
+            except (IKError, ValueError) as e:
+                self.logger.warning('Failed to fetch doc %s: %s', docid, e)
+                return success
             if 'errmsg' in d:
                 return success
+            if self.dedup and self.dedup.add(docid, d.get('doc') or '') is not None:
+                return success
         
             self.logger.info('Saved %s', d['title'])
             self.storage.save_json(jsonstr, jsonpath)
+            save_sections(jsonpath, segment(d.get('doc') or ''))
             success = True
 
             if orig_needed:
@@ -115,9 +126,13 @@ class IKApi:
                     orig_needed = False
 
         if orig_needed and not self.storage.exists_original(origpath):
-            orig = self.fetch_orig_doc(docid)
+            try:
+                orig = self.fetch_orig_doc(docid)
+            except IKError as e:
+                self.logger.warning('Failed to fetch original %s: %s', docid, e)
+                orig = None
             if orig:
-                self.logger.info('Saved Original %s', d['title'])
+                self.logger.info('Saved Original %s', docid)
                 self.storage.save_original(orig, origpath)
         return success        
 
@@ -129,11 +144,12 @@ class IKApi:
             q += ' todate: %s' % todate
 
         pagenum = 0
-        docids = []
+        docids  = array('q')
         while 1:
-            results = self.search(q, pagenum, self.maxpages)
-            obj = json.loads(results)
- 
+            obj = self.search_page(q, pagenum)
+            if obj is None:
+                break
+
             if 'docs' not in obj or len(obj['docs']) <= 0:
                 break
             docs = obj['docs']
@@ -150,38 +166,86 @@ class IKApi:
     def save_search_results(self, q):
         datadir = self.storage.get_search_path(q)
 
-        tocwriter = self.storage.get_tocwriter(datadir)
-
         pagenum = 0
         current = 1
-        docids  = []
-        while 1:
-            results = self.search(args.q, pagenum, self.maxpages)
-            obj = json.loads(results)
-
-            docs = obj['docs']
-            if len(docs) <= 0:
-                break
-            self.logger.warning('Num results: %d, pagenum: %d', len(docs), pagenum)
-
-            for doc in docs:
-                docid = doc['tid']
-                title = doc['title']
-                toc = {'docid': docid, 'title': title, 'position': current, \
-                       'date': doc['publishdate'], 'court': doc['docsource']}
-                tocwriter.writerow(toc)
-
-                if self.pathbysrc:
-                    docpath = self.storage.get_docpath(doc['docsource'], doc['publishdate'])
-                else:    
-                    docpath = self.storage.get_docpath_by_position(datadir, current)
-                if self.download_doc(docid, docpath):
-                    docids.append(docid)
-                current += 1
-
-            pagenum += self.maxpages 
+        docids  = array('q')
+        with self.storage.get_tocwriter(datadir) as tocwriter:
+            while 1:
+                obj = self.search_page(q, pagenum)
+                if obj is None:
+                    break
+
+                docs = obj.get('docs') or []
+                if len(docs) <= 0:
+                    break
+                self.logger.warning('Num results: %d, pagenum: %d', len(docs), pagenum)
+
+                for doc in docs:
+                    docid = doc['tid']
+                    tocwriter.writerow(TocRecord(current, docid, doc['publishdate'], \
+                                                 doc['docsource'], doc['title']))
+
+                    if self.pathbysrc:
+                        docpath = self.storage.get_docpath(doc['docsource'], doc['publishdate'])
+                    else:    
+                        docpath = self.storage.get_docpath_by_position(datadir, current)
+                    if self.download_doc(docid, docpath):
+                        docids.append(docid)
+                    current += 1
+
+                pagenum += self.maxpages 
         return docids
 
+class TocRecord:
+    """One toc.csv row; slotted so a page of hits costs a few small objects."""
+    __slots__ = ('position', 'docid', 'date', 'court', 'title')
+    fieldnames = list(__slots__)
+
+    def __init__(self, position, docid, date, court, title):
+        self.position = position
+        self.docid    = docid
+        self.date     = date
+        self.court    = court
+        self.title    = title
+
+    def astuple(self):
+        return (self.position, self.docid, self.date, self.court, self.title)
+
+class TocWriter:
+    """
+    Streams TocRecords to toc.csv, holding at most `bufsize` rows in memory.
+
+    Use as a context manager so the file is flushed and closed even when the
+    crawl stops on an error.
+    """
+    def __init__(self, tocfile, bufsize = 1000):
+        self.handle  = open(tocfile, 'w', encoding = 'utf8', newline = '')
+        self.writer  = csv.writer(self.handle)
+        self.bufsize = bufsize
+        self.buffer  = []
+        self.writer.writerow(TocRecord.fieldnames)
+
+    def writerow(self, record):
+        self.buffer.append(record.astuple())
+        if len(self.buffer) >= self.bufsize:
+            self.flush()
+
+    def flush(self):
+        self.writer.writerows(self.buffer)
+        self.buffer.clear()
+        self.handle.flush()
+
+    def close(self):
+        if not self.handle.closed:
+            self.flush()
+            self.handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 def get_dateobj(datestr):
     ds = re.findall('\d+', datestr)
     return datetime.date(int(ds[0]), int(ds[1]), int(ds[2]))
@@ -272,12 +336,8 @@ class FileStorage:
         return datadir
 
     def get_tocwriter(self, datadir):
-        fieldnames = ['position', 'docid', 'date', 'court', 'title']
-        tocfile   = os.path.join(datadir, 'toc.csv')
-        tochandle = open(tocfile, 'w', encoding = 'utf8')
-        tocwriter = csv.DictWriter(tochandle, fieldnames=fieldnames)
-        tocwriter.writeheader()
-        return tocwriter
+        tocfile = os.path.join(datadir, 'toc.csv')
+        return TocWriter(tocfile)
 
     def get_docpath_by_position(self, datadir, current):
         docpath = os.path.join(datadir, '%d' % current)
@@ -323,6 +383,12 @@ def get_arg_parser():
     parser.add_argument('-P', '--pathbysrc', dest='pathbysrc', \
                         action='store_true', required = False, \
                         help='save docs by src')
+    parser.add_argument('-u', '--dedup-index', dest='dedup_index', \
+                        action='store', required = False, \
+                        help='near-duplicate index (.npz); duplicates are not saved')
+    parser.add_argument('-a', '--account', dest='account', action='store', \
+                        required = False, \
+                        help='record IK calls in the usage ledger under this user name')
     return parser
 
 logformat   = '%(asctime)s: %(name)s: %(levelname)s %(message)s'
@@ -364,8 +430,14 @@ if __name__ == '__main__':
 
     logger = logging.getLogger('ikapi')
 
+    usage = None
+    if args.account:
+        from usage import account_usage
+        crawl = args.q or (args.doctype and 'doctypes: %s' % args.doctype) or 'docid: %s' % args.docid
+        usage = account_usage(args.account, 'crawl %s' % crawl)
+
     filestorage = FileStorage(args.datadir) 
-    ikapi       = IKApi(args, filestorage)
+    ikapi       = IKApi(args, filestorage, usage)
 
     has_more = True
 
@@ -381,3 +453,6 @@ if __name__ == '__main__':
         ikapi.save_search_results(args.q)
     elif args.doctype:
         ikapi.download_doctype(args.doctype, args.fromdate, args.todate)
+
+    if ikapi.dedup:
+        ikapi.dedup.save()
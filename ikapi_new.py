@@ -1,59 +1,40 @@
 import argparse
 import logging
 import json
-import http.client
-import urllib.parse
 import os
 import codecs
 
+from ikclient import IKClient, IKError
+from usage import account_usage
+
 class IKApi:
-    def __init__(self, args, storage):
+    def __init__(self, args, storage, usage=None):
         self.logger = logging.getLogger('ikapi')
-        self.headers = {
-            'Authorization': f'Token {args.token}',
-            'Accept': 'application/json',
-            'User-Agent': 'Mozilla/5.0'  # Mimic a browser-like request
-        }
-        self.basehost = 'api.indiankanoon.org'
+        self.client = IKClient(args.token)
         self.storage = storage
         self.maxpages = min(args.maxpages, 100)  # Limit max pages to 100
+        # Every IK call is recorded against `usage` (a usage.QueryUsage), if given
+        self.observe = usage.ik_call if usage else None
 
-    def call_api(self, url, method='POST'):
-        """Calls the API with the specified URL and HTTP method, handling errors gracefully."""
-        connection = http.client.HTTPSConnection(self.basehost)
-        connection.request(method, url, headers=self.headers)
-        response = connection.getresponse()
-
-        # Check for HTTP status code
-        if response.status != 200:
-            self.logger.error(f"HTTP error {response.status}: {response.reason}")
+    def call_api(self, url):
+        """Calls the API with the specified URL, handling errors gracefully."""
+        try:
+            return self.client.call_api(url, observe=self.observe)
+        except IKError as e:
+            self.logger.error(str(e))
             return None
 
-        results = response.read()
-        connection.close()
-        return results
-
     def fetch_doc(self, docid):
         """Fetches a specific document by ID, returns title and main text if available."""
-        url = f'/doc/{docid}/'
-        json_data = self.call_api(url)
-        
-        if not json_data:
-            self.logger.warning(f"No data received for document {docid}")
-            return None
-
         try:
-            data = json.loads(json_data)
-        except json.JSONDecodeError:
-            self.logger.error(f"Failed to decode JSON for document {docid}")
+            doc = self.client.fetch_doc(docid, observe=self.observe)
+        except IKError as e:
+            self.logger.warning(f"No data received for document {docid}: {e}")
             return None
 
         # Extract title and main text if available
-        title = data.get('title', '')
-        main_text = data.get('doc', '')
-        
-        if title and main_text:
-            return {'title': title, 'text': main_text}
+        if doc.title and doc.doc:
+            return {'title': doc.title, 'text': doc.doc}
         else:
             self.logger.warning(f"Title or text missing in document {docid}")
             return None
@@ -73,27 +54,18 @@ class IKApi:
         """Downloads search results based on the query and saves documents in storage."""
         pagenum = 0
         while pagenum < self.maxpages:
-            encoded_query = urllib.parse.quote_plus(query)
-            url = f'/search/?formInput={encoded_query}&pagenum={pagenum}&maxpages=1'
-            results = self.call_api(url)
-
-            if not results:
-                self.logger.warning("No results returned for the query.")
-                break
-            
             try:
-                obj = json.loads(results)
-            except json.JSONDecodeError:
-                self.logger.error("Failed to decode JSON in search results.")
+                results = self.client.search(query, pagenum, observe=self.observe)
+            except IKError as e:
+                self.logger.error(f"Search failed: {e}")
                 break
 
             # If no docs found, exit the loop
-            if 'docs' not in obj or not obj['docs']:
+            if not results.hits:
                 self.logger.info("No more documents found.")
                 break
 
-            for doc in obj['docs']:
-                docid = doc['tid']
+            for docid in results.docids:
                 self.save_doc_text(docid)
 
             pagenum += 1
@@ -114,6 +86,7 @@ def get_arg_parser():
     parser.add_argument('-d', '--datadir', required=True, help='Directory to save files')
     parser.add_argument('-q', '--query', required=True, help='Search query for cases')
     parser.add_argument('-p', '--maxpages', type=int, default=1, help='Maximum number of search pages to download')
+    parser.add_argument('-a', '--account', help='Record IK calls in the usage ledger under this user name')
     return parser
 
 def setup_logging(loglevel='info', logfile=None):
@@ -139,6 +112,6 @@ if __name__ == '__main__':
 
     setup_logging()
     filestorage = FileStorage(args.datadir)
-    ikapi = IKApi(args, filestorage)
+    ikapi = IKApi(args, filestorage, account_usage(args.account, f"crawl {args.query}"))
 
     ikapi.download_search_results(args.query)
@@ -0,0 +1,25 @@
+"""Single client for api.indiankanoon.org shared by the CLIs and the app."""
+from .client import IKClient
+from .errors import IKAPIError, IKDecodeError, IKError, IKHTTPError, IKTransportError
+from .models import DocFragment, DocMeta, Document, OrigDoc, SearchHit, SearchResult
+from .singleflight import SingleFlight
+from .transport import DEFAULT_HOST, Transport
+
+
+def __getattr__(name):
+    """The async client is loaded on first use, so the sync CLIs never import asyncio."""
+    if name == 'AsyncIKClient':
+        from .aio import AsyncIKClient
+        return AsyncIKClient
+    if name == 'AsyncSingleFlight':
+        from .singleflight import AsyncSingleFlight
+        return AsyncSingleFlight
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = [
+    'AsyncIKClient', 'IKClient', 'Transport', 'DEFAULT_HOST',
+    'IKError', 'IKTransportError', 'IKHTTPError', 'IKAPIError', 'IKDecodeError',
+    'SingleFlight', 'AsyncSingleFlight',
+    'SearchResult', 'SearchHit', 'Document', 'DocMeta', 'DocFragment', 'OrigDoc',
+]
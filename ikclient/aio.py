@@ -0,0 +1,53 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from .client import IKClient
+from .singleflight import AsyncSingleFlight
+
+
+class AsyncIKClient:
+    """
+    asyncio facade over IKClient.
+
+    Requests run on a small thread pool, each thread holding its own pooled
+    keep-alive connection, so coroutines can fan out many calls at once.
+    Coroutines making the same call concurrently share one executor job.
+    """
+    def __init__(self, token=None, client=None, max_workers=8, **kwargs):
+        self.client = client or IKClient(token, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ikclient')
+        self.singleflight = AsyncSingleFlight()
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await self.singleflight.do((func.__name__,) + args, loop.run_in_executor,
+                                          self.executor, functools.partial(func, *args))
+
+    async def call_api(self, url):
+        return await self._run(self.client.call_api, url)
+
+    async def search(self, q, pagenum=0, maxpages=1):
+        return await self._run(self.client.search, q, pagenum, maxpages)
+
+    async def fetch_doc(self, docid, maxcites=0, maxcitedby=0):
+        return await self._run(self.client.fetch_doc, docid, maxcites, maxcitedby)
+
+    async def fetch_docmeta(self, docid, maxcites=None, maxcitedby=None):
+        return await self._run(self.client.fetch_docmeta, docid, maxcites, maxcitedby)
+
+    async def fetch_orig_doc(self, docid):
+        return await self._run(self.client.fetch_orig_doc, docid)
+
+    async def fetch_doc_fragment(self, docid, q):
+        return await self._run(self.client.fetch_doc_fragment, docid, q)
+
+    async def fetch_doc_fragments(self, docids, q):
+        """docid -> DocFragment, or the IKError raised for that docid."""
+        docids = list(docids)
+        results = await asyncio.gather(*(self.fetch_doc_fragment(docid, q) for docid in docids),
+                                       return_exceptions=True)
+        return dict(zip(docids, results))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
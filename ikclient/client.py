@@ -0,0 +1,170 @@
+import json
+import logging
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+from .errors import IKAPIError, IKDecodeError, IKError, IKHTTPError, IKTransportError
+from .models import DocFragment, DocMeta, Document, OrigDoc, SearchResult
+from .singleflight import SingleFlight
+from .transport import DEFAULT_HOST, Transport
+
+
+class IKClient:
+    """
+    Synchronous client for api.indiankanoon.org.
+
+    All requests go through one pooled Transport. Every failure is raised as
+    an IKError subclass: IKTransportError, IKHTTPError, IKAPIError (an
+    `errmsg` payload) or IKDecodeError. The `*_url` builders and `call_api`
+    give callers that store raw JSON direct access to the response bytes.
+    Concurrent identical requests are sent once and share the response.
+
+    Request methods take an optional `observe` callback, called after every
+    request with (url, status, response bytes, seconds, shared); `status`
+    is None if the request failed in transport and `shared` is True if the
+    response came from an identical request already in flight.
+    """
+    def __init__(self, token, basehost=DEFAULT_HOST, transport=None, maxcites=0, maxcitedby=0,
+                 max_workers=8):
+        self.logger = logging.getLogger('ikapi')
+        self.headers = {
+            'Authorization': f'Token {token}',
+            'Accept': 'application/json',
+            'User-Agent': 'Mozilla/5.0'
+        }
+        self.transport = transport or Transport(basehost)
+        self.maxcites = maxcites or 0
+        self.maxcitedby = maxcitedby or 0
+        self.singleflight = SingleFlight()
+        # Long-lived, so fan-outs reuse the worker threads' keep-alive connections
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ikclient')
+
+    def call_api(self, url, timeout=None, observe=None):
+        """
+        POSTs to the API and returns the raw body; raises IKHTTPError on non-200.
+        `timeout` bounds the whole call, including waiting on a coalesced one.
+        """
+        start = time.perf_counter()
+        sent = []
+
+        def send():
+            sent.append(True)
+            return self.transport.request('POST', url, self.headers, timeout)
+
+        try:
+            status, reason, body = self.singleflight.do(url, send, wait=timeout)
+        except (IKError, FuturesTimeout) as e:
+            if observe:
+                observe(url, None, 0, time.perf_counter() - start, not sent)
+            if isinstance(e, FuturesTimeout):
+                raise IKTransportError(f"POST {url} timed out after {timeout}s") from e
+            raise
+        if observe:
+            observe(url, status, len(body), time.perf_counter() - start, not sent)
+        if status != 200:
+            raise IKHTTPError(url, status, reason, body)
+        return body
+
+    def call_json(self, url, timeout=None, observe=None):
+        body = self.call_api(url, timeout, observe)
+        try:
+            obj = json.loads(body)
+        except ValueError as e:
+            raise IKDecodeError(f"Invalid JSON from {url}: {e}") from e
+        if isinstance(obj, dict) and 'errmsg' in obj:
+            raise IKAPIError(url, obj['errmsg'])
+        return obj
+
+    def search_url(self, q, pagenum=0, maxpages=1):
+        q = urllib.parse.quote_plus(q.encode('utf8'))
+        return '/search/?formInput=%s&pagenum=%d&maxpages=%d' % (q, pagenum, maxpages)
+
+    def doc_url(self, docid, maxcites=0, maxcitedby=0):
+        return self._with_cites(f'/doc/{docid}/', maxcites, maxcitedby)
+
+    def docmeta_url(self, docid, maxcites=None, maxcitedby=None):
+        maxcites = self.maxcites if maxcites is None else maxcites
+        maxcitedby = self.maxcitedby if maxcitedby is None else maxcitedby
+        return self._with_cites(f'/docmeta/{docid}/', maxcites, maxcitedby)
+
+    def origdoc_url(self, docid):
+        return f'/origdoc/{docid}/'
+
+    def docfragment_url(self, docid, q):
+        q = urllib.parse.quote_plus(q.encode('utf8'))
+        return f'/docfragment/{docid}/?formInput={q}'
+
+    def _with_cites(self, url, maxcites, maxcitedby):
+        args = []
+        if maxcites:
+            args.append('maxcites=%d' % maxcites)
+        if maxcitedby:
+            args.append('maxcitedby=%d' % maxcitedby)
+        if args:
+            url = url + '?' + '&'.join(args)
+        return url
+
+    def search(self, q, pagenum=0, maxpages=1, timeout=None, observe=None):
+        return SearchResult(self.call_json(self.search_url(q, pagenum, maxpages), timeout, observe))
+
+    def fetch_doc(self, docid, maxcites=0, maxcitedby=0, timeout=None, observe=None):
+        return Document(self.call_json(self.doc_url(docid, maxcites, maxcitedby), timeout, observe))
+
+    def iter_search(self, q, maxpages=100, prefetch_at=0.5, timeout=None, observe=None):
+        """
+        Lazily yields SearchHits, fetching result pages only as they are needed.
+
+        Once the caller has consumed `prefetch_at` of the current page, the
+        next page is requested in the background so it is usually ready when
+        needed. A caller that stops early (breaks, islice) never causes more
+        than that one extra page request. Set `prefetch_at` to None to disable.
+        `timeout` applies to each page request. Prefetches run on the client's
+        executor, so they reuse its threads' keep-alive connections.
+        """
+        pending = None
+        try:
+            for pagenum in range(maxpages):
+                result = pending.result() if pending else self.search(q, pagenum, timeout=timeout, observe=observe)
+                pending = None
+                if not result.hits:
+                    return
+
+                threshold = int(len(result.hits) * prefetch_at) if prefetch_at is not None else None
+                for n, hit in enumerate(result.hits):
+                    if n == threshold and pagenum + 1 < maxpages:
+                        pending = self.executor.submit(self.search, q, pagenum + 1, timeout=timeout,
+                                                       observe=observe)
+                    yield hit
+        finally:
+            if pending:
+                pending.cancel()
+
+    def fetch_docmeta(self, docid, maxcites=None, maxcitedby=None, timeout=None, observe=None):
+        return DocMeta(self.call_json(self.docmeta_url(docid, maxcites, maxcitedby), timeout, observe))
+
+    def fetch_orig_doc(self, docid, timeout=None, observe=None):
+        return OrigDoc(self.call_json(self.origdoc_url(docid), timeout, observe))
+
+    def fetch_doc_fragment(self, docid, q, timeout=None, observe=None):
+        return DocFragment(self.call_json(self.docfragment_url(docid, q), timeout, observe))
+
+    def fetch_doc_fragments(self, docids, q, timeout=None, observe=None):
+        """
+        Fetches the query-matching fragments of many documents concurrently
+        on the client's executor.
+
+        Returns:
+            dict: docid -> DocFragment, or the IKError raised for that docid,
+            in the order of `docids`.
+        """
+        def fetch(docid):
+            try:
+                return self.fetch_doc_fragment(docid, q, timeout, observe)
+            except IKError as e:
+                self.logger.warning(f"Docfragment {docid} failed: {e}")
+                return e
+
+        docids = list(docids)
+        return dict(zip(docids, self.executor.map(fetch, docids)))
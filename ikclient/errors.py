@@ -0,0 +1,28 @@
+class IKError(Exception):
+    """Base class for all Indian Kanoon API client errors."""
+
+
+class IKTransportError(IKError):
+    """The request could not be sent or the connection failed."""
+
+
+class IKHTTPError(IKError):
+    """The API answered with a non-200 HTTP status."""
+    def __init__(self, url, status, reason, body=b''):
+        super().__init__(f"HTTP {status} {reason} for {url}")
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+
+class IKAPIError(IKError):
+    """The API answered 200 but with an `errmsg` payload."""
+    def __init__(self, url, errmsg):
+        super().__init__(f"{errmsg} ({url})")
+        self.url = url
+        self.errmsg = errmsg
+
+
+class IKDecodeError(IKError):
+    """The response body was not valid JSON."""
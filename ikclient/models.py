@@ -0,0 +1,85 @@
+class IKResponse:
+    """Base of the typed responses; `raw` keeps the full decoded JSON."""
+    def __init__(self, raw):
+        self.raw = raw
+
+    def get(self, key, default=None):
+        return self.raw.get(key, default)
+
+    def __getitem__(self, key):
+        return self.raw[key]
+
+    def __contains__(self, key):
+        return key in self.raw
+
+
+class SearchHit(IKResponse):
+    def __init__(self, raw):
+        super().__init__(raw)
+        self.tid = raw.get('tid')
+        self.title = raw.get('title', '')
+        self.docsource = raw.get('docsource', '')
+        self.publishdate = raw.get('publishdate', '')
+        self.headline = raw.get('headline', '')
+
+
+class SearchResult(IKResponse):
+    def __init__(self, raw):
+        super().__init__(raw)
+        self.hits = [SearchHit(doc) for doc in raw.get('docs') or []]
+        self.found = raw.get('found', '')
+
+    @property
+    def docids(self):
+        return [hit.tid for hit in self.hits if hit.tid]
+
+    def __len__(self):
+        return len(self.hits)
+
+    def __iter__(self):
+        return iter(self.hits)
+
+
+class Document(IKResponse):
+    def __init__(self, raw):
+        super().__init__(raw)
+        self.tid = raw.get('tid')
+        self.title = raw.get('title', '')
+        self.doc = raw.get('doc', '')
+        self.publishdate = raw.get('publishdate', '')
+        self.docsource = raw.get('docsource', '')
+        self.courtcopy = raw.get('courtcopy', False)
+
+
+class DocMeta(IKResponse):
+    def __init__(self, raw):
+        super().__init__(raw)
+        self.tid = raw.get('tid')
+        self.title = raw.get('title', '')
+        self.citelist = raw.get('citelist') or []
+        self.citedbylist = raw.get('citedbylist') or []
+
+    @property
+    def cites(self):
+        return [c['tid'] for c in self.citelist if c.get('tid')]
+
+    @property
+    def citedby(self):
+        return [c['tid'] for c in self.citedbylist if c.get('tid')]
+
+
+class DocFragment(IKResponse):
+    def __init__(self, raw):
+        super().__init__(raw)
+        self.tid = raw.get('tid')
+        self.title = raw.get('title', '')
+        self.headlines = raw.get('headline') or []
+        if isinstance(self.headlines, str):
+            self.headlines = [self.headlines]
+
+
+class OrigDoc(IKResponse):
+    def __init__(self, raw):
+        super().__init__(raw)
+        self.content_type = raw.get('Content-Type', '')
+        self.doc = raw.get('doc', '')
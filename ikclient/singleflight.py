@@ -0,0 +1,71 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for it and get the same result or exception, or give
+    up after `wait` seconds with TimeoutError. Nothing is cached: once the
+    call returns, the next caller runs it again.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, func, *args, wait=None, **kwargs):
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is not None:
+                self.shared += 1
+                leader = False
+            else:
+                future = self.inflight[key] = Future()
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            return future.result(timeout=wait)
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.inflight[key]
+
+    def stats(self):
+        with self.lock:
+            return {'calls': self.calls, 'shared': self.shared, 'inflight': len(self.inflight)}
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop."""
+    def __init__(self):
+        self.inflight = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        import asyncio
+        task = self.inflight.get(key)
+        if task is None:
+            task = self.inflight[key] = asyncio.ensure_future(func(*args, **kwargs))
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+            self.calls += 1
+        else:
+            self.shared += 1
+        # One waiter being cancelled must not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {'calls': self.calls, 'shared': self.shared, 'inflight': len(self.inflight)}
@@ -0,0 +1,90 @@
+import http.client
+import threading
+import urllib.parse
+
+from .errors import IKTransportError
+
+DEFAULT_HOST = 'api.indiankanoon.org'
+
+
+class Transport:
+    """
+    Keep-alive HTTPS connections to the IK API, one per thread.
+
+    http.client connections are not thread-safe, so each thread gets its
+    own and reuses it for every request. A connection the server dropped
+    while idle is reopened once before the request fails.
+    """
+    def __init__(self, basehost=DEFAULT_HOST, timeout=60, use_https=True):
+        self.basehost = basehost
+        self.timeout = timeout
+        self.use_https = use_https
+        self._local = threading.local()
+
+    @classmethod
+    def from_url(cls, url, timeout=60):
+        """Transport for a base URL such as 'https://api.indiankanoon.org' or 'http://localhost:8001'."""
+        parts = urllib.parse.urlsplit(url)
+        return cls(parts.netloc, timeout=timeout, use_https=parts.scheme != 'http')
+
+    def get_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            if self.use_https:
+                connection = http.client.HTTPSConnection(self.basehost, timeout=self.timeout)
+            else:
+                connection = http.client.HTTPConnection(self.basehost, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def connect(self):
+        """Opens this thread's connection ahead of the first request."""
+        self.get_connection().connect()
+
+    def probe(self, timeout=5):
+        """
+        Checks the API host is reachable by opening and closing a new
+        connection (TCP and TLS handshake); sends no request, so costs no API call.
+        """
+        if self.use_https:
+            connection = http.client.HTTPSConnection(self.basehost, timeout=timeout)
+        else:
+            connection = http.client.HTTPConnection(self.basehost, timeout=timeout)
+        try:
+            connection.connect()
+        except OSError as e:
+            raise IKTransportError(f"Cannot connect to {self.basehost}: {e}") from e
+        finally:
+            connection.close()
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def request(self, method, url, headers, timeout=None):
+        """
+        Sends one request over the pooled connection.
+
+        Args:
+            timeout (float): Socket timeout for this request; defaults to the transport's.
+
+        Returns:
+            tuple: (status, reason, body bytes)
+        """
+        timeout = timeout or self.timeout
+        for attempt in range(2):
+            connection = self.get_connection()
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            try:
+                connection.request(method, url, headers=headers)
+                response = connection.getresponse()
+                return response.status, response.reason, response.read()
+            except (http.client.HTTPException, OSError) as e:
+                self.close()
+                # Only a dropped keep-alive connection is worth a second try, not a timeout
+                if attempt or isinstance(e, TimeoutError):
+                    raise IKTransportError(f"{method} {url} failed: {e}") from e
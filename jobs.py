@@ -0,0 +1,124 @@
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('ikapi')
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """One background run; the job function reports progress through it."""
+    def __init__(self, job_id, owner, key):
+        self.id = job_id
+        self.owner = owner
+        self.key = key
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Queued"
+        self.notes = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def report(self, progress, message):
+        if self.cancelled:
+            raise JobCancelled()
+        self.progress = progress
+        self.message = message
+
+    def note(self, message):
+        """Keeps a warning to show the user once they reattach."""
+        self.notes.append(message)
+
+
+class JobRunner:
+    """
+    Runs jobs on a thread pool and keeps a table of them per process.
+
+    Jobs outlive the Streamlit script run that started them, so a rerun or a
+    reconnecting browser finds its job again by id or by owner. Submitting a
+    job while the same owner already runs one with the same key returns the
+    running job instead of starting a duplicate.
+    """
+    def __init__(self, max_workers=4, retention=3600):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.retention = retention
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def submit(self, owner, key, func, *args, **kwargs):
+        """Starts `func(job, *args, **kwargs)` in the background and returns the Job."""
+        with self.lock:
+            self._purge()
+            for job in self.jobs.values():
+                if job.owner == owner and job.key == key and not job.finished:
+                    return job
+            job = Job(next(self.ids), owner, key)
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        if job.cancelled:
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            return
+        job.status = RUNNING
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.status = CANCELLED if job.cancelled else DONE
+            job.progress = 1.0
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            job.error = str(e)
+            job.status = FAILED
+        job.finished_at = time.time()
+
+    def _purge(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def latest(self, owner):
+        """The owner's most recent job, to reattach to after a reconnect."""
+        with self.lock:
+            owned = [job for job in self.jobs.values() if job.owner == owner]
+        return max(owned, key=lambda job: job.id) if owned else None
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job and not job.finished:
+            job.cancel_event.set()
+            job.message = "Cancelling..."
+        return job
+
+    def stats(self):
+        with self.lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
@@ -0,0 +1,378 @@
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import resource
+import shutil
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('ikapi')
+
+QUERIES = [
+    'road accident compensation', 'land dispute', 'adverse possession', 'anticipatory bail',
+    'dowry death', 'cheque bounce', 'specific performance of contract', 'motor vehicles act',
+    'domestic violence', 'service matter promotion', 'land acquisition compensation',
+    'murder conviction appeal', 'income tax reassessment', 'tenant eviction', 'custody of child',
+]
+COURTS = ['Supreme Court of India', 'Delhi High Court', 'Bombay High Court', 'Madras High Court']
+WORDS = ('the appellant respondent court held that evidence witness order appeal petition '
+         'section act compensation property claim judgment trial learned counsel submitted').split()
+
+
+class Faults:
+    """Latency and failures injected by a stub server."""
+    def __init__(self, latency=0.1, jitter=0.05, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def delay(self):
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+    def fail(self):
+        return random.random() < self.error_rate
+
+
+def _text(seed, nwords):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(nwords))
+
+
+def _judgment(docid):
+    paragraphs = [('Facts', 300), ('PetArg', 200), ('RespArg', 200), ('Precedent', 800),
+                  ('CDiscource', 600), ('Conclusion', 150)]
+    body = "".join(f'<p data-structure="{label}" id="p_{n}">{_text(docid * 10 + n, words)}</p>\n'
+                   for n, (label, words) in enumerate(paragraphs))
+    return {
+        'tid': docid, 'title': f'Case {docid} vs State on 1 January, 2010',
+        'doc': f'<h2 class="doc_title">Case {docid}</h2>\n{body}',
+        'publishdate': '2010-01-01', 'docsource': COURTS[docid % len(COURTS)],
+        'numcites': 5, 'numcitedby': 3, 'courtcopy': False,
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def _reply(self, status, obj, content_type='application/json'):
+        body = obj if isinstance(obj, bytes) else json.dumps(obj).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_POST(self):
+        stub = self.server.stub
+        stub.count()
+        stub.faults.delay()
+        if stub.faults.fail():
+            stub.count_error()
+            self._reply(500, {'error': 'Injected failure'})
+            return
+        self.handle_post()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class IKHandler(StubHandler):
+    """Indian Kanoon API: /search/, /doc/<id>/ and /docfragment/<id>/."""
+    def handle_post(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        m = re.match(r'^/(search|doc|docfragment|docmeta)/(\d*)/?$', url.path)
+        if not m:
+            self._reply(404, {'errmsg': 'Not found'})
+            return
+        endpoint, docid = m.group(1), int(m.group(2) or 0)
+        if endpoint == 'search':
+            query = params.get('formInput', [''])[0]
+            pagenum = int(params.get('pagenum', ['0'])[0])
+            # Same query, same results; different queries overlap a little
+            base = (abs(hash(query)) % 1000) * 100 + pagenum * 10
+            docs = [{'tid': base + i, 'title': _judgment(base + i)['title'],
+                     'publishdate': '2010-01-01', 'docsource': COURTS[(base + i) % len(COURTS)],
+                     'headline': _text(base + i, 30)} for i in range(10)] if pagenum < 5 else []
+            self._reply(200, {'docs': docs, 'found': '50'})
+        elif endpoint == 'doc':
+            self._reply(200, _judgment(docid))
+        elif endpoint == 'docfragment':
+            self._reply(200, {'tid': docid, 'title': _judgment(docid)['title'],
+                              'headline': [_text(docid + i, 40) for i in range(3)]})
+        else:
+            self._reply(200, {'tid': docid, 'citelist': [], 'citedbylist': []})
+
+
+class HFHandler(StubHandler):
+    """Hugging Face Inference API summarization."""
+    def handle_post(self):
+        payload = self._body()
+        self._reply(200, [{'summary_text': " ".join(str(payload.get('inputs', '')).split()[:40])}])
+
+
+class GroqHandler(StubHandler):
+    """OpenAI-compatible streaming chat completions, as served by Groq."""
+    def handle_post(self):
+        payload = self._body()
+        prompt = json.dumps(payload.get('messages', []))
+        words = _text(len(prompt), 200).split()
+        chunks = []
+        for i in range(0, len(words), 20):
+            chunk = {'id': 'chatcmpl-load', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                     'model': payload.get('model', 'stub'),
+                     'choices': [{'index': 0, 'delta': {'content': " ".join(words[i:i + 20]) + " "},
+                                  'finish_reason': None}]}
+            chunks.append(f"data: {json.dumps(chunk)}\n\n")
+        # Groq reports the billed tokens on the last chunk
+        usage = {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(words)}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        chunk = {'id': 'chatcmpl-load', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                 'model': payload.get('model', 'stub'),
+                 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                 'x_groq': {'id': 'req-load', 'usage': usage}}
+        chunks.append(f"data: {json.dumps(chunk)}\n\n")
+        chunks.append("data: [DONE]\n\n")
+        self._reply(200, "".join(chunks).encode('utf8'), 'text/event-stream')
+
+
+class StubServer:
+    """One stand-in upstream on a free local port, run on a background thread."""
+    def __init__(self, name, handler, faults):
+        self.name = name
+        self.faults = faults
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.thread = threading.Thread(target=self.server.serve_forever, name=f'stub-{name}', daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def count(self):
+        with self.lock:
+            self.requests += 1
+
+    def count_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def reset(self):
+        with self.lock:
+            counts = {'requests': self.requests, 'errors': self.errors}
+            self.requests = self.errors = 0
+        return counts
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_stubs(ik_faults, hf_faults, groq_faults):
+    """Starts the stand-in servers and points the app's settings at them."""
+    stubs = {
+        'ik': StubServer('ik', IKHandler, ik_faults),
+        'hf': StubServer('hf', HFHandler, hf_faults),
+        'groq': StubServer('groq', GroqHandler, groq_faults),
+    }
+    # Read by config.get on first use, so this must happen before the app modules run
+    os.environ.update({
+        'INDIANKANOON_API_URL': stubs['ik'].url,
+        'INDIANKANOON_API_TOKEN': 'loadtest',
+        'API_URL': stubs['hf'].url + '/',
+        'HUGGINGFACE_API_TOKEN': 'loadtest',
+        'GROQ_BASE_URL': stubs['groq'].url,
+        'GROQ_API_KEY': 'loadtest',
+    })
+    return stubs
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class VirtualUser:
+    """Logs in, types a query and presses Analyze, then polls like the page reruns do."""
+    def __init__(self, name, password, use_excerpts, budget=None, poll=0.1):
+        self.name = name
+        self.password = password
+        self.use_excerpts = use_excerpts
+        self.budget = budget
+        self.poll = poll
+
+    def login(self):
+        import db
+        from resources import get_database
+        user = db.get_user(get_database(), self.name)
+        return bool(user and user[1] == self.password and user[2])
+
+    def analyze(self, query):
+        """Returns (seconds, error message or None)."""
+        from analysis import QUERY_BUDGET, analysis_job
+        from jobs import DONE
+        from resources import get_job_runner
+
+        start = time.perf_counter()
+        runner = get_job_runner()
+        job = runner.submit(self.name, (query, self.use_excerpts), analysis_job,
+                            self.name, query, self.use_excerpts, self.budget or QUERY_BUDGET)
+        while not job.finished:
+            time.sleep(self.poll)
+        seconds = time.perf_counter() - start
+
+        if job.status != DONE:
+            return seconds, job.error or job.status
+        if not job.result:
+            return seconds, "no result"
+        _, insights = job.result
+        if insights.startswith("Error"):
+            return seconds, insights[:80]
+        if any('skipped' in case for case in job.result[0]):
+            return seconds, "cases skipped at the time limit"
+        return seconds, None
+
+
+def run_level(users, iterations, queries, stubs, distinct=False):
+    """
+    Runs every user through `iterations` Analyze rounds at once and measures
+    the level. Rounds pick their query at random, or with `distinct` each
+    round takes its own from `queries`.
+    """
+    latencies, errors = [], {}
+    lock = threading.Lock()
+
+    def session(n, user):
+        if not user.login():
+            with lock:
+                errors['login failed'] = errors.get('login failed', 0) + 1
+            return
+        for k in range(iterations):
+            seconds, error = user.analyze(queries[n * iterations + k] if distinct else random.choice(queries))
+            with lock:
+                latencies.append(seconds)
+                if error:
+                    errors[error] = errors.get(error, 0) + 1
+
+    for stub in stubs.values():
+        stub.reset()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(n, user), name=f'vu-{user.name}')
+               for n, user in enumerate(users)]
+    peak_threads = 0
+    for t in threads:
+        t.start()
+    while any(t.is_alive() for t in threads):
+        peak_threads = max(peak_threads, threading.active_count())
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF)
+
+    cpu = (after.ru_utime - usage.ru_utime) + (after.ru_stime - usage.ru_stime)
+    return {
+        'users': len(users),
+        'analyses': len(latencies),
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p90': percentile(latencies, 90),
+        'p99': percentile(latencies, 99),
+        'max': max(latencies, default=0.0),
+        'errors': sum(errors.values()),
+        'error_kinds': errors,
+        'cpu_pct': 100 * cpu / elapsed if elapsed else 0.0,
+        # Peak RSS of the whole process so far, not of this level alone
+        'peak_rss_mb': after.ru_maxrss / 1024,
+        'peak_threads': peak_threads,
+        'upstream': {name: stub.reset() for name, stub in stubs.items()},
+    }
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(
+        description='Load-test the Analyze pipeline with virtual users against stand-in IK, HF and Groq servers')
+    parser.add_argument('-c', '--concurrency', type=int, nargs='+', default=[1, 5, 10, 25, 50],
+                        help='numbers of simultaneous users to test')
+    parser.add_argument('-i', '--iterations', type=int, default=3, help='Analyze rounds per user')
+    parser.add_argument('-e', '--excerpts', action='store_true', help='use query excerpts instead of summaries')
+    parser.add_argument('--distinct', action='store_true',
+                        help='give every round its own query, each citing a different section, '
+                             'so the answer cache never hits')
+    parser.add_argument('-b', '--budget', type=float, help='per-Analyze time limit (s), default as in analysis.py')
+    parser.add_argument('--jobs', type=int, default=4, help='background job workers, as in resources.py')
+    for name, latency in (('ik', 0.15), ('hf', 0.8), ('groq', 1.5)):
+        parser.add_argument(f'--{name}-latency', type=float, default=latency, help=f'{name} mean latency (s)')
+        parser.add_argument(f'--{name}-errors', type=float, default=0.0, help=f'{name} error rate (0-1)')
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_arg_parser().parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    stubs = start_stubs(Faults(args.ik_latency, args.ik_latency / 3, args.ik_errors),
+                        Faults(args.hf_latency, args.hf_latency / 3, args.hf_errors),
+                        Faults(args.groq_latency, args.groq_latency / 3, args.groq_errors))
+
+    import db
+    from answer_cache import AnswerCache
+    from corpus import StoredCorpus
+    from dedup import LSHIndex
+    from jobs import JobRunner
+    from resources import registry
+
+    # Keep the run away from users.db, the saved dedup index and the stored judgments
+    tmpdir = tempfile.mkdtemp(prefix='loadtest-')
+    registry.register('database', lambda: db.Database(os.path.join(tmpdir, 'loadtest.db')))
+    registry.register('dedup', LSHIndex)
+    registry.register('corpus', lambda: StoredCorpus(()))
+    # In memory only, so every concurrency level starts with a cold cache
+    registry.register('answer_cache', AnswerCache)
+    registry.register('jobs', lambda: JobRunner(max_workers=args.jobs))
+
+    try:
+        database = registry.get('database')
+        users = []
+        for n in range(max(args.concurrency)):
+            db.add_user(database, f'vu{n}', 'secret', approved=True)
+            users.append(VirtualUser(f'vu{n}', 'secret', args.excerpts, args.budget))
+
+        print(f"{'users':>5} {'done':>5} {'rps':>6} {'p50 s':>6} {'p90 s':>6} {'p99 s':>6} {'max s':>6} "
+              f"{'errors':>6} {'cpu %':>6} {'peak MB':>7} {'threads':>7}  upstream requests (errors)")
+        for level in args.concurrency:
+            registry.reset('answer_cache')
+            # The cache never merges queries whose numbers differ (answer_cache.query_signature)
+            queries = [f'{QUERIES[n % len(QUERIES)]} under section {n + 1}'
+                       for n in range(level * args.iterations)] if args.distinct else QUERIES
+            r = run_level(users[:level], args.iterations, queries, stubs, args.distinct)
+            upstream = ", ".join(f"{name} {c['requests']} ({c['errors']})" for name, c in r['upstream'].items())
+            print(f"{r['users']:5d} {r['analyses']:5d} {r['throughput']:6.2f} {r['p50']:6.2f} {r['p90']:6.2f} "
+                  f"{r['p99']:6.2f} {r['max']:6.2f} {r['errors']:6d} {r['cpu_pct']:6.0f} "
+                  f"{r['peak_rss_mb']:7.0f} {r['peak_threads']:7d}  {upstream}")
+            for kind, count in r['error_kinds'].items():
+                print(f"      {count} x {kind}")
+
+        # What the accounting recorded over the whole run: where a cache would have paid off
+        print(f"\n{'service':>7} {'endpoint':<16} {'calls':>6} {'shared':>6} {'repeats':>7} {'tokens':>8}")
+        for row in registry.get('usage').report(('service', 'endpoint')):
+            print(f"{row['service']:>7} {row['endpoint']:<16} {row['calls']:6d} {row['coalesced']:6d} "
+                  f"{row['repeats']:7d} {row['tokens']:8d}")
+    finally:
+        for stub in stubs.values():
+            stub.close()
+        shutil.rmtree(tmpdir, ignore_errors=True)
@@ -0,0 +1,266 @@
+import argparse
+import hashlib
+import html
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import time
+
+logger = logging.getLogger('ikapi')
+
+# Bump when extraction changes so cached text is redone
+EXTRACTOR_VERSION = 1
+
+# Originals saved by FileStorage.save_original: <docid>_original.<ext>
+ORIGINAL = re.compile(r'^(\d+)_original\.(pdf|ps|png|html|txt)$')
+
+# A PDF page with fewer words than this is taken to be a scan and OCRed if possible
+MIN_PAGE_WORDS = 20
+
+TAG = re.compile(r'<[^>]+>')
+SCRIPT = re.compile(r'<(script|style)\b.*?</\1>', re.S | re.I)
+BREAK = re.compile(r'<(br|/p|/div|/h\d|/li|/tr|/blockquote|/pre)\b[^>]*>', re.I)
+
+
+def get_text_path(origpath):
+    """Extracted text is cached next to the original: 123_original.pdf -> 123.text.json."""
+    m = ORIGINAL.match(os.path.basename(origpath))
+    return os.path.join(os.path.dirname(origpath), f'{m.group(1)}.text.json')
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def ocr_available():
+    """True if pytesseract, Pillow and the tesseract binary are all installed."""
+    try:
+        import pytesseract  # noqa: F401
+        from PIL import Image  # noqa: F401
+    except ImportError:
+        return False
+    return shutil.which('tesseract') is not None
+
+
+def _ocr(image):
+    import pytesseract
+    return pytesseract.image_to_string(image)
+
+
+def _normalize(text):
+    lines = [re.sub(r'[ \t\f\v]+', ' ', line).strip() for line in text.splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', "\n".join(lines)).strip()
+
+
+def extract_pdf(path, ocr):
+    """Text of a PDF with pypdf; pages without a text layer are OCRed from their images."""
+    from pypdf import PdfReader
+
+    pages, scanned = [], 0
+    for page in PdfReader(path).pages:
+        text = page.extract_text() or ''
+        if len(text.split()) < MIN_PAGE_WORDS and page.images:
+            scanned += 1
+            if ocr:
+                text = "\n".join(_ocr(img.image) for img in page.images)
+        pages.append(text)
+    return "\n\n".join(pages), {'pages': len(pages), 'scanned_pages': scanned}
+
+
+def extract_image(path, ocr):
+    if not ocr:
+        return '', {'scanned_pages': 1}
+    from PIL import Image
+    with Image.open(path) as image:
+        return _ocr(image), {'scanned_pages': 1}
+
+
+def extract_ps(path, ocr):
+    """PostScript has no pure-Python reader; ghostscript's ps2ascii is used if installed."""
+    if not shutil.which('ps2ascii'):
+        raise RuntimeError("ps2ascii (ghostscript) is not installed")
+    result = subprocess.run(['ps2ascii', path], capture_output=True, check=True)
+    return result.stdout.decode('utf8', errors='replace'), {}
+
+
+def extract_html(path, ocr):
+    with open(path, 'rb') as f:
+        doc = f.read().decode('utf8', errors='replace')
+    doc = BREAK.sub('\n\n', SCRIPT.sub(' ', doc))
+    return html.unescape(TAG.sub(' ', doc)), {}
+
+
+def extract_txt(path, ocr):
+    with open(path, 'rb') as f:
+        return f.read().decode('utf8', errors='replace'), {}
+
+
+EXTRACTORS = {
+    'pdf': extract_pdf,
+    'png': extract_image,
+    'ps': extract_ps,
+    'html': extract_html,
+    'txt': extract_txt,
+}
+
+
+def load_cached(origpath):
+    """The cached extraction record for an original, or None."""
+    textpath = get_text_path(origpath)
+    if not os.path.exists(textpath):
+        return None
+    try:
+        with open(textpath, encoding='utf8') as f:
+            return json.load(f)
+    except ValueError as e:
+        logger.warning(f"Ignoring bad text cache {textpath}: {e}")
+        return None
+
+
+def is_done(origpath, ocr):
+    """
+    True if the cached text is for this exact file. The hash is only
+    computed when size or mtime changed since the extraction. Text that
+    is missing scanned pages is redone once OCR becomes available.
+    """
+    cached = load_cached(origpath)
+    if not cached or cached.get('version') != EXTRACTOR_VERSION:
+        return False
+    if ocr and cached.get('scanned_pages') and not cached.get('ocr'):
+        return False
+    st = os.stat(origpath)
+    if cached.get('size') == st.st_size and cached.get('mtime') == st.st_mtime:
+        return True
+    return cached.get('sha256') == file_hash(origpath)
+
+
+def find_originals(datadirs, force=False, ocr=False):
+    """Paths of stored originals under `datadirs` without up-to-date extracted text."""
+    paths = []
+    for datadir in datadirs:
+        for dirpath, _, filenames in os.walk(datadir):
+            for filename in filenames:
+                if ORIGINAL.match(filename):
+                    path = os.path.join(dirpath, filename)
+                    if force or not is_done(path, ocr):
+                        paths.append(path)
+    return sorted(paths)
+
+
+def extract_file(path, ocr=False):
+    """
+    Extracts the text of one original and writes its cache file.
+
+    Returns:
+        tuple: (path, words extracted, seconds, error message or None)
+    """
+    start = time.perf_counter()
+    try:
+        st = os.stat(path)
+        digest = file_hash(path)
+        extension = ORIGINAL.match(os.path.basename(path)).group(2)
+        text, info = EXTRACTORS[extension](path, ocr)
+        text = _normalize(text)
+
+        record = {'version': EXTRACTOR_VERSION, 'sha256': digest, 'size': st.st_size,
+                  'mtime': st.st_mtime, 'format': extension, 'ocr': ocr,
+                  'words': len(text.split()), 'created_at': time.time(), **info, 'text': text}
+        textpath = get_text_path(path)
+        tmppath = f'{textpath}.{os.getpid()}.tmp'
+        with open(tmppath, 'w', encoding='utf8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmppath, textpath)
+        return path, record['words'], time.perf_counter() - start, None
+    except Exception as e:
+        # Originals are whatever the courts uploaded; one bad file must not stop the run
+        return path, 0, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+
+def _extract_file(args):
+    return extract_file(*args)
+
+
+def extract_corpus(paths, workers=None, ocr=False, report_every=50):
+    """
+    Extracts the text of `paths` on a pool of worker processes.
+
+    Returns:
+        dict: Counts of done and failed originals, words and files/sec.
+    """
+    stats = {'done': 0, 'failed': 0, 'words': 0}
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers or os.cpu_count()) as pool:
+        for n, (path, nwords, seconds, error) in enumerate(
+                pool.imap_unordered(_extract_file, [(path, ocr) for path in paths]), start=1):
+            if error:
+                stats['failed'] += 1
+                logger.warning(f"Failed to extract {path}: {error}")
+            else:
+                stats['done'] += 1
+                stats['words'] += nwords
+            if n % report_every == 0 or n == len(paths):
+                elapsed = time.perf_counter() - start
+                logger.info(f"{n}/{len(paths)} originals, {n / elapsed:.2f} files/s, "
+                            f"{stats['failed']} failed")
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['files_per_s'] = len(paths) / stats['seconds'] if paths else 0.0
+    return stats
+
+
+def get_original_text_path(jsonpath):
+    """The extracted-text file for a stored judgment: 123.json -> 123.text.json."""
+    docid = re.match(r'^(\d+)', os.path.basename(jsonpath)).group(1)
+    return os.path.join(os.path.dirname(jsonpath), f'{docid}.text.json')
+
+
+def load_original_text(jsonpath):
+    """
+    Extracted text of the original court copy of a stored judgment
+    (123.json), or None if it has not been extracted.
+    """
+    textpath = get_original_text_path(jsonpath)
+    if not os.path.exists(textpath):
+        return None
+    with open(textpath, encoding='utf8') as f:
+        return json.load(f).get('text') or None
+
+
+def text_to_html(text):
+    """Wraps plain text paragraphs in <p> tags, so it can be segmented like IK's HTML."""
+    paragraphs = [p for p in re.split(r'\n\s*\n', text) if p.strip()]
+    return "\n".join(f'<p>{html.escape(p)}</p>' for p in paragraphs)
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(description='Extract text from stored original court copies into .text.json files')
+    parser.add_argument('-d', '--datadirs', nargs='+', default=['results', 'Data'],
+                        help='storage directories to walk')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--no-ocr', action='store_true', help='do not OCR scanned pages even if tesseract is installed')
+    parser.add_argument('-n', '--limit', type=int, help='extract at most this many originals')
+    parser.add_argument('-f', '--force', action='store_true', help='redo originals already extracted')
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_arg_parser().parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    ocr = not args.no_ocr and ocr_available()
+    if not ocr and not args.no_ocr:
+        logger.info("OCR unavailable (needs pytesseract, Pillow and tesseract); scanned pages are skipped")
+    paths = find_originals(args.datadirs, args.force, ocr)[:args.limit]
+    logger.info(f"{len(paths)} originals to extract with {args.workers} workers")
+    if paths:
+        stats = extract_corpus(paths, args.workers, ocr)
+        logger.info(f"Extracted {stats['done']} originals ({stats['failed']} failed), "
+                    f"{stats['words']} words in {stats['seconds']:.1f}s: {stats['files_per_s']:.2f} files/s")
@@ -0,0 +1,340 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from dedup import DuplicateFilter
+from segments import select_sections
+
+logger = logging.getLogger('ikapi')
+
+_DONE = object()
+
+
+class Stage:
+    """A pipeline stage: a function applied to every item by `workers` threads.
+
+    The function receives one item and returns an iterable of output items,
+    so a stage can drop an item (return nothing) or fan it out (e.g. one
+    document into many chunks).
+    """
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+
+
+class StagePools:
+    """
+    Long-lived worker threads per stage name, shared by Pipeline runs.
+
+    A thread outlives the run that started it, so what it keeps per thread
+    (the IK Transport's keep-alive connection) is reused by the next run.
+    Idle threads are reused first. A new one is started while fewer than
+    `max_workers` run, so concurrent runs do not wait on each other's stages.
+    """
+    def __init__(self, max_workers=64):
+        self.max_workers = max_workers
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        with self.lock:
+            if name not in self.pools:
+                self.pools[name] = ThreadPoolExecutor(self.max_workers, thread_name_prefix=f'stage-{name}')
+            return self.pools[name]
+
+    def shutdown(self):
+        with self.lock:
+            for pool in self.pools.values():
+                pool.shutdown(wait=True)
+            self.pools.clear()
+
+
+class Pipeline:
+    """
+    Runs items through a sequence of stages connected by bounded queues.
+
+    Every stage has its own pool of worker threads, so while one stage is
+    waiting on the network the next one keeps working on earlier items.
+    End-to-end latency approaches that of the slowest stage instead of the
+    sum of all of them. Workers run on `pools` (a StagePools) if given, so
+    their threads survive the run; otherwise on pools private to each run.
+    """
+    def __init__(self, stages, maxsize=8, pools=None):
+        self.stages = stages
+        self.maxsize = maxsize
+        self.pools = pools
+
+    def _put(self, q, item, stop):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self, items, cancel=None, deadline=None):
+        """
+        Feeds `items` through all stages.
+        Setting the `cancel` event, or the `deadline` expiring, stops all
+        stages after their current item.
+
+        Yields:
+            Items emitted by the last stage, in completion order.
+        """
+        queues = [queue.Queue(self.maxsize) for _ in range(len(self.stages) + 1)]
+        stop = threading.Event()
+        pools = self.pools or StagePools()
+        workers = []
+
+        def feed():
+            for item in items:
+                if not self._put(queues[0], item, stop):
+                    return
+            for _ in range(self.stages[0].workers):
+                self._put(queues[0], _DONE, stop)
+
+        for i, stage in enumerate(self.stages):
+            inq, outq = queues[i], queues[i + 1]
+            if i + 1 < len(self.stages):
+                downstream = self.stages[i + 1].workers
+            else:
+                downstream = 1
+            remaining = [stage.workers]
+            lock = threading.Lock()
+
+            def work(stage=stage, inq=inq, outq=outq, downstream=downstream,
+                     remaining=remaining, lock=lock):
+                while not stop.is_set():
+                    try:
+                        item = inq.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    if item is _DONE:
+                        break
+                    try:
+                        for out in stage.func(item):
+                            self._put(outq, out, stop)
+                    except Exception as e:
+                        logger.error(f"Pipeline stage '{stage.name}' failed: {e}")
+                        # Pass the item on as failed so its case is reported, not lost;
+                        # a chunk keeps its document's chunk count so the case still completes
+                        if isinstance(item, dict):
+                            item['error'] = f"Processing failed in stage '{stage.name}': {e}"
+                            item.setdefault('nchunks', 0)
+                            self._put(outq, item, stop)
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    for _ in range(downstream):
+                        self._put(outq, _DONE, stop)
+
+            workers += [(stage.name, work)] * stage.workers
+        workers.append(('feed', feed))
+        futures = [pools.get(name).submit(func) for name, func in workers]
+
+        try:
+            while not (cancel and cancel.is_set()) and not (deadline and deadline.expired):
+                try:
+                    item = queues[-1].get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            stop.set()
+            wait(futures)
+            if pools is not self.pools:
+                pools.shutdown()
+
+
+def build_case_stages(ikapi, fetch_workers=2, clean_workers=1, summarize_workers=2,
+                      prefilter=None, dedup=None, sections=None, deadline=None, usage=None,
+                      corpus=None):
+    """
+    Returns the fetch, clean/chunk and summarize stages for a list of docids.
+    Judgments in `corpus` (a corpus.StoredCorpus) are read from disk with
+    their cached section offsets instead of being fetched, and those
+    batch_summarize.py already summarized are not summarized again.
+    `dedup` (a dedup.DuplicateFilter) drops near-duplicates before chunking,
+    `sections` keeps only those judgment sections (see segments.py) and
+    `prefilter`, if given, shrinks the cleaned text before it is chunked.
+    Past `deadline`, documents and chunks are passed through marked `skipped`.
+    Upstream calls are recorded against `usage` (a usage.QueryUsage), if given.
+    """
+    def fetch(item):
+        if deadline and deadline.expired:
+            item['skipped'] = "Not fetched before the time limit"
+            yield item
+            return
+        summary = corpus.summary(item['docid']) if corpus else None
+        if summary:
+            item['title'] = summary.get('title') or "No Title"
+            item['summary'] = summary['summary']
+            yield item
+            return
+        stored = corpus.load(item['docid']) if corpus else None
+        if stored and stored[1].strip():
+            item['title'], item['text'], item['sections'] = stored
+            item['title'] = item['title'] or "No Title"
+            yield item
+            return
+        case_details = ikapi.fetch_doc(item['docid'], deadline=deadline, usage=usage)
+        if not case_details and deadline and deadline.expired:
+            item['skipped'] = "Not fetched before the time limit"
+        elif not case_details:
+            item['error'] = f"Failed to fetch details for document ID: {item['docid']}"
+        else:
+            item['title'] = case_details.get("title", "No Title")
+            item['text'] = case_details.get("doc", "")
+        yield item
+
+    def clean(item):
+        if 'error' in item or 'skipped' in item or 'summary' in item:
+            item['nchunks'] = 0
+            yield item
+            return
+        text = item.pop('text')
+        offsets = item.pop('sections', None)
+        if dedup:
+            original = dedup.check(item['docid'], text)
+            if original is not None:
+                item['duplicate_of'] = original
+                item['nchunks'] = 0
+                yield item
+                return
+        if sections:
+            text = select_sections(text, sections, offsets)
+        cleaned_text = ikapi.clean_text(text)
+        if prefilter:
+            cleaned_text = prefilter(cleaned_text)
+        chunks = list(ikapi.split_text_into_chunks(cleaned_text))
+        item['nchunks'] = len(chunks)
+        if not chunks:
+            yield item
+        for n, chunk in enumerate(chunks):
+            yield dict(item, chunk_no=n, chunk=chunk)
+
+    def summarize(item):
+        if 'chunk' in item:
+            chunk = item.pop('chunk')
+            if deadline and deadline.expired:
+                item['skipped'] = "Not summarized before the time limit"
+            else:
+                summary = ikapi.summarize(chunk, deadline=deadline, usage=usage)
+                if deadline and deadline.expired and summary.startswith("Error"):
+                    item['skipped'] = "Not summarized before the time limit"
+                elif summary.startswith("Error"):
+                    # Kept out of the summary text; the case comes back partial or as an error
+                    item['error'] = summary
+                else:
+                    item['summary'] = summary
+        yield item
+
+    return [
+        Stage('fetch', fetch, fetch_workers),
+        Stage('clean', clean, clean_workers),
+        Stage('summarize', summarize, summarize_workers),
+    ]
+
+
+def summarize_cases(ikapi, doc_ids, fetch_workers=2, clean_workers=1,
+                    summarize_workers=2, maxsize=8, on_case=None, prefilter=None,
+                    dedup=None, sections=None, cancel=None, deadline=None, usage=None,
+                    corpus=None, pools=None):
+    """
+    Fetches, cleans and summarizes documents with overlapping stages.
+
+    Args:
+        ikapi (IKApi): Client providing fetch_doc, clean_text,
+            split_text_into_chunks and summarize.
+        doc_ids (list): Document IDs to process.
+        on_case (callable): Called with each case dict as soon as all of
+            its chunks are summarized.
+        prefilter (callable): Optional text -> text reduction applied before
+            chunking, e.g. `extractive.ExtractiveFilter`.
+        dedup (dedup.LSHIndex): Optional near-duplicate index; a document
+            that duplicates an earlier one in `doc_ids` is not summarized.
+        sections (tuple): Summarize only these judgment sections, e.g.
+            segments.DEFAULT_SECTIONS; short or unsegmented judgments are
+            used whole.
+        corpus (corpus.StoredCorpus): Judgments stored locally; these are
+            not fetched from IK, and their stored summaries are used as is.
+        pools (StagePools): Long-lived stage threads to run on, so IK
+            connections are kept from one run to the next.
+        cancel (threading.Event): Stops the run early; cases finished so far
+            are still returned.
+        deadline (deadline.Deadline): Bounds the run and every call in it.
+            Cases not finished in time come back marked `skipped`; one with
+            only some chunks summarized keeps those and is marked `partial`.
+        usage (usage.QueryUsage): Records every IK and HF call and stops
+            making them once the user's daily budget is spent.
+
+    Returns:
+        list[dict]: One dict per docid (per finished docid after a cancel),
+        in input order, with keys `docid`, `title` and `summary`, `docid`,
+        `title` and `duplicate_of`, `docid` and `skipped`, or `docid` and
+        `error`.
+    """
+    if dedup is not None:
+        dedup = DuplicateFilter(dedup)
+    stages = build_case_stages(ikapi, fetch_workers, clean_workers, summarize_workers,
+                               prefilter, dedup, sections, deadline, usage, corpus)
+    items = ({'index': i, 'docid': docid} for i, docid in enumerate(doc_ids))
+
+    parts = {}
+    cases = {}
+    for item in Pipeline(stages, maxsize, pools).run(items, cancel, deadline):
+        index = item['index']
+        parts.setdefault(index, []).append(item)
+        if len(parts[index]) < max(item.get('nchunks', 0), 1):
+            continue
+
+        case = _make_case(parts.pop(index))
+        cases[index] = case
+        if on_case:
+            on_case(case)
+
+    if deadline and deadline.expired:
+        # Whatever the pipeline had not finished when time ran out
+        for index, docid in enumerate(doc_ids):
+            if index not in cases:
+                cases[index] = _make_case(parts.pop(index, []), docid)
+                if on_case:
+                    on_case(cases[index])
+
+    return [cases[i] for i in sorted(cases)]
+
+
+def _make_case(chunks, docid=None):
+    """Folds the chunk items of one document into its case dict."""
+    if not chunks:
+        return {'docid': docid, 'skipped': "Not processed before the time limit"}
+    chunks = sorted(chunks, key=lambda p: p.get('chunk_no', 0))
+    item = chunks[0]
+    if 'error' in item and 'chunk_no' not in item:
+        return {'docid': item['docid'], 'error': item['error']}
+    if 'duplicate_of' in item:
+        return {'docid': item['docid'], 'title': item['title'], 'duplicate_of': item['duplicate_of']}
+
+    summaries = [p['summary'] for p in chunks if p.get('summary')]
+    failed = [p for p in chunks if 'error' in p]
+    if not summaries and failed:
+        return {'docid': item['docid'], 'error': failed[0]['error']}
+    if not summaries and ('skipped' in item or item.get('nchunks')):
+        return {'docid': item['docid'], 'title': item.get('title'),
+                'skipped': item.get('skipped') or "Not summarized before the time limit"}
+    case = {'docid': item['docid'], 'title': item['title'], 'summary': " ".join(summaries)}
+    if len(chunks) < max(item['nchunks'], 1) or any('skipped' in p or 'error' in p for p in chunks):
+        case['partial'] = True
+    return case
+
+
+def format_case_summaries(cases):
+    """Joins summarized cases into the prompt text used by query_ai_model."""
+    return "\n\n".join(f"Title: {case['title']}\nSummary: {case['summary']}"
+                       for case in cases if 'summary' in case)
@@ -0,0 +1,239 @@
+import logging
+import threading
+
+logger = logging.getLogger('ikapi')
+
+
+class Resource:
+    """A process-wide object created on first use and shared afterwards."""
+    def __init__(self, name, factory, health_check=None, warm_up=None):
+        self.name = name
+        self.factory = factory
+        self.health_check = health_check
+        self.warm_up = warm_up
+        self.instance = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.instance is None:
+            with self.lock:
+                if self.instance is None:
+                    logger.info(f"Initializing shared resource '{self.name}'")
+                    self.instance = self.factory()
+        return self.instance
+
+    def reset(self):
+        with self.lock:
+            self.instance = None
+
+
+class ResourceRegistry:
+    """
+    Lazily creates and shares expensive objects (models, API clients).
+
+    Streamlit re-executes the app script on every rerun and for every session,
+    but imported modules live for the whole process, so everything held here
+    is initialized once per process.
+    """
+    def __init__(self):
+        self.resources = {}
+
+    def register(self, name, factory, health_check=None, warm_up=None):
+        self.resources[name] = Resource(name, factory, health_check, warm_up)
+
+    def get(self, name):
+        return self.resources[name].get()
+
+    def is_loaded(self, name):
+        return self.resources[name].instance is not None
+
+    def reset(self, name):
+        self.resources[name].reset()
+
+    def health(self, names=None):
+        """
+        Runs the health check of every loaded resource.
+
+        Returns:
+            dict: name -> 'ok', 'not loaded' or an error message.
+        """
+        status = {}
+        for name in names or self.resources:
+            resource = self.resources[name]
+            if resource.instance is None:
+                status[name] = 'not loaded'
+                continue
+            try:
+                if resource.health_check:
+                    resource.health_check(resource.instance)
+                status[name] = 'ok'
+            except Exception as e:
+                logger.error(f"Health check failed for '{name}': {e}")
+                status[name] = f"error: {e}"
+        return status
+
+    def warm_up(self, names=None, background=False):
+        """
+        Creates the given resources (all by default) and runs their warm-up
+        hooks so the first user request does not pay for initialization.
+        """
+        def run():
+            for name in names or self.resources:
+                resource = self.resources[name]
+                try:
+                    instance = resource.get()
+                    if resource.warm_up:
+                        resource.warm_up(instance)
+                except Exception as e:
+                    logger.error(f"Warm-up failed for '{name}': {e}")
+
+        if background:
+            thread = threading.Thread(target=run, name='warm-up', daemon=True)
+            thread.start()
+            return thread
+        run()
+
+
+def _create_ikapi():
+    from fetch_case_data_and_summarize import IKApi
+    return IKApi(maxpages=5)
+
+
+def _check_ikapi(ikapi):
+    # A search would be billed; reaching the host is enough to tell it is up
+    ikapi.client.transport.probe()
+
+
+def _create_groq_client():
+    from groq import Groq
+    import config
+    return Groq(api_key=config.get('GROQ_API_KEY'), base_url=config.get('GROQ_BASE_URL') or None)
+
+
+def _check_groq_client(client):
+    client.models.list()
+
+
+def _create_summarizer():
+    import config
+    from summarization_workflow import Summarizer
+    return Summarizer(backend=config.get('SUMMARIZER_BACKEND'))
+
+
+def _check_summarizer(summarizer):
+    if summarizer.summarize("The court dismissed the appeal.", max_length=20, min_length=5) \
+            == "Error in summarization.":
+        raise RuntimeError("summarizer returned an error")
+
+
+def _create_answer_cache():
+    from answer_cache import AnswerCache
+    return AnswerCache(db=get_database())
+
+
+def _create_dedup_index():
+    from dedup import LSHIndex
+    # Bounded, and written in the background rather than after each Analyze
+    index = LSHIndex.open("dedup_index.npz", max_docs=200000)
+    index.autosave()
+    return index
+
+
+def _create_citation_graph():
+    import os
+    from citation_graph import CitationGraph
+    # Built by citation_graph.py; an empty graph just adds no neighbours
+    path = "citation_graph.npz"
+    return CitationGraph.load(path) if os.path.exists(path) else CitationGraph.from_edges([])
+
+
+def _create_corpus():
+    from corpus import StoredCorpus
+    return StoredCorpus(('results', 'Data'))
+
+
+def _create_stage_pools():
+    from pipeline import StagePools
+    return StagePools()
+
+
+def _create_database():
+    from db import Database
+    return Database("users.db")
+
+
+def _check_database(database):
+    database.fetchone("SELECT 1")
+
+
+def _create_usage_ledger():
+    import config
+    from usage import UsageLedger
+    return UsageLedger(get_database(), budgets={
+        'ik': int(config.get('USAGE_BUDGET_IK_CALLS')),
+        'hf': int(config.get('USAGE_BUDGET_HF_CALLS')),
+        'groq': int(config.get('USAGE_BUDGET_LLM_TOKENS')),
+    })
+
+
+def _create_job_runner():
+    from jobs import JobRunner
+    return JobRunner(max_workers=4)
+
+
+registry = ResourceRegistry()
+registry.register('ikapi', _create_ikapi, _check_ikapi)
+registry.register('groq', _create_groq_client, _check_groq_client)
+registry.register('summarizer', _create_summarizer, _check_summarizer, _check_summarizer)
+registry.register('answer_cache', _create_answer_cache)
+registry.register('dedup', _create_dedup_index)
+registry.register('citation_graph', _create_citation_graph)
+registry.register('corpus', _create_corpus)
+registry.register('stage_pools', _create_stage_pools)
+registry.register('database', _create_database, _check_database)
+registry.register('usage', _create_usage_ledger)
+registry.register('jobs', _create_job_runner)
+
+
+def get_ikapi():
+    return registry.get('ikapi')
+
+
+def get_groq_client():
+    return registry.get('groq')
+
+
+def get_summarizer():
+    return registry.get('summarizer')
+
+
+def get_answer_cache():
+    return registry.get('answer_cache')
+
+
+def get_dedup_index():
+    return registry.get('dedup')
+
+
+def get_citation_graph():
+    return registry.get('citation_graph')
+
+
+def get_corpus():
+    return registry.get('corpus')
+
+
+def get_stage_pools():
+    return registry.get('stage_pools')
+
+
+def get_database():
+    return registry.get('database')
+
+
+def get_usage_ledger():
+    return registry.get('usage')
+
+
+def get_job_runner():
+    return registry.get('jobs')
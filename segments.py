@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+import re
+
+from originals import get_original_text_path, load_original_text, text_to_html
+
+logger = logging.getLogger('ikapi')
+
+# Bump when segmentation changes so cached offsets are recomputed
+SEGMENTER_VERSION = 1
+
+# Section offsets are cached here, not next to the judgments, which may be read-only fixtures
+SECTIONS_CACHE_DIR = os.path.join('cache', 'sections')
+
+# IK marks judgment paragraphs with data-structure="..."; these map to our sections
+STRUCTURE_LABELS = {
+    'Facts': 'facts',
+    'Issue': 'issue',
+    'PetArg': 'arguments',
+    'RespArg': 'arguments',
+    'Section': 'analysis',
+    'Precedent': 'analysis',
+    'CDiscource': 'analysis',
+    'Conclusion': 'held',
+}
+SECTIONS = ('header', 'facts', 'issue', 'arguments', 'analysis', 'held', 'body')
+
+# What summaries are built from by default: what happened and what was decided
+DEFAULT_SECTIONS = ('facts', 'held')
+
+BLOCK = re.compile(r'<(p|blockquote|pre|h2|h3)\b([^>]*)>.*?</\1>', re.S | re.I)
+STRUCTURE = re.compile(r'data-structure="([^"]*)"')
+TAG = re.compile(r'<[^>]+>')
+HELD_START = re.compile(r'^\s*(in the result|in view of the (above|foregoing)|for the (foregoing|aforesaid)'
+                        r'|for (these|the above) reasons|accordingly|we,? therefore|consequently'
+                        r'|the (appeal|petition|writ petition)s? (is|are) (accordingly )?(allowed|dismissed))',
+                        re.I)
+
+
+def _clean(html):
+    return re.sub(r'\s+', ' ', TAG.sub(' ', html)).strip()
+
+
+def _merge(blocks):
+    """Joins consecutive (label, start, end) blocks with the same label into sections."""
+    sections = []
+    for label, start, end in blocks:
+        if sections and sections[-1][0] == label:
+            sections[-1][2] = end
+        else:
+            sections.append([label, start, end])
+    return [tuple(s) for s in sections]
+
+
+def segment(html):
+    """
+    Splits a judgment's HTML into labelled sections.
+
+    Paragraphs IK has tagged with a data-structure role are labelled from
+    it; untagged paragraphs take the label of the paragraph before them.
+    Judgments without any tags are split into header, body and held, the
+    last starting at the first closing formula ("In the result, ...") in
+    the final third of the judgment.
+
+    Returns:
+        list[tuple]: (label, start, end) character offsets into `html`.
+    """
+    blocks = [(m.start(), m.end(), m.group(1).lower(), m.group(2)) for m in BLOCK.finditer(html)]
+    if not blocks:
+        return [('body', 0, len(html))] if html.strip() else []
+
+    labelled = []
+    if any(STRUCTURE.search(attrs) for _, _, _, attrs in blocks):
+        label = 'header'
+        for start, end, _, attrs in blocks:
+            m = STRUCTURE.search(attrs)
+            if m:
+                label = STRUCTURE_LABELS.get(m.group(1), 'body')
+            labelled.append((label, start, end))
+        return _merge(labelled)
+
+    # Title, citations, bench and the case details block come before the first paragraph
+    body_start = next((i for i, block in enumerate(blocks) if block[2] in ('p', 'blockquote')),
+                      len(blocks))
+    held_start = len(blocks)
+    for i in range(max(body_start, 2 * len(blocks) // 3), len(blocks)):
+        if HELD_START.match(_clean(html[blocks[i][0]:blocks[i][1]])):
+            held_start = i
+            break
+    for i, (start, end, _, _) in enumerate(blocks):
+        label = 'header' if i < body_start else 'held' if i >= held_start else 'body'
+        labelled.append((label, start, end))
+    return _merge(labelled)
+
+
+def extract(html, sections, labels=DEFAULT_SECTIONS):
+    """Plain text of the sections with the given labels, in document order."""
+    return " ".join(_clean(html[start:end]) for label, start, end in sections if label in labels)
+
+
+def select_sections(html, labels=DEFAULT_SECTIONS, sections=None, min_words=200):
+    """
+    Plain text of the wanted sections, or of the whole judgment if those
+    sections are missing or shorter than `min_words` words. Pass the
+    offsets from load_sections as `sections` for a stored judgment, so it
+    is not segmented again.
+    """
+    if sections is None:
+        sections = segment(html)
+    text = extract(html, sections, labels)
+    if len(text.split()) < min_words:
+        return _clean(html)
+    return text
+
+
+def get_sections_path(jsonpath, cache_dir=SECTIONS_CACHE_DIR):
+    """
+    Where the offsets of a stored judgment are cached:
+    Data/.../123.json -> cache/sections/123-<hash of its path>.sections.json.
+    """
+    name = re.sub(r'\.json$', '', os.path.basename(jsonpath))
+    digest = hashlib.sha1(os.path.abspath(jsonpath).encode('utf8')).hexdigest()[:12]
+    return os.path.join(cache_dir, f'{name}-{digest}.sections.json')
+
+
+def save_sections(jsonpath, sections, cache_dir=SECTIONS_CACHE_DIR):
+    """Caches the offsets; a cache that cannot be written is skipped, not an error."""
+    path = get_sections_path(jsonpath, cache_dir)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmppath = f'{path}.{os.getpid()}.tmp'
+        with open(tmppath, 'w', encoding='utf8') as f:
+            json.dump({'version': SEGMENTER_VERSION, 'sections': sections}, f)
+        os.replace(tmppath, path)
+    except OSError as e:
+        logger.warning(f"Could not cache section offsets in {path}: {e}")
+
+
+def load_sections(jsonpath, cache_dir=SECTIONS_CACHE_DIR):
+    """
+    Section offsets of a stored judgment, segmenting it on first use.
+
+    Judgments IK has no text for fall back to the text extracted from
+    their original court copy, if any. The cache is recomputed if it
+    predates either source or the segmenter version.
+
+    Returns:
+        tuple: (title, html, sections)
+    """
+    with open(jsonpath, encoding='utf8') as f:
+        obj = json.load(f)
+    # ikapi_new.py's summary input files keep the judgment under 'text'
+    title, html = obj.get('title'), obj.get('doc') or obj.get('text') or ''
+    sources = [jsonpath]
+    if not html.strip():
+        html = text_to_html(load_original_text(jsonpath) or '')
+        sources.append(get_original_text_path(jsonpath))
+
+    path = get_sections_path(jsonpath, cache_dir)
+    if os.path.exists(path) and all(os.path.getmtime(path) >= os.path.getmtime(source)
+                                    for source in sources if os.path.exists(source)):
+        try:
+            with open(path, encoding='utf8') as f:
+                cached = json.load(f)
+            if cached.get('version') == SEGMENTER_VERSION:
+                return title, html, [tuple(s) for s in cached['sections']]
+        except ValueError as e:
+            logger.warning(f"Ignoring bad section cache {path}: {e}")
+
+    sections = segment(html)
+    save_sections(jsonpath, sections, cache_dir)
+    return title, html, sections
@@ -1,63 +1,31 @@
+import time
 import streamlit as st
-import sqlite3
-from fetch_case_data_and_summarize import IKApi, query_ai_model
+import db
+import history
+import jobs
+from analysis import EXCERPT_DOCS, analysis_job, summarize_documents
+from fetch_case_data_and_summarize import query_ai_model
+from pipeline import format_case_summaries
+from resources import registry, get_ikapi, get_answer_cache, get_database, get_job_runner, get_usage_ledger
 from streamlit_option_menu import option_menu
 
-ikapi = IKApi(maxpages=5)
-
-# Database setup
-def init_db():
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    c.execute(
-        """CREATE TABLE IF NOT EXISTS users (
-            username TEXT PRIMARY KEY,
-            password TEXT NOT NULL,
-            approved BOOLEAN NOT NULL,
-            is_admin BOOLEAN NOT NULL
-        )"""
-    )
-    conn.commit()
-    conn.close()
+# Shared across all sessions and reruns; the Groq client warms up in the background
+ikapi = get_ikapi()
+if not registry.is_loaded('groq'):
+    registry.warm_up(['groq'], background=True)
 
+# Database: pooled connections, migrations (including the admin seed) run once per process
 def add_user(username, password, approved=False, is_admin=False):
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO users (username, password, approved, is_admin) VALUES (?, ?, ?, ?)",
-        (username, password, approved, is_admin),
-    )
-    conn.commit()
-    conn.close()
+    db.add_user(get_database(), username, password, approved, is_admin)
 
 def get_user(username):
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE username = ?", (username,))
-    user = c.fetchone()
-    conn.close()
-    return user
+    return db.get_user(get_database(), username)
 
 def get_pending_users():
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    c.execute("SELECT username FROM users WHERE approved = 0 AND is_admin = 0")
-    pending_users = c.fetchall()
-    conn.close()
-    return pending_users
+    return db.get_pending_users(get_database())
 
 def approve_user(username):
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    c.execute("UPDATE users SET approved = 1 WHERE username = ?", (username,))
-    conn.commit()
-    conn.close()
-
-# Initialize database
-init_db()
-
-if not get_user("admin"):
-    add_user("admin", "admin123", approved=True, is_admin=True)
+    db.approve_user(get_database(), username)
 
 # Session management
 if "page" not in st.session_state:
@@ -92,57 +60,131 @@ def admin_panel():
                     st.success(f"Approved user: {user}")
         else:
             st.info("No users pending approval.")
+
+        st.subheader("Shared Resources")
+        if st.button("Run health checks"):
+            for name, status in registry.health().items():
+                st.write(f"{name}: {status}")
+        st.write("Answer cache:", get_answer_cache().stats())
+        st.write("Background jobs:", get_job_runner().stats())
+        st.write("Coalesced IK requests:", ikapi.client.singleflight.stats())
+        st.write("Coalesced summaries:", ikapi.singleflight.stats())
+
+        st.subheader("API Usage")
+        ledger = get_usage_ledger()
+        days = st.selectbox("Period (days)", [1, 7, 30])
+        st.caption("Coalesced calls shared an identical call in flight and cost nothing; "
+                   "repeats were paid for but could have been served from a cache.")
+        st.write("By user and service:")
+        st.dataframe(ledger.report(('username', 'service'), days))
+        st.write("By endpoint:")
+        st.dataframe(ledger.report(('service', 'endpoint'), days))
+        st.write("Today's spend against daily budgets:")
+        st.dataframe(ledger.budget_report())
     else:
         st.error("Only admins can access this page.")
 
+def show_job(job):
+    if not job.finished:
+        st.progress(job.progress, text=job.message)
+        if st.button("Cancel"):
+            get_job_runner().cancel(job.id)
+        # Poll until the job finishes
+        time.sleep(1)
+        st.rerun()
+
+    for note in job.notes:
+        st.info(note)
+    if job.status == jobs.FAILED:
+        st.error(f"Analysis failed: {job.error}")
+    elif job.status == jobs.CANCELLED:
+        st.warning("Analysis cancelled.")
+    elif job.result:
+        show_result(*job.result)
+
+def show_result(cases, insights):
+    st.subheader("Summarized Case Details")
+    st.text_area("Summaries", format_case_summaries(cases), height=300)
+    skipped = [case for case in cases if 'skipped' in case]
+    partial = [case for case in cases if case.get('partial')]
+    if skipped:
+        st.warning("Left out to stay within the time limit: " +
+                   ", ".join(case.get('title') or f"document {case['docid']}" for case in skipped))
+    if partial:
+        st.info("Only partly summarized in time: " + ", ".join(case['title'] for case in partial))
+    st.subheader("AI Insights and Analysis")
+    st.write(insights)
+
+# Past queries of the logged-in user, replayed from the database
+def query_history_sidebar():
+    with st.sidebar:
+        st.subheader("Query History")
+        past_queries = history.list_queries(get_database(), st.session_state.username)
+        if not past_queries:
+            st.caption("No saved queries yet.")
+        for query_id, past_query, created_at in past_queries:
+            label = f"{past_query} ({time.strftime('%d %b %H:%M', time.localtime(created_at))})"
+            if st.button(label, key=f"history_{query_id}"):
+                st.session_state.replay_id = query_id
+                st.session_state.job_id = None
+
+def replay_query(query_id):
+    record = history.load_query(get_database(), st.session_state.username, query_id)
+    if not record:
+        st.error("This saved query no longer exists.")
+        return
+    st.info(f"Saved result for '{record['query']}' "
+            f"from {time.strftime('%d %b %Y %H:%M', time.localtime(record['created_at']))}.")
+
+    if st.button("Refresh"):
+        usage = get_usage_ledger().for_query(st.session_state.username, record['query'])
+        # Refreshed the way it was first run, so the answer stays the same kind and cost
+        record, rerun = history.refresh_query(
+            get_database(), st.session_state.username, record,
+            search=lambda query, limit: ikapi.fetch_all_docs(query, limit=limit, usage=usage),
+            summarize=(lambda doc_ids: ikapi.fetch_excerpts(doc_ids, record['query'], usage=usage))
+            if record['excerpts'] else
+            (lambda doc_ids: summarize_documents(doc_ids, on_warning=st.warning, usage=usage)),
+            answer=lambda query, cases: query_ai_model(query, format_case_summaries(cases), usage=usage),
+        )
+        if rerun:
+            st.success(f"Re-ran stale stages: {', '.join(rerun)}.")
+        else:
+            st.success("Saved result is up to date.")
+
+    show_result(record['cases'], record['answer'])
+
 # Main app content (query and insights)
 def main_app():
     st.title("AI Based Legal Research Assistant")
     st.markdown("This app provides detailed insights from related legal cases from Indian Courts.")
+    query_history_sidebar()
 
     query = st.text_input("Enter your legal query (e.g., 'road accident cases'):")
+    use_excerpts = st.checkbox(f"Use query excerpts from the top {EXCERPT_DOCS} cases instead of full summaries (faster)")
+    runner = get_job_runner()
+    username = st.session_state.username
     if st.button("Analyze"):
+        st.session_state.replay_id = None
         if not query.strip():
             st.warning("Please enter a valid query.")
         else:
-            st.info("Fetching related cases...")
-            doc_ids = ikapi.fetch_all_docs(query)
+            # An identical running job for this user is reused rather than duplicated
+            job = runner.submit(username, (query.strip(), use_excerpts), analysis_job,
+                                username, query.strip(), use_excerpts)
+            st.session_state.job_id = job.id
 
-            if not doc_ids:
-                st.error("No related documents found for your query.")
-            else:
-                st.success(f"Found {len(doc_ids)} related documents. Processing summaries...")
-
-                all_summaries = []
-                for docid in doc_ids[:2]:  
-                    case_details = ikapi.fetch_doc(docid)
-
-                    if not case_details:
-                        st.warning(f"Failed to fetch details for document ID: {docid}")
-                        continue
-
-                    title = case_details.get("title", "No Title")
-                    main_text = case_details.get("doc", "")
-                    cleaned_text = ikapi.clean_text(main_text)
-                    chunks = list(ikapi.split_text_into_chunks(cleaned_text))
-                    summaries = []
-
-                    for chunk in chunks:
-                        summary = ikapi.summarize(chunk)
-                        if summary:
-                            summaries.append(summary)
-
-                    final_summary = " ".join(summaries)
-                    all_summaries.append(f"Title: {title}\nSummary: {final_summary}")
-
-                combined_summary = "\n\n".join(all_summaries)
-                st.subheader("Summarized Case Details")
-                st.text_area("Summaries", combined_summary, height=300)
-
-                st.info("Generating insights from summaries...")
-                insights = query_ai_model(query, combined_summary)
-                st.subheader("AI Insights and Analysis")
-                st.write(insights)
+    job_id = st.session_state.get("job_id")
+    if job_id is None and not st.session_state.get("replay_id"):
+        # Reattach to a job started before a reconnect
+        latest = runner.latest(username)
+        if latest and not latest.finished:
+            job_id = st.session_state.job_id = latest.id
+
+    if st.session_state.get("replay_id"):
+        replay_query(st.session_state.replay_id)
+    elif job_id and runner.get(job_id):
+        show_job(runner.get(job_id))
 
 # User registration
 def register_user():
@@ -1,175 +1,211 @@
-import json
-import logging
-from transformers import pipeline
-import argparse
 import logging
 import os
 import re
-import codecs
-import json
-import http.client
-import urllib.request, urllib.parse, urllib.error
-import base64
-import glob
-import csv
-import datetime
+
+# The IK client, FileStorage and helpers live in ikapi.py; re-exported for older imports
+from ikapi import IKApi, FileStorage, get_dateobj, mk_dir
+from ikclient import IKError
+from dedup import DuplicateFilter
+from segments import select_sections
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('ikapi')
 
 
-class FileStorage:
-    def __init__(self, datadir):
-        self.datadir = datadir
-
-    def save_json(self, results, filepath):
-        json_doc  = results.decode('utf8')
-        json_file = codecs.open(filepath, mode = 'w', encoding = 'utf-8')
-        json_file.write(json_doc)
-        json_file.close()
-
-    def exists(self, filepath):
-        if os.path.exists(filepath):
-            return True
-        else:
-            return False
-
-    def exists_original(self, origpath):
-        return glob.glob('%s.*' % origpath)
-
-    def get_docpath(self, docsource, publishdate):
-        datadir = os.path.join(self.datadir, docsource)
-        mk_dir(datadir)
-
-        d = get_dateobj(publishdate)
-        datadir = os.path.join(datadir, '%d' % d.year)
-        mk_dir(datadir)
-
-        docpath = os.path.join(datadir, '%s' % d)
-        mk_dir(docpath)
-
-        return docpath
-
-    def get_file_extension(self, mtype):
-        t = 'unkwn'
-        if not mtype:
-            print (mtype)
-        elif re.match('text/html', mtype):
-            t = 'html'
-        elif re.match('application/postscript', mtype):
-            t = 'ps'
-        elif re.match('application/pdf', mtype):
-            t = 'pdf'
-        elif re.match('text/plain', mtype):
-            t = 'txt'
-        elif re.match('image/png', mtype):
-            t = 'png'
-        return t 
-
-    def save_original(self, orig, origpath):
-        obj = json.loads(orig)
-        if 'errmsg' in obj:
-            return
-
-        doc = base64.b64decode(obj['doc'])
+SUMMARIZER_MODEL = "sshleifer/distilbart-cnn-12-6"
+SUMMARIZER_BACKENDS = ('pytorch', 'int8', 'onnx')
 
-        extension = self.get_file_extension(obj['Content-Type'])
+# ONNX exports are written here once per model and loaded from here afterwards
+ONNX_CACHE_DIR = os.path.join('models', 'onnx')
+SUMMARY_ERROR = "Error in summarization."
 
-        filepath   = origpath + '.%s' % extension
-        filehandle = open(filepath, 'wb')
-        filehandle.write(doc)
-        filehandle.close()
 
-    def get_docpath_by_docid(self, docid):
-        docpath = os.path.join(self.datadir, '%d' % docid)
-        mk_dir(docpath)
-        return docpath
+class Summarizer:
+    """
+    Handles text summarization using a Hugging Face model.
+
+    Backends:
+        pytorch: the fp32 PyTorch model (reference).
+        int8: the PyTorch model with its Linear layers dynamically quantized
+            to int8, for CPU-only nodes.
+        onnx: the model exported to ONNX and run with ONNX Runtime
+            (needs `optimum[onnxruntime]`). The export is cached under
+            `onnx_cache_dir`, so only the first Summarizer pays for it.
+    """
+    def __init__(self, backend='pytorch', model=SUMMARIZER_MODEL, onnx_cache_dir=ONNX_CACHE_DIR):
+        if backend not in SUMMARIZER_BACKENDS:
+            raise ValueError(f"Unknown summarizer backend {backend!r}, expected one of {SUMMARIZER_BACKENDS}")
+        self.backend = backend
+
+        # Imported here so that using IKApi/FileStorage does not load transformers
+        from transformers import pipeline
+        if backend == 'pytorch':
+            self.summarizer = pipeline("summarization", model=model)
+            return
 
-    def get_json_orig_path(self, docpath, docid):
-        jsonpath = os.path.join(docpath, '%d.json' % docid)
-        origpath = os.path.join(docpath, '%d_original' % docid)
-        return jsonpath, origpath
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model)
+        if backend == 'int8':
+            import torch
+            from transformers import AutoModelForSeq2SeqLM
+            seq2seq = AutoModelForSeq2SeqLM.from_pretrained(model)
+            seq2seq = torch.quantization.quantize_dynamic(seq2seq, {torch.nn.Linear}, dtype=torch.qint8)
+        else:
+            seq2seq = load_onnx_model(model, onnx_cache_dir)
+        self.summarizer = pipeline("summarization", model=seq2seq, tokenizer=tokenizer)
 
-    def get_json_path(self, q):
-        jsonpath = os.path.join(self.datadir, '%s.json' % q)
-        return jsonpath
+    def summarize(self, text, max_length=150, min_length=50):
+        """Summarizes the given text; input beyond the model's 1024 tokens is cut off."""
+        try:
+            return self.summarizer(text, max_length=max_length, min_length=min_length, do_sample=False,
+                                   truncation=True)[0]["summary_text"]
+        except Exception as e:
+            logger.error(f"Failed to summarize text: {e}")
+            return SUMMARY_ERROR
 
-    def get_search_path(self, q):
-        datadir = os.path.join(self.datadir, q)
-        mk_dir(datadir)
-        return datadir
+    def summarize_batch(self, texts, max_length=150, min_length=50, batch_size=8):
+        """
+        Summarizes several texts in one model call per `batch_size` texts.
 
-    def get_tocwriter(self, datadir):
-        fieldnames = ['position', 'docid', 'date', 'court', 'title']
-        tocfile   = os.path.join(datadir, 'toc.csv')
-        tochandle = open(tocfile, 'w', encoding = 'utf8')
-        tocwriter = csv.DictWriter(tochandle, fieldnames=fieldnames)
-        tocwriter.writeheader()
-        return tocwriter
+        Returns:
+            list[str]: One summary per text, "Error in summarization." if the batch failed.
+        """
+        try:
+            results = self.summarizer(list(texts), max_length=max_length, min_length=min_length,
+                                      do_sample=False, truncation=True, batch_size=batch_size)
+            return [r["summary_text"] for r in results]
+        except Exception as e:
+            logger.error(f"Failed to summarize batch of {len(texts)}: {e}")
+            return [SUMMARY_ERROR] * len(texts)
 
-    def get_docpath_by_position(self, datadir, current):
-        docpath = os.path.join(datadir, '%d' % current)
-        mk_dir(docpath)
-        return docpath
-def get_dateobj(datestr):
-    ds = re.findall('\d+', datestr)
-    return datetime.date(int(ds[0]), int(ds[1]), int(ds[2]))
 
-def mk_dir(datadir):
-    if not os.path.exists(datadir):
-        os.mkdir(datadir)
+def load_onnx_model(model, cache_dir=ONNX_CACHE_DIR):
+    """
+    The ONNX Runtime version of `model`, exported on first use and saved
+    under `cache_dir`. Concurrent workers may each export once; the first
+    to finish publishes its copy and the others are discarded.
+    """
+    import shutil
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
 
+    path = os.path.join(cache_dir, model.replace('/', '--'))
+    if os.path.exists(os.path.join(path, 'config.json')):
+        return ORTModelForSeq2SeqLM.from_pretrained(path)
 
-class Summarizer:
-    """Handles text summarization using a Hugging Face model."""
-    def __init__(self):
-        self.summarizer = pipeline("summarization", model="sshleifer/distilbart-cnn-12-6")
+    logger.info(f"Exporting {model} to ONNX in {path}")
+    seq2seq = ORTModelForSeq2SeqLM.from_pretrained(model, export=True)
+    tmppath = f'{path}.{os.getpid()}.tmp'
+    seq2seq.save_pretrained(tmppath)
+    try:
+        os.rename(tmppath, path)
+    except OSError:
+        # Another worker published its export first
+        shutil.rmtree(tmppath, ignore_errors=True)
+    return seq2seq
 
-    def summarize(self, text, max_length=150, min_length=50):
-        """Summarizes the given text."""
-        try:
-            return self.summarizer(text, max_length=max_length, min_length=min_length, do_sample=False)[0]["summary_text"]
-        except Exception as e:
-            logger.error(f"Failed to summarize text: {e}")
-            return "Error in summarization."
+def interleave_neighbours(hits, graph, expand_hops=1, slots=0):
+    """
+    docid -> title (None for neighbours) of the search hits, each followed by
+    one not yet seen graph neighbour while fewer than `slots` have been added.
+    """
+    hit_ids = {hit.tid for hit in hits}
+    candidates = {}
+    added = 0
+    for hit in hits:
+        candidates.setdefault(hit.tid, hit.title)
+        if graph is None or added >= slots:
+            continue
+        for docid in graph.neighbourhood(hit.tid, expand_hops):
+            docid = int(docid)
+            if docid not in candidates and docid not in hit_ids:
+                candidates[docid] = None
+                added += 1
+                break
+    return candidates
 
-def get_related_case_summaries(api, query, summarizer, max_results=10):
+def get_related_case_summaries(api, query, summarizer, max_results=10, prefilter=None,
+                               graph=None, expand_hops=1, dedup=None,
+                               sections=None, graph_slots=None, corpus=None, usage=None):
     """
     Searches for related cases based on a query, fetches their details, and summarizes them.
 
     Args:
-        api (IKApi): The Indian Kanoon API client.
+        api (IKApi or IKClient): The Indian Kanoon API client.
         query (str): The search query.
         summarizer (Summarizer): Summarizer instance for summarizing case details.
         max_results (int): Maximum number of cases to summarize.
+        prefilter (callable): Optional text -> text reduction run before the
+            summarizer, e.g. `extractive.ExtractiveFilter`.
+        graph (CitationGraph): Optional local citation graph; cases within
+            `expand_hops` citations of the search hits are added as
+            candidates without any extra API calls.
+        graph_slots (int): How many of the `max_results` may be graph
+            neighbours (default a third). Each hit is followed by one of its
+            neighbours until these slots are used, so expansion is not
+            crowded out by the search hits.
+        dedup (dedup.LSHIndex): Optional near-duplicate index; only the first
+            copy of a judgment among the candidates is summarized.
+        sections (tuple): Summarize only these judgment sections, e.g.
+            segments.DEFAULT_SECTIONS.
+        corpus (corpus.StoredCorpus): Judgments stored locally; these are
+            read from disk with their cached section offsets, not fetched,
+            and the summaries batch_summarize.py stored for them are used.
+        usage (usage.QueryUsage): Records the search and every document
+            fetch. The summarizer runs locally, so nothing is recorded for it.
 
     Returns:
         list[dict]: List of summarized case details.
     """
     summaries = []
+    client = getattr(api, 'client', api)
+    observe = usage.ik_call if usage else None
+    duplicates = DuplicateFilter(dedup) if dedup is not None else None
     try:
         logger.info(f"Searching for cases related to query: {query}")
-        search_results = api.search(query, pagenum=0, maxpages=max_results)
-        search_data = json.loads(search_results)
+        search_results = client.search(query, pagenum=0, maxpages=max_results, observe=observe)
 
-        if "docs" not in search_data or not search_data["docs"]:
+        if not search_results.hits:
             logger.warning("No related cases found.")
             return summaries
 
-        for case in search_data["docs"]:
-            docid = case["tid"]
-            title = case["title"]
-            logger.info(f"Fetchingc details for case ID: {docid} - {title}")
+        candidates = interleave_neighbours(search_results.hits, graph, expand_hops,
+                                           max_results // 3 if graph_slots is None else graph_slots)
 
-            # Fetch case details
-            case_data = api.fetch_doc(docid)
-            if not case_data:
-                logger.warning(f"Failed to fetch details for case ID: {docid}")
+        for docid, title in candidates.items():
+            logger.info(f"Fetching details for case ID: {docid} - {title}")
+
+            stored_summary = corpus.summary(docid) if corpus else None
+            if stored_summary:
+                summaries.append({"title": title or stored_summary.get('title'),
+                                  "summary": stored_summary['summary']})
+                if len(summaries) >= max_results:
+                    break
+                continue
+
+            # Fetch case details, unless the judgment is stored locally
+            stored = corpus.load(docid) if corpus else None
+            if stored and stored[1].strip():
+                doc_title, doc, offsets = stored
+            else:
+                try:
+                    case_data = client.fetch_doc(docid, observe=observe)
+                except IKError as e:
+                    logger.warning(f"Failed to fetch details for case ID: {docid}: {e}")
+                    continue
+                doc_title, doc, offsets = case_data.title, case_data.doc, None
+
+            if duplicates and duplicates.check(docid, doc or "") is not None:
+                logger.info(f"Skipping case ID: {docid}, a near-duplicate of an earlier case")
                 continue
 
             # Parse and summarize the main text
-            case_json = json.loads(case_data)
-            main_text = case_json.get("text", "No main text available.")
+            title = title or doc_title
+            main_text = doc or "No main text available."
+            if sections:
+                main_text = select_sections(main_text, sections, offsets)
+            if prefilter:
+                main_text = prefilter(re.sub(r"\s+", " ", re.sub(r"<[^>]+>", " ", main_text)))
             summary = summarizer.summarize(main_text)
             summaries.append({"title": title, "summary": summary})
 
@@ -177,180 +213,10 @@ def get_related_case_summaries(api, query, summarizer, max_results=10):
             if len(summaries) >= max_results:
                 break
 
-    except Exception as e:
+    except IKError as e:
         logger.error(f"Error during case processing: {e}")
 
     return summaries
-class IKApi:
-    def __init__(self, args, storage):
-        self.logger     = logging.getLogger('ikapi')
-
-        self.headers    = {'Authorization': 'Token %s' % args.token, \
-                           'Accept': 'application/json'}
-
-        self.basehost   = 'api.indiankanoon.org'
-        self.storage    = storage
-        #self.maxcites   = args.maxcites
-        #self.maxcitedby = args.maxcitedby
-        #self.orig       = args.orig
-        #self.maxpages   = args.maxpages
-        #self.pathbysrc  = args.pathbysrc
-
-        #if self.maxpages > 100:
-            #self.maxpages = 100
-
-    def call_api(self, url):
-        connection = http.client.HTTPSConnection(self.basehost)
-        connection.request('POST', url, headers = self.headers)
-        response = connection.getresponse()
-        results = response.read()
-        return results 
-    
-    def fetch_doc(self, docid):
-        url = '/doc/%d/' % docid
-
-        args = []
-        #if self.maxcites > 0:
-            #args.append('maxcites=%d' % self.maxcites)
-
-        #if self.maxcitedby > 0:
-            #args.append('maxcitedby=%d' % self.maxcitedby)
-
-        if args:
-            url = url + '?' + '&'.join(args)
-
-        return self.call_api(url)
-
-
-
-    def fetch_docmeta(self, docid):
-        url = '/docmeta/%d/' % docid
-
-        args = []
-        if self.maxcites != 0:
-            args.append('maxcites=%d' % self.maxcites)
-
-        if self.maxcitedby != 0:
-            args.append('maxcitedby=%d' % self.maxcitedby)
-
-        if args:
-            url = url + '?' + '&'.join(args)
-
-        return self.call_api(url)
-
-    def fetch_orig_doc(self, docid):
-        url = '/origdoc/%d/' % docid
-        return self.call_api(url)
-
-    def fetch_doc_fragment(self, docid, q):
-        q   = urllib.parse.quote_plus(q.encode('utf8'))
-        url = '/docfragment/%d/?formInput=%s' % (docid,  q)
-        return self.call_api(url)
-
-    def search(self, q, pagenum, maxpages):
-        q = urllib.parse.quote_plus(q.encode('utf8'))
-        url = '/search/?formInput=%s&pagenum=%d&maxpages=%d' % (q, pagenum, maxpages)
-        return self.call_api(url)
-
-
-    def save_doc_fragment(self, docid, q):
-        success = False
-
-        jsonstr = self.fetch_doc_fragment(docid, q)
-        if not jsonstr:
-            return False
-
-        jsonpath = self.storage.get_json_path('%d q: %s' % (docid, q))
-        success = self.storage.save_json(jsonstr, jsonpath)
-        return success    
-
-    def download_doc(self, docid, docpath):    
-        success = False
-        orig_needed = self.orig
-        jsonpath, origpath = self.storage.get_json_orig_path(docpath, docid)
-
-        if not self.storage.exists(jsonpath):
-            jsonstr = self.fetch_doc(docid)
-            d = json.loads(jsonstr)
-            if 'errmsg' in d:
-                return success
-        
-            self.logger.info('Saved %s', d['title'])
-            self.storage.save_json(jsonstr, jsonpath)
-            success = True
-
-            if orig_needed:
-                if not d['courtcopy']:
-                    orig_needed = False
-
-        if orig_needed and not self.storage.exists_original(origpath):
-            orig = self.fetch_orig_doc(docid)
-            if orig:
-                self.logger.info('Saved Original %s', d['title'])
-                self.storage.save_original(orig, origpath)
-        return success        
-
-    def download_doctype(self, doctype, fromdate, todate):
-        q = 'doctypes: %s' % doctype
-        if fromdate:
-            q += ' fromdate: %s' % fromdate
-        if todate:
-            q += ' todate: %s' % todate
-
-        pagenum = 0
-        docids = []
-        while 1:
-            results = self.search(q, pagenum, self.maxpages)
-            obj = json.loads(results)
- 
-            if 'docs' not in obj or len(obj['docs']) <= 0:
-                break
-            docs = obj['docs']
-            self.logger.warning('Num results: %d, pagenum: %d', len(docs), pagenum)
-            for doc in docs:
-                docpath = self.storage.get_docpath(doc['docsource'], doc['publishdate'])
-                if self.download_doc(doc['tid'], docpath):
-                    docids.append(doc['tid'])
-
-            pagenum += self.maxpages 
-
-        return docids
-
-    def save_search_results(self, q):
-        datadir = self.storage.get_search_path(q)
-
-        tocwriter = self.storage.get_tocwriter(datadir)
-
-        pagenum = 0
-        current = 1
-        docids  = []
-        while 1:
-            results = self.search(args.q, pagenum, self.maxpages)
-            obj = json.loads(results)
-
-            docs = obj['docs']
-            if len(docs) <= 0:
-                break
-            self.logger.warning('Num results: %d, pagenum: %d', len(docs), pagenum)
-
-            for doc in docs:
-                docid = doc['tid']
-                title = doc['title']
-                toc = {'docid': docid, 'title': title, 'position': current, \
-                       'date': doc['publishdate'], 'court': doc['docsource']}
-                tocwriter.writerow(toc)
-
-                if self.pathbysrc:
-                    docpath = self.storage.get_docpath(doc['docsource'], doc['publishdate'])
-                else:    
-                    docpath = self.storage.get_docpath_by_position(datadir, current)
-                if self.download_doc(docid, docpath):
-                    docids.append(docid)
-                current += 1
-
-            pagenum += self.maxpages 
-        return docids
-
 
 if __name__ == "__main__":
     from argparse import ArgumentParser
@@ -374,12 +240,12 @@ if __name__ == "__main__":
     # Fetch and process the case
     docid = 119259277
 
-    case_details = api.fetch_doc( docid)
-    #print(case_details)
-    #title = case_details['title']
- 
-    # Fetch and summarize related cases
-    summaries = get_related_case_summaries(api, case_details, summarizer)
+    case_details = api.client.fetch_doc(docid)
+
+    # Fetch and summarize cases related to this one's title
+    from resources import get_citation_graph, get_corpus
+    summaries = get_related_case_summaries(api, case_details.title, summarizer,
+                                           graph=get_citation_graph(), corpus=get_corpus())
 
     # Output the summaries
     for case_summary in summaries:
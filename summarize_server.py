@@ -0,0 +1,211 @@
+import argparse
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from summarization_workflow import SUMMARIZER_BACKENDS
+
+logger = logging.getLogger('ikapi')
+
+ERROR = "Error in summarization."
+
+
+class MicroBatcher:
+    """
+    Gathers single summarization requests from many threads into batches.
+
+    One thread owns the model. It takes the first waiting request, then
+    keeps collecting for up to `max_wait` seconds or until `max_batch`
+    requests with the same generation parameters are in hand, and runs them
+    as one batch. Under load batches fill up and throughput grows with the
+    batch size; a lone request waits at most `max_wait`.
+    """
+    def __init__(self, summarize_batch, max_batch=8, max_wait=0.02):
+        self.summarize_batch = summarize_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.batch_sizes = {}
+        self.busy_seconds = 0.0
+        self.thread = threading.Thread(target=self._run, name='batcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, text, max_length=150, min_length=50):
+        """Queues one text; the returned Future resolves to its summary."""
+        future = Future()
+        self.queue.put(((max_length, min_length), text, future))
+        with self.lock:
+            self.requests += 1
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+        return future
+
+    def _collect(self):
+        first = self.queue.get()
+        batch, deferred = [first], []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            (batch if item[0] == first[0] else deferred).append(item)
+        # Requests with other parameters go back for the next batch
+        for item in deferred:
+            self.queue.put(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            (max_length, min_length), _, _ = batch[0]
+            start = time.perf_counter()
+            try:
+                summaries = self.summarize_batch([text for _, text, _ in batch],
+                                                 max_length=max_length, min_length=min_length)
+            except Exception as e:
+                logger.error(f"Batch of {len(batch)} failed: {e}")
+                summaries = [ERROR] * len(batch)
+            with self.lock:
+                self.batches += 1
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+                self.busy_seconds += time.perf_counter() - start
+            for (_, _, future), summary in zip(batch, summaries):
+                future.set_result(summary)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'max_queue_depth': self.max_depth,
+                'requests': self.requests,
+                'batches': self.batches,
+                'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+                'batch_sizes': dict(sorted(self.batch_sizes.items())),
+                'busy_seconds': round(self.busy_seconds, 3),
+            }
+
+
+class SummarizeHandler(BaseHTTPRequestHandler):
+    """
+    Speaks the Hugging Face Inference API summarization protocol, so
+    IKApi.summarize works unchanged with API_URL pointed here.
+    """
+    server_version = 'ik-summarize/1'
+
+    def _reply(self, status, obj):
+        body = json.dumps(obj).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _load_failed(self):
+        """Replies 500 if the model failed to load, rather than leaving clients waiting on 503s."""
+        if self.server.load_error is None:
+            return False
+        self._reply(500, {'error': f'Model failed to load: {self.server.load_error}'})
+        return True
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            batcher = self.server.batcher
+            if batcher or not self._load_failed():
+                self._reply(200, batcher.metrics() if batcher else {'loading': True})
+        elif self.path == '/health':
+            if not self._load_failed():
+                self._reply(200 if self.server.batcher else 503, {'ready': self.server.batcher is not None})
+        else:
+            self._reply(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        batcher = self.server.batcher
+        if batcher is None:
+            if self._load_failed():
+                return
+            self._reply(503, {'error': 'Model is loading', 'estimated_time': 20})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length))
+            inputs = payload['inputs']
+            params = payload.get('parameters') or {}
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, {'error': f'Bad request: {e}'})
+            return
+
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        futures = [batcher.submit(text, params.get('max_length', 150), params.get('min_length', 50))
+                   for text in texts]
+        summaries = [f.result() for f in futures]
+        if ERROR in summaries:
+            self._reply(500, {'error': ERROR})
+            return
+        self._reply(200, [{'summary_text': s} for s in summaries])
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def serve(host='127.0.0.1', port=8080, backend='pytorch', max_batch=8, max_wait=0.02,
+          summarizer_factory=None):
+    """
+    Runs the server until interrupted. The model loads in the background;
+    until it is ready requests get the same 503 the hosted API sends. If
+    it fails to load, health checks and requests get a 500 with the error.
+    """
+    server = ThreadingHTTPServer((host, port), SummarizeHandler)
+    server.daemon_threads = True
+    server.batcher = None
+    server.load_error = None
+
+    def load():
+        try:
+            if summarizer_factory:
+                summarizer = summarizer_factory()
+            else:
+                from summarization_workflow import Summarizer
+                summarizer = Summarizer(backend=backend)
+        except Exception as e:
+            logger.exception(f"Failed to load the summarizer ({backend})")
+            server.load_error = f"{type(e).__name__}: {e}"
+            return
+        server.batcher = MicroBatcher(summarizer.summarize_batch, max_batch, max_wait)
+        logger.info(f"Summarizer ({backend}) ready")
+
+    threading.Thread(target=load, name='load-model', daemon=True).start()
+    logger.info(f"Serving summaries on http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(
+        description='Local summarization server compatible with the HF Inference API; '
+                    'point API_URL at it')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('-p', '--port', type=int, default=8080, help='port to listen on')
+    parser.add_argument('-b', '--backend', default='pytorch', choices=SUMMARIZER_BACKENDS,
+                        help='summarizer backend')
+    parser.add_argument('--max-batch', type=int, default=8, help='largest batch sent to the model')
+    parser.add_argument('--max-wait-ms', type=float, default=20, help='how long a batch waits to fill')
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_arg_parser().parse_args()
+    logging.basicConfig(level=logging.INFO)
+    serve(args.host, args.port, args.backend, args.max_batch, args.max_wait_ms / 1000)
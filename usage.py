@@ -0,0 +1,215 @@
+import atexit
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger('ikapi')
+
+# IK and HF bill per request, Groq per token; budgets are counted in the same units
+SERVICES = ('ik', 'hf', 'groq')
+BUDGET_UNITS = {'ik': 'calls', 'hf': 'calls', 'groq': 'tokens'}
+
+# A call identical to one made within this window could have been served from a cache
+REPEAT_WINDOW = 24 * 3600
+
+SQL_ADD_CALL = """INSERT INTO api_usage
+    (username, query, service, endpoint, key, request_bytes, response_bytes, tokens, seconds,
+     ok, shared, repeat, day, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+SQL_RECENT_KEYS = "SELECT key, MAX(created_at) FROM api_usage WHERE created_at >= ? AND NOT shared GROUP BY key"
+SQL_SPENT = """SELECT service, COUNT(*), SUM(tokens) FROM api_usage
+    WHERE username = ? AND day = ? AND NOT shared GROUP BY service"""
+SQL_REPORT = """SELECT {group}, COUNT(*), SUM(shared), SUM(repeat), SUM(NOT ok), SUM(tokens),
+    SUM(request_bytes), SUM(response_bytes), ROUND(AVG(seconds), 3), ROUND(MAX(seconds), 3)
+    FROM api_usage WHERE day >= ? GROUP BY {group} ORDER BY COUNT(*) DESC"""
+
+REPORT_COLUMNS = ('calls', 'coalesced', 'repeats', 'failed', 'tokens', 'bytes_sent', 'bytes_received',
+                  'avg_seconds', 'max_seconds')
+
+
+def today(now=None):
+    return time.strftime('%Y-%m-%d', time.localtime(now))
+
+
+def call_key(*parts):
+    """Identifies a call by everything that determines its response."""
+    return hashlib.sha1(repr(parts).encode('utf8')).hexdigest()
+
+
+def account_usage(account, label):
+    """
+    What a CLI records its calls against when run with --account: a
+    QueryUsage for that user in the app's ledger, or None without one.
+    """
+    if not account:
+        return None
+    from resources import get_usage_ledger
+    return get_usage_ledger().for_query(account, label)
+
+
+class UsageLedger:
+    """
+    Records every upstream call and enforces per-user daily budgets.
+
+    Each call is stored with its user, query, service and endpoint, the
+    bytes and tokens it moved, its latency, whether it was coalesced with
+    an identical call in flight (and so cost nothing) and whether it
+    repeated a call made within `window` seconds, i.e. whether a cache
+    could have served it. `budgets` maps service -> daily allowance per
+    user in BUDGET_UNITS; 0 or missing means unlimited.
+
+    Nothing touches SQLite on the request path. Calls are buffered and
+    written in one transaction every `flush_interval` seconds, or once
+    `flush_size` are waiting, and at exit. Today's spend per user and the
+    keys of recent calls are kept in memory, seeded from the table on
+    first use, so spend recorded by other processes afterwards is not
+    seen until this one restarts.
+    """
+    def __init__(self, db, budgets=None, window=REPEAT_WINDOW, flush_interval=2.0, flush_size=200):
+        self.db = db
+        self.budgets = budgets or {}
+        self.window = window
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.lock = threading.Lock()
+        self.pending = []
+        self.totals = {}
+        self.seen = None
+        self.flusher = None
+        atexit.register(self.flush)
+
+    def _spent_today(self, username, day):
+        """The running total for (username, day); called with the lock held."""
+        totals = self.totals.get((username, day))
+        if totals is None:
+            totals = self.totals[username, day] = dict.fromkeys(SERVICES, 0)
+            for service, calls, tokens in self.db.fetchall(SQL_SPENT, (username, day)):
+                totals[service] = tokens if BUDGET_UNITS.get(service) == 'tokens' else calls
+        return totals
+
+    def record(self, username, query, service, endpoint, key, request_bytes=0, response_bytes=0,
+               tokens=0, seconds=0.0, ok=True, shared=False):
+        now = time.time()
+        day = today(now)
+        try:
+            with self.lock:
+                if self.seen is None:
+                    self.seen = dict(self.db.fetchall(SQL_RECENT_KEYS, (now - self.window,)))
+                last = self.seen.get(key)
+                repeat = not shared and last is not None and last >= now - self.window
+                if not shared:
+                    self.seen[key] = now
+                    self._spent_today(username, day)[service] += \
+                        tokens if BUDGET_UNITS.get(service) == 'tokens' else 1
+                self.pending.append((username, query, service, endpoint, key, request_bytes,
+                                     response_bytes, tokens, seconds, ok, shared, repeat, day, now))
+                full = len(self.pending) >= self.flush_size
+                if self.flusher is None:
+                    self.flusher = threading.Thread(target=self._flush_periodically, name='usage-flush',
+                                                    daemon=True)
+                    self.flusher.start()
+            if full:
+                self.flush()
+        except Exception as e:
+            # Accounting must never fail the call it accounts for
+            logger.error(f"Failed to record {service} usage: {e}")
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered calls to api_usage."""
+        with self.lock:
+            rows, self.pending = self.pending, []
+            cutoff = time.time() - self.window
+            if self.seen and len(self.seen) > 10 * self.flush_size:
+                self.seen = {key: t for key, t in self.seen.items() if t >= cutoff}
+            current = today()
+            for user_day in [k for k in self.totals if k[1] != current]:
+                del self.totals[user_day]
+        if not rows:
+            return
+        try:
+            with self.db.transaction() as conn:
+                conn.executemany(SQL_ADD_CALL, rows)
+        except Exception as e:
+            logger.error(f"Failed to write {len(rows)} usage records, retrying later: {e}")
+            with self.lock:
+                self.pending[:0] = rows
+
+    def spent(self, username, day=None):
+        """Usage billed to the user on `day` (default today), per service in BUDGET_UNITS."""
+        day = day or today()
+        if day == today():
+            with self.lock:
+                return dict(self._spent_today(username, day))
+        self.flush()
+        spent = dict.fromkeys(SERVICES, 0)
+        for service, calls, tokens in self.db.fetchall(SQL_SPENT, (username, day)):
+            spent[service] = tokens if BUDGET_UNITS.get(service) == 'tokens' else calls
+        return spent
+
+    def remaining(self, username):
+        """service -> what is left of today's budget, or None if unlimited."""
+        spent = self.spent(username)
+        return {service: max(0, self.budgets[service] - spent[service]) if self.budgets.get(service) else None
+                for service in SERVICES}
+
+    def allowed(self, username, service):
+        budget = self.budgets.get(service)
+        return not budget or self.spent(username)[service] < budget
+
+    def exhausted(self, username, services=SERVICES):
+        """The services among `services` whose budget the user has used up today."""
+        return [service for service, left in self.remaining(username).items()
+                if service in services and left == 0]
+
+    def for_query(self, username, query):
+        return QueryUsage(self, username, query)
+
+    def report(self, by=('username', 'service'), days=1):
+        """
+        Usage totals grouped by `by` (columns of api_usage) over the last `days` days.
+
+        Returns:
+            list[dict]: One row per group, most calls first.
+        """
+        self.flush()
+        since = today(time.time() - (days - 1) * 86400)
+        rows = self.db.fetchall(SQL_REPORT.format(group=", ".join(by)), (since,))
+        return [dict(zip(by + REPORT_COLUMNS, row)) for row in rows]
+
+    def budget_report(self):
+        """Today's spend against budget for every user who made calls today."""
+        rows = []
+        for user in {row['username'] for row in self.report(by=('username',))}:
+            spent = self.spent(user)
+            for service in SERVICES:
+                budget = self.budgets.get(service) or None
+                rows.append({'username': user, 'service': service, 'spent': spent[service],
+                             'budget': budget, 'unit': BUDGET_UNITS[service],
+                             'used': round(spent[service] / budget, 3) if budget else None})
+        return sorted(rows, key=lambda row: (row['username'] or '', row['service']))
+
+
+class QueryUsage:
+    """A UsageLedger bound to one user's query; passed down with the query's deadline."""
+    def __init__(self, ledger, username, query):
+        self.ledger = ledger
+        self.username = username
+        self.query = query
+
+    def allowed(self, service):
+        return self.ledger.allowed(self.username, service)
+
+    def record(self, service, endpoint, key, **kwargs):
+        self.ledger.record(self.username, self.query, service, endpoint, key, **kwargs)
+
+    def ik_call(self, url, status, nbytes, seconds, shared):
+        """IKClient `observe` callback."""
+        endpoint = url.strip('/').split('/', 1)[0]
+        self.record('ik', endpoint, call_key('ik', url), request_bytes=len(url), response_bytes=nbytes,
+                    seconds=seconds, ok=status == 200, shared=shared)